@@ -0,0 +1,173 @@
+import asyncio
+import discord
+from gambling import odds
+
+DEFAULT_DEBOUNCE = 10   # Seconds to collect changes before editing the board
+MAX_FIELDS = 25         # Discord limit per embed
+MAX_CHARS = 5500        # Stay under Discord's 6000 characters per message
+
+class OddsBoard:
+    """
+    In-memory state of every open line, per guild, rendered into pinned board messages.
+
+    Commands report changes as they happen (new line, new odds, wager, lock, settlement)
+    and the board is re-rendered at most once per debounce window, only if the rendered
+    embeds actually changed. Lines are keyed by their message ID.
+
+    With several replicas each one only sees its own commands, so only the replica that
+    `can_publish` (the leader) edits the board messages. Every change is also reported to
+    `on_change`, which lets the leader know which guilds other replicas touched so it only
+    re-reads those with `sync_guild`. `sync` rebuilds everything when a replica becomes leader.
+    """
+    def __init__(self, publish, delay=DEFAULT_DEBOUNCE, can_publish=None, on_change=None):
+        self.publish = publish  # async callback(guild_id, list of embeds)
+        self.delay = delay
+        self.can_publish = can_publish or (lambda: True)
+        self.on_change = on_change or (lambda guild_id: None)
+        self.lines = {}         # guild_id -> {message_id -> line}
+        self.pending = {}       # guild_id -> scheduled render task
+        self.rendered = {}      # guild_id -> embeds last published
+
+    def load(self, bets):
+        """Fill the board from bet documents at startup"""
+        for bet in bets:
+            self.lines.setdefault(bet["guild_id"], {})[bet["message_id"]] = self._line(bet)
+
+    async def sync(self, bets):
+        """Replace every line with the bet documents from the database and publish what changed"""
+        lines = {}
+        for bet in bets:
+            lines.setdefault(bet["guild_id"], {})[bet["message_id"]] = self._line(bet)
+        guild_ids = set(self.lines) | set(lines)
+        self.lines = lines
+        for guild_id in guild_ids:
+            await self._publish(guild_id)
+
+    async def sync_guild(self, guild_id, bets):
+        """Replace one guild's lines with its bet documents from the database and publish if it changed"""
+        self.lines[guild_id] = {bet["message_id"]: self._line(bet) for bet in bets}
+        await self._publish(guild_id)
+
+    def _line(self, bet):
+        return {
+            "_id": bet["_id"],
+            "id": bet["id"],
+            "title": bet["title"],
+            "outcomes": bet["outcomes"],
+            "locks": bet.get("locks"),
+            "locked": bet.get("locked", False),
+            "handle": dict(bet.get("handle", {})),
+            "version": bet.get("version", 0)
+        }
+
+    def add(self, bet):
+        self.on_change(bet["guild_id"])
+        self.lines.setdefault(bet["guild_id"], {})[bet["message_id"]] = self._line(bet)
+        self._changed(bet["guild_id"])
+
+    def update(self, guild_id, message_id, **fields):
+        self.on_change(guild_id)
+        line = self.lines.get(guild_id, {}).get(message_id)
+        if line is None:
+            return
+        line.update(fields)
+        if "outcomes" in fields and "version" not in fields:
+            line["version"] += 1
+        self._changed(guild_id)
+
+    def find(self, guild_id, bet_id):
+        """Returns: (message_id, line) of an open line by its bet ID, or (None, None)"""
+        for message_id, line in self.lines.get(guild_id, {}).items():
+            if line["id"] == bet_id:
+                return message_id, line
+        return None, None
+
+    def add_handle(self, guild_id, message_id, outcome_index, amount):
+        self.on_change(guild_id)
+        line = self.lines.get(guild_id, {}).get(message_id)
+        if line is None:
+            return
+        key = str(outcome_index)
+        line["handle"][key] = line["handle"].get(key, 0) + amount
+        self._changed(guild_id)
+
+    def remove(self, guild_id, message_id):
+        self.on_change(guild_id)
+        if self.lines.get(guild_id, {}).pop(message_id, None) is not None:
+            self._changed(guild_id)
+
+    def _changed(self, guild_id):
+        if guild_id not in self.pending:
+            self.pending[guild_id] = asyncio.create_task(self._render_later(guild_id))
+
+    def refresh(self, guild_id):
+        """Force the next render to be published, e.g. after the board messages were deleted"""
+        self.on_change(guild_id)
+        self.rendered.pop(guild_id, None)
+        self._changed(guild_id)
+
+    async def _render_later(self, guild_id):
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            if self.pending.get(guild_id) is asyncio.current_task():
+                del self.pending[guild_id]
+        await self._publish(guild_id)
+
+    async def _publish(self, guild_id):
+        if not self.can_publish():
+            return
+        embeds = self.render(guild_id)
+        if [embed.to_dict() for embed in embeds] == self.rendered.get(guild_id):
+            return
+        try:
+            await self.publish(guild_id, embeds)
+            self.rendered[guild_id] = [embed.to_dict() for embed in embeds]
+        except Exception as e:
+            print(f"Failed to update odds board for {guild_id}: {e}")
+
+    def render(self, guild_id):
+        """Build the board embeds, starting a new embed whenever one gets full"""
+        lines = sorted(self.lines.get(guild_id, {}).values(), key=lambda line: line["id"])
+        embeds = [self._new_embed(len(lines))]
+        size = 0
+        for line in lines:
+            name, value = self._field(line)
+            if len(embeds[-1].fields) >= MAX_FIELDS or size + len(name) + len(value) > MAX_CHARS:
+                embeds.append(self._new_embed(len(lines)))
+                size = 0
+            embeds[-1].add_field(name=name, value=value, inline=False)
+            size += len(name) + len(value)
+
+        if not lines:
+            embeds[0].description = "No open betting lines right now"
+        return embeds
+
+    def _new_embed(self, count):
+        embed = discord.Embed(
+            title="📋 Odds Board",
+            description=f"{count} open betting line(s), use /bet <bet id> <outcome #> <amount>",
+            color=0x03c2fc
+        )
+        embed.set_thumbnail(url="https://tikolu.net/i/tcicn.png")
+        return embed
+
+    def _field(self, line):
+        betting_data = odds(line["outcomes"])
+        handle = line["handle"]
+        outcomes = "\n".join(
+            f"{i}. {outcome}: **{info['moneyline']}** (₾{handle.get(str(i - 1), 0):,.0f})"
+            for i, (outcome, info) in enumerate(betting_data.items(), start=1)
+        )
+        if line["locked"]:
+            status = "🔒 Locked, pending results"
+        elif line["locks"] is not None:
+            # Discord renders the countdown itself, so it never goes stale
+            status = f"⏰ Locks <t:{int(line['locks'].timestamp())}:R>"
+        else:
+            status = "❗No set lock time"
+        total = sum(handle.values())
+        return (
+            f"#{line['id']} - {line['title']}",
+            f"{outcomes}\n{status} | Handle: ₾{total:,.0f}"
+        )
@@ -0,0 +1,32 @@
+from gambling import odds
+
+DEFAULT_MARGIN = 0.1    # Share of a wager's fair value the house keeps on a cash out
+QUOTE_SECONDS = 30      # How long a quote can be accepted
+
+class FairValues:
+    """
+    Fair (margin-free) probability of every outcome of a line, computed once per line version.
+
+    Lines carry a version that goes up with every odds update, so a new version
+    invalidates the cached values, and with them every quote on the line, at once.
+    """
+    def __init__(self):
+        self.lines = {}     # line key -> (version, fair probability per outcome)
+
+    def get(self, key, version, outcomes):
+        cached = self.lines.get(key)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        # Posted probabilities include the house margin, so scale them back to 1
+        probabilities = [info["probability"] for info in odds(outcomes).values()]
+        total = sum(probabilities)
+        fair = [probability / total for probability in probabilities]
+        self.lines[key] = (version, fair)
+        return fair
+
+    def forget(self, key):
+        self.lines.pop(key, None)
+
+def quote(wager, fair, margin=DEFAULT_MARGIN):
+    """What the house pays now for a wager: its payout times the chance it wins, less the margin"""
+    return round(wager["payout"] * fair[wager["outcome_num"] - 1] * (1 - margin), 2)
@@ -0,0 +1,118 @@
+import io
+from collections import OrderedDict
+from datetime import datetime, timedelta
+import stats
+
+# Chart ranges in days (None is all time)
+RANGES = {"7d": 7, "30d": 30, "90d": 90, "all": None}
+DEFAULT_WORKERS = 1
+CACHE_SIZE = 64     # Rendered PNGs kept in memory
+
+def warm_up():
+    """Process pool initializer, so the first chart doesn't pay for importing matplotlib"""
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot
+
+def series(snapshots_collection, daily_stats_collection, guild_id, user_id, balance, period, now=None):
+    """
+    Daily points for a user's chart, read from pre-aggregated data only:
+    balances from the ledger snapshots (last one of each day) and profit from the daily stat buckets.
+
+    balance: the user's current balance, used as the last point
+    Returns: (balance points, profit points), each a list of (day, value)
+    """
+    now = now or datetime.now()
+    days = RANGES[period]
+    since = None if days is None else stats.day_of(now) - timedelta(days=days - 1)
+
+    window = {"guild_id": guild_id, "user_id": user_id}
+    if since is not None:
+        window["at"] = {"$gte": since}
+    balances = {}
+    for snapshot in snapshots_collection.find(window, {"balance": 1, "at": 1}).sort("at", 1):
+        balances[stats.day_of(snapshot["at"])] = snapshot["balance"]
+
+    # Carry the balance from before the window so the line starts on the first day
+    if since is not None and since not in balances:
+        before = snapshots_collection.find_one(
+            {"guild_id": guild_id, "user_id": user_id, "at": {"$lt": since}},
+            {"balance": 1},
+            sort=[("at", -1)]
+        )
+        if before:
+            balances[since] = before["balance"]
+    balances[stats.day_of(now)] = balance
+
+    buckets = {"guild_id": guild_id, "user_id": user_id}
+    if since is not None:
+        buckets["day"] = {"$gte": since}
+    profits = [
+        (bucket["day"], bucket["profit"])
+        for bucket in daily_stats_collection.find(buckets, {"day": 1, "profit": 1}).sort("day", 1)
+    ]
+    return sorted(balances.items()), profits
+
+def render(title, balances, profits, currency):
+    """
+    Draw balance and cumulative profit as a PNG. Runs in a worker process,
+    so it only takes and returns plain data.
+    """
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    import matplotlib.dates as mdates
+
+    figure, (balance_axis, profit_axis) = plt.subplots(2, 1, figsize=(8, 6), sharex=True)
+    figure.suptitle(title)
+
+    if balances:
+        days, values = zip(*balances)
+        balance_axis.step(days, values, where="post", color="#fa99e7", linewidth=2)
+    balance_axis.set_ylabel(f"Balance ({currency})")
+    balance_axis.grid(alpha=0.3)
+
+    if profits:
+        days, values = zip(*profits)
+        running = 0
+        cumulative = []
+        for value in values:
+            running += value
+            cumulative.append(running)
+        profit_axis.bar(days, values, color=["#2ecc71" if value >= 0 else "#e74c3c" for value in values], alpha=0.6, label="Daily")
+        profit_axis.plot(days, cumulative, color="#03c2fc", linewidth=2, label="Cumulative")
+        profit_axis.legend(loc="upper left")
+    profit_axis.axhline(0, color="grey", linewidth=0.8)
+    profit_axis.set_ylabel(f"Betting profit ({currency})")
+    profit_axis.grid(alpha=0.3)
+    profit_axis.xaxis.set_major_formatter(mdates.DateFormatter("%m/%d"))
+    figure.autofmt_xdate()
+
+    image = io.BytesIO()
+    figure.savefig(image, format="png", dpi=100)
+    plt.close(figure)
+    return image.getvalue()
+
+class ChartCache:
+    """
+    Small LRU of rendered charts keyed by (guild, user, period, data version).
+    The version changes whenever the underlying points do, so stale charts are never served.
+    """
+    def __init__(self, size=CACHE_SIZE):
+        self.size = size
+        self.charts = OrderedDict()
+
+    def get(self, key):
+        chart = self.charts.get(key)
+        if chart is not None:
+            self.charts.move_to_end(key)
+        return chart
+
+    def put(self, key, chart):
+        self.charts[key] = chart
+        self.charts.move_to_end(key)
+        while len(self.charts) > self.size:
+            self.charts.popitem(last=False)
+
+def version(balances, profits):
+    return hash((tuple(balances), tuple(profits)))
@@ -0,0 +1,192 @@
+"""
+Stream users, betting lines and wagers out of Mongo for offline analysis.
+
+Usage: python export.py <dataset ...> [--format csv|jsonl|parquet] [--out exports] [--full]
+
+Datasets: users, bets, wagers (open), history (settled)
+Wagers and history are incremental: each run only exports rows placed/resolved since the
+checkpoint saved by the previous run. Users and bets are small and always exported in full.
+Parquet needs pyarrow (pip install pyarrow).
+"""
+import argparse
+import csv
+import json
+import os
+from datetime import datetime, timedelta
+from dotenv import load_dotenv
+from pymongo.mongo_client import MongoClient
+
+BATCH_SIZE = 1000   # Documents per cursor batch, and rows per Parquet row group
+LAG_SECONDS = 300   # Settlement jobs write rows a little after their timestamp, leave them for the next run
+
+# Columns and their types for every dataset
+FIELDS = {
+    "users": {"guild_id": "int", "user_id": "int", "balance": "float", "last_daily": "datetime", "open_bets": "int", "settled_bets": "int"},
+    "bets": {
+        "guild_id": "int", "id": "int", "title": "str", "outcomes": "str", "locks": "datetime",
+        "locked": "bool", "auto_price": "bool", "participants": "int", "handle": "float"
+    },
+    "wagers": {
+        "guild_id": "int", "user_id": "int", "bet_id": "int", "outcome_num": "int", "outcome": "str",
+        "amount": "float", "payout": "float", "placed_at": "datetime"
+    },
+    "history": {
+        "guild_id": "int", "user_id": "int", "bet_id": "int", "bet": "str", "prediction": "str",
+        "result": "str", "wagered": "float", "amount_won": "float", "resolved_at": "datetime"
+    },
+}
+
+# Embedded arrays exported as rows, and the timestamp their checkpoints follow
+INCREMENTAL = {"wagers": ("bets", "placed_at"), "history": ("history", "resolved_at")}
+
+def _size(field):
+    return {"$size": {"$ifNull": [field, []]}}
+
+def pipeline(dataset, since=None, until=None):
+    """Aggregation that returns the dataset's rows, already flat and projected"""
+    if dataset == "users":
+        return [{"$project": {
+            "_id": 0, "guild_id": 1, "user_id": 1, "balance": 1, "last_daily": 1,
+            "open_bets": _size("$bets"), "settled_bets": _size("$history")
+        }}]
+    if dataset == "bets":
+        return [{"$project": {
+            "_id": 0, "guild_id": 1, "id": 1, "title": 1, "outcomes": 1, "locks": 1, "locked": 1, "auto_price": 1,
+            "participants": _size("$participants"),
+            "handle": {"$sum": {"$map": {"input": {"$objectToArray": {"$ifNull": ["$handle", {}]}}, "in": "$$this.v"}}}
+        }}]
+
+    array, timestamp = INCREMENTAL[dataset]
+    window = {"$lte": until}
+    if since is not None:
+        window["$gt"] = since
+    return [
+        # Skip users with nothing new before unwinding anything
+        {"$match": {f"{array}.{timestamp}": window}},
+        {"$project": {"_id": 0, "guild_id": 1, "user_id": 1, array: 1}},
+        {"$unwind": f"${array}"},
+        {"$match": {f"{array}.{timestamp}": window}},
+        {"$replaceRoot": {"newRoot": {"$mergeObjects": [f"${array}", {"guild_id": "$guild_id", "user_id": "$user_id"}]}}}
+    ]
+
+def rows(collection, dataset, since=None, until=None):
+    """Stream rows with only the dataset's columns"""
+    fields = FIELDS[dataset]
+    cursor = collection.aggregate(pipeline(dataset, since, until), allowDiskUse=True, batchSize=BATCH_SIZE)
+    for document in cursor:
+        yield {field: document.get(field) for field in fields}
+
+class CsvWriter:
+    def __init__(self, path, dataset):
+        self.file = open(path, "w", newline="", encoding="utf-8")
+        self.writer = csv.DictWriter(self.file, fieldnames=list(FIELDS[dataset]))
+        self.writer.writeheader()
+
+    def write(self, row):
+        self.writer.writerow({
+            field: value.isoformat() if isinstance(value, datetime) else value
+            for field, value in row.items()
+        })
+
+    def close(self):
+        self.file.close()
+
+class JsonlWriter:
+    def __init__(self, path, dataset):
+        self.file = open(path, "w", encoding="utf-8")
+
+    def write(self, row):
+        self.file.write(json.dumps(row, default=lambda value: value.isoformat(), ensure_ascii=False) + "\n")
+
+    def close(self):
+        self.file.close()
+
+class ParquetWriter:
+    """Buffers BATCH_SIZE rows at a time and writes each batch as a row group"""
+    def __init__(self, path, dataset):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise SystemExit("Parquet export needs pyarrow: pip install pyarrow")
+        self.pyarrow = pyarrow
+        types = {"int": pyarrow.int64(), "float": pyarrow.float64(), "str": pyarrow.string(), "bool": pyarrow.bool_(), "datetime": pyarrow.timestamp("us")}
+        self.schema = pyarrow.schema([(field, types[type]) for field, type in FIELDS[dataset].items()])
+        self.writer = pyarrow.parquet.ParquetWriter(path, self.schema)
+        self.buffer = []
+
+    def write(self, row):
+        self.buffer.append(row)
+        if len(self.buffer) >= BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            self.writer.write_table(self.pyarrow.Table.from_pylist(self.buffer, schema=self.schema))
+            self.buffer = []
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+
+WRITERS = {"csv": CsvWriter, "jsonl": JsonlWriter, "parquet": ParquetWriter}
+
+def load_checkpoint(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as file:
+        return {dataset: datetime.fromisoformat(at) for dataset, at in json.load(file).items()}
+
+def save_checkpoint(path, checkpoint):
+    # Write then rename, so a crash never leaves a half-written checkpoint
+    with open(path + ".tmp", "w") as file:
+        json.dump({dataset: at.isoformat() for dataset, at in checkpoint.items()}, file, indent=2)
+    os.replace(path + ".tmp", path)
+
+def export(users_collection, bets_collection, dataset, format, out, checkpoint, now):
+    """
+    Export one dataset into a new file in `out`.
+    Returns: (path, number of rows)
+    """
+    until = now - timedelta(seconds=LAG_SECONDS)
+    since = checkpoint.get(dataset)
+    collection = bets_collection if dataset == "bets" else users_collection
+    path = os.path.join(out, f"{dataset}-{now.strftime('%Y%m%d-%H%M%S')}.{format}")
+
+    writer = WRITERS[format](path, dataset)
+    count = 0
+    try:
+        for row in rows(collection, dataset, since, until):
+            writer.write(row)
+            count += 1
+    finally:
+        writer.close()
+
+    if dataset in INCREMENTAL:
+        checkpoint[dataset] = until
+    return path, count
+
+def main():
+    parser = argparse.ArgumentParser(description="Export betting data for offline analysis")
+    parser.add_argument("datasets", nargs="+", choices=list(FIELDS))
+    parser.add_argument("--format", choices=list(WRITERS), default="csv")
+    parser.add_argument("--out", default="exports", help="Directory for the exported files")
+    parser.add_argument("--checkpoint", help="Checkpoint file (default: <out>/checkpoint.json)")
+    parser.add_argument("--full", action="store_true", help="Ignore the checkpoint and export everything")
+    args = parser.parse_args()
+
+    load_dotenv()
+    db = MongoClient(os.getenv('uri'))[os.getenv('MONGO_DB', 'usereconomy')]
+    os.makedirs(args.out, exist_ok=True)
+    checkpoint_path = args.checkpoint or os.path.join(args.out, "checkpoint.json")
+    checkpoint = {} if args.full else load_checkpoint(checkpoint_path)
+
+    now = datetime.now()
+    for dataset in args.datasets:
+        path, count = export(db.users, db.bets, dataset, args.format, args.out, checkpoint, now)
+        # Saved after every dataset, so a failed run only repeats what didn't finish
+        save_checkpoint(checkpoint_path, checkpoint)
+        print(f"Exported {count} {dataset} rows to {path}")
+
+if __name__ == "__main__":
+    main()
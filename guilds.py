@@ -0,0 +1,56 @@
+import hashlib
+import json
+import time
+
+CONFIG_TTL = 60  # Seconds before a cached config is read again, so /setup on another replica shows up
+
+class GuildConfigs:
+    """
+    Per-guild settings (betting and proposals channels, ...) stored in the database.
+    Every command checks them, so they are cached in memory for `ttl` seconds after each read.
+    """
+    def __init__(self, guilds_collection, ttl=CONFIG_TTL):
+        self.collection = guilds_collection
+        self.ttl = ttl
+        self.cache = {}
+        self.loaded = {}    # guild_id -> monotonic time the config was read
+
+    def load(self):
+        now = time.monotonic()
+        for config in self.collection.find():
+            self.cache[config["_id"]] = config
+            self.loaded[config["_id"]] = now
+
+    def get(self, guild_id):
+        config = self.cache.get(guild_id)
+        if config is None or time.monotonic() - self.loaded[guild_id] > self.ttl:
+            config = self.collection.find_one({"_id": guild_id}) or {"_id": guild_id}
+            self.cache[guild_id] = config
+            self.loaded[guild_id] = time.monotonic()
+        return config
+
+    def forget(self, guild_id):
+        """Read the guild's settings from the database again next time"""
+        self.cache.pop(guild_id, None)
+        self.loaded.pop(guild_id, None)
+
+    def update(self, guild_id, **fields):
+        self.collection.update_one({"_id": guild_id}, {"$set": fields}, upsert=True)
+        self.get(guild_id).update(fields)
+
+def commands_hash(tree):
+    """Fingerprint of the command tree, so guilds are only re-synced when commands change"""
+    payload = [command.to_dict(tree) for command in tree.get_commands()]
+    return hashlib.sha1(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+def migrate_legacy(db, guild_id):
+    """
+    Tag documents from before multi-guild support with the guild they belong to.
+    Users keep their old _id (the Discord user ID) and get it copied to user_id.
+    """
+    db.users.update_many(
+        {"guild_id": {"$exists": False}},
+        [{"$set": {"guild_id": guild_id, "user_id": "$_id"}}]
+    )
+    for name in ["bets", "parlays", "ledger", "snapshots"]:
+        db[name].update_many({"guild_id": {"$exists": False}}, {"$set": {"guild_id": guild_id}})
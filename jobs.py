@@ -0,0 +1,172 @@
+import asyncio
+import os
+import socket
+import traceback
+import uuid
+from datetime import datetime, timedelta
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+DEFAULT_CONCURRENCY = 2
+POLL_INTERVAL = 5       # Seconds between checks for queued or abandoned jobs
+LEASE_SECONDS = 60      # A running job whose lease runs out is picked up again
+MAX_ATTEMPTS = 3
+
+class LostLease(Exception):
+    """Raised when another worker has taken over a job we were running"""
+
+class JobQueue:
+    """
+    Mongo-backed queue for admin work that should survive a restart.
+
+    Jobs have a deterministic _id (e.g. "resolve-12") so queueing the same work twice
+    returns the existing job. Handlers save their progress with `checkpoint` after every
+    batch; if the bot dies, the job's lease runs out and the next worker resumes it
+    from the last checkpoint.
+    """
+    def __init__(self, jobs_collection, concurrency=DEFAULT_CONCURRENCY, poll_interval=POLL_INTERVAL, lease=LEASE_SECONDS, can_claim=None):
+        self.jobs = jobs_collection
+        self.can_claim = can_claim or (lambda: True)  # e.g. only claim jobs on the leader replica
+        self.poll_interval = poll_interval
+        self.lease = lease
+        self.handlers = {}
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.slots = asyncio.Semaphore(concurrency)
+        self.wakeup = asyncio.Event()
+        self.running = set()
+
+    def ensure_indexes(self):
+        self.jobs.create_index([("status", 1), ("created_at", 1)])
+
+    def handler(self, type):
+        """Decorator registering the coroutine that runs jobs of `type`"""
+        def register(func):
+            self.handlers[type] = func
+            return func
+        return register
+
+    @staticmethod
+    def job_id(type, key):
+        return f"{type}-{key}"
+
+    def enqueue(self, type, key, params):
+        """
+        Queue a job, or return the existing one with the same type and key.
+        Returns: (job document, True if it was newly created)
+        """
+        job_id = self.job_id(type, key)
+        now = datetime.now()
+        try:
+            job = {
+                "_id": job_id,
+                "type": type,
+                "params": params,
+                "status": "queued",
+                "progress": {},
+                "attempts": 0,
+                "created_at": now,
+                "updated_at": now
+            }
+            self.jobs.insert_one(job)
+        except DuplicateKeyError:
+            return self.jobs.find_one({"_id": job_id}), False
+        self.wakeup.set()
+        return job, True
+
+    def get(self, job_id):
+        return self.jobs.find_one({"_id": job_id})
+
+    def retry(self, job_id):
+        """
+        Queue a failed job again, resuming from its last checkpoint.
+        Returns: True if the job had failed and is queued again
+        """
+        result = self.jobs.update_one(
+            {"_id": job_id, "status": "failed"},
+            {"$set": {"status": "queued", "attempts": 0, "updated_at": datetime.now()}, "$unset": {"error": "", "owner": ""}}
+        )
+        if result.modified_count == 0:
+            return False
+        self.wakeup.set()
+        return True
+
+    def checkpoint(self, job, progress):
+        """Save a job's progress and renew its lease. Raises LostLease if another worker owns it now."""
+        now = datetime.now()
+        result = self.jobs.update_one(
+            {"_id": job["_id"], "owner": job["owner"], "status": "running"},
+            {"$set": {"progress": progress, "updated_at": now, "lease_until": now + timedelta(seconds=self.lease)}}
+        )
+        if result.matched_count == 0:
+            raise LostLease(job["_id"])
+        job["progress"] = progress
+
+    def _claim(self):
+        """
+        Atomically take the oldest queued job, or a running one whose worker stopped renewing it.
+        Every claim gets its own owner token, so a task in this process still holding an expired
+        claim gets LostLease once the job is claimed again, even by this same worker.
+        """
+        now = datetime.now()
+        owner = f"{self.worker_id}:{uuid.uuid4().hex}"
+        return self.jobs.find_one_and_update(
+            {"$or": [
+                {"status": "queued"},
+                {"status": "running", "lease_until": {"$lt": now}}
+            ]},
+            {
+                "$set": {"status": "running", "owner": owner, "lease_until": now + timedelta(seconds=self.lease), "updated_at": now},
+                "$inc": {"attempts": 1}
+            },
+            sort=[("created_at", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    def _finish(self, job, status, **fields):
+        self.jobs.update_one(
+            {"_id": job["_id"], "owner": job["owner"]},
+            {"$set": {"status": status, "updated_at": datetime.now(), **fields}, "$unset": {"lease_until": ""}}
+        )
+
+    async def _execute(self, job):
+        try:
+            await self.handlers[job["type"]](self, job)
+            await asyncio.to_thread(self._finish, job, "done")
+        except LostLease:
+            print(f"Job {job['_id']} was taken over by another worker")
+        except Exception as e:
+            traceback.print_exc()
+            # Give it another go from the last checkpoint unless it keeps failing
+            status = "failed" if job["attempts"] >= MAX_ATTEMPTS else "queued"
+            await asyncio.to_thread(self._finish, job, status, error=str(e))
+        finally:
+            self.slots.release()
+
+    async def run(self):
+        """Worker loop: runs up to `concurrency` jobs at once"""
+        while True:
+            await self.slots.acquire()
+            self.wakeup.clear()
+            job = None
+            if self.can_claim():
+                try:
+                    job = await asyncio.to_thread(self._claim)
+                except Exception as e:
+                    print(f"Failed to claim job: {e}")
+
+            if job is None:
+                self.slots.release()
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            if job["type"] not in self.handlers:
+                await asyncio.to_thread(self._finish, job, "failed", error=f"No handler for job type {job['type']}")
+                self.slots.release()
+                continue
+
+            task = asyncio.create_task(self._execute(job))
+            self.running.add(task)
+            task.add_done_callback(self.running.discard)
@@ -0,0 +1,86 @@
+import asyncio
+import os
+import socket
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+LEASE_SECONDS = 6       # A replica that stops renewing loses leadership after this long
+HEARTBEAT_SECONDS = 2   # How often the leader renews (and followers try to take over)
+
+class LeaderLease:
+    """
+    Leader election with a lease document in Mongo, so that only one replica
+    runs singleton background work (locking lines, settlement jobs, snapshots...).
+
+    Every replica tries to take the lease on each heartbeat. It succeeds if it
+    already holds the lease or the lease has expired, so if the leader dies a
+    follower takes over within LEASE_SECONDS + HEARTBEAT_SECONDS.
+    """
+    def __init__(self, leases_collection, name="scheduler", lease=LEASE_SECONDS, heartbeat=HEARTBEAT_SECONDS):
+        self.leases = leases_collection
+        self.name = name
+        self.lease = lease
+        self.heartbeat = heartbeat
+        self.holder = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.valid_until = 0  # time.monotonic() until which our last renewal is good
+        self.callbacks = []   # coroutine functions to run every time we become the leader
+        self.tasks = set()
+
+    def ensure_indexes(self):
+        # Lets Mongo clean up leases of replicas that are gone for good
+        self.leases.create_index("expires_at", expireAfterSeconds=0)
+
+    @property
+    def is_leader(self):
+        # Step down on our own clock if renewals stop working, before anyone else can take over
+        return time.monotonic() < self.valid_until
+
+    def try_acquire(self):
+        """Take or renew the lease. Returns True if we hold it."""
+        started = time.monotonic()
+        now = datetime.now(timezone.utc)
+        try:
+            self.leases.find_one_and_update(
+                {"_id": self.name, "$or": [{"holder": self.holder}, {"expires_at": {"$lt": now}}]},
+                {"$set": {"holder": self.holder, "expires_at": now + timedelta(seconds=self.lease), "renewed_at": now}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            # Someone else holds a lease that hasn't expired
+            self.valid_until = 0
+            return False
+        # Keep a heartbeat of slack so we stop before the lease actually expires
+        self.valid_until = started + self.lease - self.heartbeat
+        return True
+
+    def on_elected(self, callback):
+        """Run `callback()` (a coroutine function) every time this replica becomes the leader"""
+        self.callbacks.append(callback)
+        return callback
+
+    def release(self):
+        self.valid_until = 0
+        self.leases.delete_one({"_id": self.name, "holder": self.holder})
+
+    async def run(self):
+        """Heartbeat loop, run as a background task on every replica"""
+        was_leader = False
+        while True:
+            try:
+                await asyncio.to_thread(self.try_acquire)
+            except PyMongoError as e:
+                print(f"Failed to renew leader lease: {e}")
+
+            if self.is_leader != was_leader:
+                was_leader = self.is_leader
+                print(f"{self.holder} is {'now the leader' if was_leader else 'no longer the leader'}")
+                if was_leader:
+                    for callback in self.callbacks:
+                        task = asyncio.create_task(callback())
+                        self.tasks.add(task)
+                        task.add_done_callback(self.tasks.discard)
+            await asyncio.sleep(self.heartbeat)
@@ -0,0 +1,175 @@
+from datetime import datetime, timedelta
+from pymongo.errors import BulkWriteError
+
+# Entries whose amounts differ by less than this are considered equal (payouts are floats)
+TOLERANCE = 0.01
+# Entries are stamped by whichever replica writes them, and can land in the database after a
+# snapshot round has passed their time. Rounds only cover entries older than this, so late or
+# clock-skewed entries are still inside the next window instead of behind the last one.
+SNAPSHOT_LAG_SECONDS = 300
+
+def ensure_indexes(ledger_collection, snapshots_collection):
+    ledger_collection.create_index([("guild_id", 1), ("user_id", 1), ("at", 1)])
+    # Idempotency keys for entries written by resumable jobs
+    ledger_collection.create_index("key", unique=True, partialFilterExpression={"key": {"$exists": True}})
+    snapshots_collection.create_index([("guild_id", 1), ("user_id", 1), ("at", -1)])
+
+def entry(guild_id, user_id, type, amount, bet_id=None, **extra):
+    """
+    Build a ledger entry for a single balance change.
+
+    type: what caused the change, e.g. "daily", "give", "wager", "payout", "refund"
+    amount: signed change to the balance
+    bet_id: the betting line the change belongs to, if any
+    """
+    return {
+        "guild_id": guild_id,
+        "user_id": user_id,
+        "type": type,
+        "amount": amount,
+        "bet_id": bet_id,
+        "at": datetime.now(),
+        **extra
+    }
+
+def opening_key(guild_id, user_id):
+    """Idempotency key of a user's first entry, whether written on signup or by backfill"""
+    return f"opening:{guild_id}:{user_id}"
+
+def record(ledger_collection, guild_id, user_id, type, amount, bet_id=None, **extra):
+    """Append one entry to the ledger. Entries are never updated or deleted."""
+    ledger_collection.insert_one(entry(guild_id, user_id, type, amount, bet_id, **extra))
+
+def record_many(ledger_collection, entries):
+    if entries:
+        ledger_collection.insert_many(entries, ordered=False)
+
+def record_once(ledger_collection, entries):
+    """
+    Insert entries that carry a unique "key", skipping any that were already written.
+    Used by settlement jobs that may run the same batch again after a restart.
+    """
+    if not entries:
+        return
+    try:
+        ledger_collection.insert_many(entries, ordered=False)
+    except BulkWriteError as e:
+        if any(error["code"] != 11000 for error in e.details["writeErrors"]):
+            raise
+
+def balance_at(ledger_collection, snapshots_collection, guild_id, user_id, at=None):
+    """
+    Rebuild a user's balance at a point in time (now if `at` is None).
+
+    Starts from the latest snapshot taken at or before `at` and only sums the entries
+    written after it, so the cost is O(entries since snapshot).
+    """
+    at = at or datetime.now()
+    snapshot = snapshots_collection.find_one(
+        {"guild_id": guild_id, "user_id": user_id, "at": {"$lte": at}},
+        sort=[("at", -1)]
+    )
+    since = {"$lte": at}
+    balance = 0
+    if snapshot:
+        since["$gt"] = snapshot["at"]
+        balance = snapshot["balance"]
+
+    delta = list(ledger_collection.aggregate([
+        {"$match": {"guild_id": guild_id, "user_id": user_id, "at": since}},
+        {"$group": {"_id": None, "total": {"$sum": "$amount"}}}
+    ]))
+    if delta:
+        balance += delta[0]["total"]
+    return balance
+
+def take_snapshots(ledger_collection, snapshots_collection, at=None, lag=SNAPSHOT_LAG_SECONDS):
+    """
+    Snapshot the balance of every user whose ledger changed since the last round.
+
+    Each snapshot is the user's previous snapshot plus the entries since then,
+    so it always agrees with the ledger. Rounds stop `lag` seconds before now.
+    Returns: number of snapshots written
+    """
+    at = at or datetime.now() - timedelta(seconds=lag)
+    last_round = snapshots_collection.find_one(sort=[("at", -1)])
+    window = {"$lte": at}
+    if last_round:
+        window["$gt"] = last_round["at"]
+
+    snapshots = []
+    for change in ledger_collection.aggregate([
+        {"$match": {"at": window}},
+        {"$group": {"_id": {"guild_id": "$guild_id", "user_id": "$user_id"}, "total": {"$sum": "$amount"}}}
+    ], allowDiskUse=True):
+        key = change["_id"]
+        previous = snapshots_collection.find_one(key, sort=[("at", -1)])
+        balance = (previous["balance"] if previous else 0) + change["total"]
+        snapshots.append({**key, "balance": balance, "at": at})
+
+    if snapshots:
+        snapshots_collection.insert_many(snapshots, ordered=False)
+    return len(snapshots)
+
+def _ledger_totals(ledger_collection, match):
+    """Stream ((guild_id, user_id), ledger total) pairs sorted by guild and user"""
+    for total in ledger_collection.aggregate([
+        {"$match": match},
+        {"$group": {"_id": {"guild_id": "$guild_id", "user_id": "$user_id"}, "total": {"$sum": "$amount"}}},
+        {"$sort": {"_id.guild_id": 1, "_id.user_id": 1}}
+    ], allowDiskUse=True):
+        yield (total["_id"]["guild_id"], total["_id"]["user_id"]), total["total"]
+
+def _balances(users_collection, match):
+    """Stream ((guild_id, user_id), balance) pairs sorted by guild and user"""
+    for user in users_collection.find(match, {"guild_id": 1, "user_id": 1, "balance": 1}).sort([("guild_id", 1), ("user_id", 1)]):
+        yield (user["guild_id"], user["user_id"]), user["balance"]
+
+def _merge(users_collection, ledger_collection, guild_id=None):
+    """
+    Walk users and ledger totals side by side, both sorted by guild and user ID.
+    Yields ((guild_id, user_id), balance or None, ledger total or None).
+    """
+    match = {} if guild_id is None else {"guild_id": guild_id}
+    users = _balances(users_collection, match)
+    totals = _ledger_totals(ledger_collection, match)
+    user = next(users, None)
+    total = next(totals, None)
+    while user is not None or total is not None:
+        if total is None or (user is not None and user[0] < total[0]):
+            yield user[0], user[1], None
+            user = next(users, None)
+        elif user is None or total[0] < user[0]:
+            yield total[0], None, total[1]
+            total = next(totals, None)
+        else:
+            yield user[0], user[1], total[1]
+            user = next(users, None)
+            total = next(totals, None)
+
+def backfill(users_collection, ledger_collection):
+    """
+    Give users that predate the ledger an "opening" entry for their current balance.
+
+    Opening entries share their key with the "initial" entry of new users, so a backfill
+    racing another run, or a user being created, can't give anyone a second one.
+    Returns: number of users that had no entries
+    """
+    entries = [
+        entry(guild_id, user_id, "opening", balance, key=opening_key(guild_id, user_id))
+        for (guild_id, user_id), balance, total in _merge(users_collection, ledger_collection)
+        if total is None and balance is not None
+    ]
+    record_once(ledger_collection, entries)
+    return len(entries)
+
+def verify(users_collection, ledger_collection, guild_id=None, tolerance=TOLERANCE):
+    """
+    Check every user's balance (in one guild, or all of them) against the sum of their ledger entries.
+    Returns: list of ((guild_id, user_id), balance, ledger total) that disagree
+    """
+    mismatches = []
+    for key, balance, total in _merge(users_collection, ledger_collection, guild_id):
+        if balance is None or total is None or abs(balance - total) > tolerance:
+            mismatches.append((key, balance, total))
+    return mismatches
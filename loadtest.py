@@ -0,0 +1,188 @@
+"""
+Per-guild latency load test: many guilds sending commands at once, one of them much busier.
+
+Usage: python loadtest.py [--guild-counts 1,10,100,1000] [--users 100] [--history 20] [--rate 50]
+                          [--seconds 60] [--hot-share 0.5] [--mongo mongodb://localhost:27017]
+                          [--db loadtest] [--out report.json] [--seed 1]
+
+For each guild count, the database is seeded with every guild's users (with a settled betting
+history, its ledger and daily stats) and two open lines, so the collections grow with the
+number of guilds like they do in production. A synthetic trace (users checking balances,
+claiming dailies, betting and looking at leaderboards and history) is then played through
+main.py's handlers with replay.py at the generated timing, against a local mongod. Each guild
+count runs in its own process, since main.py keeps its state at module level.
+
+The report gives p50/p95 per guild count, so latency growing with the number of guilds (and
+the size of the collections) shows up across the sweep, and a busy guild slowing down the
+quiet ones shows up as the quiet guilds' p95 climbing with --hot-share.
+"""
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import subprocess
+import sys
+from datetime import datetime, timedelta
+from replay import Replay, load_bot, percentile
+
+# Option types as Discord sends them
+STRING, INTEGER, USER, NUMBER = 3, 4, 6, 10
+LINES_PER_GUILD = 2
+
+def option(name, type, value):
+    return {"name": name, "type": type, "value": value}
+
+def record(at, command, guild, user, options=(), admin=False):
+    return {"at": at, "command": command, "guild": guild, "channel": "betting", "user": user, "admin": admin, "options": list(options)}
+
+def user_command(rng, at, guild, user):
+    """One command a regular user might send, weighted roughly like production traffic"""
+    kind = rng.choices(["bal", "daily", "bet", "leader", "history", "open"], weights=[30, 15, 25, 15, 10, 5])[0]
+    if kind == "bet":
+        return record(at, "bet", guild, user, [
+            option("bet_id", INTEGER, rng.randint(1, LINES_PER_GUILD)),
+            option("outcome", INTEGER, rng.randint(1, 2)),
+            option("amount", NUMBER, rng.randint(1, 20))
+        ])
+    return record(at, kind, guild, user)
+
+def guild_ids(guilds):
+    return [1000 + i for i in range(guilds)]
+
+def receipt(rng, bet_id, now):
+    """A settled wager from the past month, shaped like the ones settlement pushes to history"""
+    wagered = rng.randint(1, 50)
+    result = rng.choice(["win", "loss"])
+    return {
+        "bet_id": bet_id,
+        "bet": f"Old line {bet_id}",
+        "prediction": "yes",
+        "wagered": wagered,
+        "result": result,
+        "amount_won": round(wagered * 0.8, 2) if result == "win" else 0,
+        "resolved_at": now - timedelta(days=rng.uniform(0, 30))
+    }
+
+def seed_database(bot, guilds, users, history, seed):
+    """Users with `history` settled wagers each, their ledger and daily stats, and the open lines, for every guild"""
+    rng = random.Random(seed)
+    now = datetime.now()
+    for guild in guild_ids(guilds):
+        bot.users_collection.insert_many([{
+            "guild_id": guild,
+            "user_id": guild * 100000 + user,
+            "balance": rng.randint(0, 5000),
+            "last_daily": None,
+            "history": [receipt(rng, bet_id, now) for bet_id in range(LINES_PER_GUILD + 1, LINES_PER_GUILD + 1 + history)]
+        } for user in range(1, users + 1)])
+        bot.bets_collection.insert_many([{
+            "guild_id": guild,
+            "id": line + 1,
+            "title": f"Line {line + 1}",
+            "outcomes": "yes|0.55, no|0.5",
+            "locks": None,
+            "locked": False,
+            "message_id": guild * 100 + line,
+            "channel_id": guild * 100,
+            "restricted_users": [],
+            "participants": [],
+            "auto_price": False,
+            "base_outcomes": "yes|0.55, no|0.5",
+            "handle": {}
+        } for line in range(LINES_PER_GUILD)])
+    bot.ledger.backfill(bot.users_collection, bot.ledger_collection)
+    bot.stats.backfill(bot.users_collection, bot.daily_stats_collection)
+    return {name: bot.db[name].estimated_document_count() for name in ["users", "bets", "ledger", "daily_stats"]}
+
+def generate(guilds, users, rate, seconds, hot_share, seed):
+    """Commands for `guilds` guilds over `seconds`, `hot_share` of them from the first guild"""
+    rng = random.Random(seed)
+    ids = guild_ids(guilds)
+    commands = []
+    at = 0.0
+    while at < seconds:
+        at += rng.expovariate(rate)
+        guild = ids[0] if rng.random() < hot_share or guilds == 1 else rng.choice(ids[1:])
+        commands.append(user_command(rng, round(at, 3), guild, guild * 100000 + rng.randint(1, users)))
+    return commands, ids[0]
+
+def summary(latencies):
+    return {
+        "count": len(latencies),
+        "p50_ms": round(statistics.median(latencies), 2),
+        "p95_ms": round(percentile(latencies, 0.95), 2),
+        "max_ms": round(max(latencies), 2)
+    }
+
+def report(replay, hot_guild, elapsed, documents):
+    everything = [latency for latencies in replay.guild_latencies.values() for latency in latencies]
+    quiet = [latency for guild, latencies in replay.guild_latencies.items() if guild != hot_guild for latency in latencies]
+    per_guild = {guild: summary(latencies) for guild, latencies in replay.guild_latencies.items()}
+    quiet_p95 = [stats["p95_ms"] for guild, stats in per_guild.items() if guild != hot_guild]
+    return {
+        "elapsed_s": round(elapsed, 2),
+        "errors": dict(replay.errors),
+        "documents": documents,
+        "all_guilds": summary(everything),
+        "per_command": {name: summary(latencies) for name, latencies in sorted(replay.latencies.items())},
+        "hot_guild": summary(replay.guild_latencies[hot_guild]),
+        "quiet_guilds": summary(quiet) if quiet else None,
+        "quiet_guild_p95_spread_ms": {"min": min(quiet_p95), "median": round(statistics.median(quiet_p95), 2), "max": max(quiet_p95)} if quiet_p95 else None,
+        "per_guild": {str(guild): stats for guild, stats in sorted(per_guild.items())}
+    }
+
+def run(args, guilds):
+    """One point of the sweep, in this process"""
+    bot, counter = load_bot(args.mongo, args.db)
+    documents = seed_database(bot, guilds, args.users, args.history, args.seed)
+    commands, hot_guild = generate(guilds, args.users, args.rate, args.seconds, args.hot_share, args.seed)
+    # Real users are throttled, but here every command should reach its handler
+    bot.rate_limiter.limits = {}
+    bot.rate_limiter.default = (10 ** 9, 1)
+
+    replay = Replay(bot, commands)
+    elapsed = asyncio.run(replay.run(max_speed=False))
+    return report(replay, hot_guild, elapsed, documents)
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure command latency per guild under load, across guild counts")
+    parser.add_argument("--guild-counts", default="1,10,100,1000", help="Comma separated numbers of guilds to sweep")
+    parser.add_argument("--users", type=int, default=100, help="Users per guild")
+    parser.add_argument("--history", type=int, default=20, help="Settled wagers per seeded user")
+    parser.add_argument("--rate", type=float, default=50, help="Commands per second across all guilds")
+    parser.add_argument("--seconds", type=float, default=60)
+    parser.add_argument("--hot-share", type=float, default=0.5, help="Share of the traffic coming from the busiest guild")
+    parser.add_argument("--mongo", default="mongodb://localhost:27017")
+    parser.add_argument("--db", default="loadtest", help="Database to run against, dropped before every guild count")
+    parser.add_argument("--out", help="Write the report as JSON")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--child", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.db == "usereconomy":
+        parser.error("refusing to run against the production database name")
+
+    if args.child:
+        print(json.dumps(run(args, args.child)))
+        return
+
+    # Separate processes, so every guild count starts from a fresh main.py
+    results = {}
+    for guilds in [int(count) for count in args.guild_counts.split(",")]:
+        output = subprocess.run(
+            [sys.executable, __file__, "--child", str(guilds)] + [arg for arg in sys.argv[1:]],
+            capture_output=True, text=True, check=True
+        ).stdout
+        results[guilds] = json.loads(output.strip().splitlines()[-1])
+        overall = results[guilds]["all_guilds"]
+        print(f"{guilds:>6} guilds  p50 {overall['p50_ms']:>8} ms  p95 {overall['p95_ms']:>8} ms  "
+              f"({results[guilds]['documents']['users']} users, {sum(results[guilds]['errors'].values())} errors)")
+
+    summary_only = {str(guilds): {key: value for key, value in result.items() if key != "per_guild"} for guilds, result in results.items()}
+    print(json.dumps(summary_only, indent=2))
+    if args.out:
+        with open(args.out, "w") as file:
+            json.dump({str(guilds): result for guilds, result in results.items()}, file, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,38 @@
 import discord
 from discord.ext import commands, tasks
+from discord import app_commands
 from discord.ui import Button, View
 import os
 from dotenv import load_dotenv
 from gambling import odds, locktime
+import pricing
+import parlays
+import ledger
+import jobs
+import settlement
+import guilds
+import leader
+import ratelimit
+import board
+import stats
+import charts
+import proposals
+import members
+import profiler
+import traces
+import cashout
 from pymongo.mongo_client import MongoClient
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from bson import ObjectId
 from datetime import datetime, timedelta
+from concurrent.futures import ProcessPoolExecutor
 import random
+import functools
+import asyncio
+import io
+import multiprocessing
+import threading
 import webserver
 
 # Constants
@@ -15,43 +41,212 @@ CURRENCY_NAME = "chekels"
 
 # Getting environment variables
 load_dotenv()
-SERVER_ID = os.getenv('COVID_ID')
-GUILD_ID = discord.Object(id=int(SERVER_ID))
 MONGO_URI = os.getenv('uri')
-PROP_CHANNEL = os.getenv('PROPOSALS_CHANNEL_ID')
-BETTING_CHANNEL = os.getenv('BETTING_CHANNEL_ID')
+JOB_CONCURRENCY = int(os.getenv('JOB_CONCURRENCY', jobs.DEFAULT_CONCURRENCY))
+LEADER_LEASE = float(os.getenv('LEADER_LEASE', leader.LEASE_SECONDS))
+LEADER_HEARTBEAT = float(os.getenv('LEADER_HEARTBEAT', leader.HEARTBEAT_SECONDS))
+BOARD_DEBOUNCE = float(os.getenv('BOARD_DEBOUNCE', board.DEFAULT_DEBOUNCE))
+RATE_LIMITS = ratelimit.parse_limits(os.getenv('RATE_LIMITS', 'leader:2/30, history:3/30, open:3/30, bet:5/60, parlay:3/60, proposal:2/300, graph:2/60'))
+CHART_WORKERS = int(os.getenv('CHART_WORKERS', charts.DEFAULT_WORKERS))
+
+# Lean mode: minimal intents, no member cache and a small (or no) message cache
+LEAN_MODE = os.getenv('LEAN_MODE', '1') == '1'
+MAX_MESSAGES = int(os.getenv('MAX_MESSAGES', 0))  # Only used in lean mode
+
+# Diagnostics
+LOOP_LAG_MS = float(os.getenv('LOOP_LAG_MS', profiler.LAG_THRESHOLD * 1000))
+PROFILE_DIR = os.getenv('PROFILE_DIR', 'profiles')
+TRACE_DIR = os.getenv('TRACE_DIR')  # Record slash commands for replay.py when set
+
+# Cash outs pay the fair value of a wager less this margin
+CASHOUT_MARGIN = float(os.getenv('CASHOUT_MARGIN', cashout.DEFAULT_MARGIN))
+
+# Single-guild settings from before /setup existed, used once to migrate that guild's data
+LEGACY_GUILD_ID = os.getenv('COVID_ID')
+LEGACY_PROP_CHANNEL = os.getenv('PROPOSALS_CHANNEL_ID')
+LEGACY_BETTING_CHANNEL = os.getenv('BETTING_CHANNEL_ID')
+
+# Auto-pricing settings (only used by lines created with auto_price)
+PRICING_MODEL = os.getenv('PRICING_MODEL', 'proportional')
+PRICING_MARGIN = float(os.getenv('PRICING_MARGIN', pricing.DEFAULT_MARGIN))
+PRICING_DEBOUNCE = float(os.getenv('PRICING_DEBOUNCE', pricing.DEFAULT_DEBOUNCE))
+PRICING_MAX_EXPOSURE = float(os.getenv('PRICING_MAX_EXPOSURE', pricing.DEFAULT_MAX_EXPOSURE))
+GUILD_CONFIG_TTL = float(os.getenv('GUILD_CONFIG_TTL', guilds.CONFIG_TTL))
 
 # Create a new client and connect to the server
-mclient = MongoClient(MONGO_URI)
-db = mclient.usereconomy
+# Connects on first use, so chart workers (which import this module, see setup_hook) never connect
+mclient = MongoClient(MONGO_URI, connect=False)
+db = mclient[os.getenv('MONGO_DB', 'usereconomy')]
 users_collection = db.users
 bets_collection = db.bets
+parlays_collection = db.parlays
+ledger_collection = db.ledger
+snapshots_collection = db.snapshots
+jobs_collection = db.jobs
+guilds_collection = db.guilds
+leases_collection = db.leases
+daily_stats_collection = db.daily_stats
+leaderboards_collection = db.leaderboards
+proposals_collection = db.proposals
+guild_configs = guilds.GuildConfigs(guilds_collection, ttl=GUILD_CONFIG_TTL)
+
+# Trace of incoming commands, with users and guilds pseudonymized, opened in setup_hook
+recorder = None
+
+# Logs anything that blocks the event loop for longer than LOOP_LAG_MS
+loop_monitor = profiler.LoopMonitor(threshold=LOOP_LAG_MS / 1000)
+
+# Only the replica holding this lease runs singleton background work
+scheduler_lease = leader.LeaderLease(leases_collection, lease=LEADER_LEASE, heartbeat=LEADER_HEARTBEAT)
 
 # Bot initial boot up
-class Client(commands.Bot):
+class Client(commands.AutoShardedBot):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
     async def setup_hook(self):
+        global recorder
+        if TRACE_DIR:
+            os.makedirs(TRACE_DIR, exist_ok=True)
+            recorder = traces.Recorder(os.path.join(TRACE_DIR, f"trace-{datetime.now().strftime('%Y%m%d-%H%M%S')}.jsonl.gz"), os.getenv('TRACE_SALT'))
+
+        # Label blocked-loop reports with the command or job that was running
+        for command in self.tree.walk_commands():
+            loop_monitor.register(command.callback, f"/{command.qualified_name}")
+        for type, handler in job_queue.handlers.items():
+            loop_monitor.register(handler, f"{type} job")
+        self.loop_monitor = asyncio.create_task(loop_monitor.run())
+
+        # On-demand profiles of the event loop thread, from /profile or the web server
+        self.profiler = profiler.SamplingProfiler(threading.get_ident(), PROFILE_DIR)
+        webserver.profiler = self.profiler
+
+        # Data from the single-guild days belongs to the guild in COVID_ID
+        if LEGACY_GUILD_ID:
+            legacy_guild = int(LEGACY_GUILD_ID)
+            guilds.migrate_legacy(db, legacy_guild)
+            if not guilds_collection.find_one({"_id": legacy_guild}):
+                guild_configs.update(
+                    legacy_guild,
+                    betting_channel=int(LEGACY_BETTING_CHANNEL) if LEGACY_BETTING_CHANNEL else None,
+                    proposals_channel=int(LEGACY_PROP_CHANNEL) if LEGACY_PROP_CHANNEL else None
+                )
+        guild_configs.load()
+
+        # The odds board is loaded here and kept up to date by the commands, and the leader
+        # re-reads the guilds other replicas changed in sync_board
+        odds_board.load(bets_collection.find({"settling": {"$exists": False}}, BOARD_FIELDS))
+        self.board_versions = None  # guild_id -> board_version the leader last read, None until it leads
+
+        # Every document is partitioned by guild
+        users_collection.create_index([("guild_id", 1), ("user_id", 1)], unique=True)
+        users_collection.create_index([("guild_id", 1), ("balance", -1)])
+        bets_collection.create_index([("guild_id", 1), ("id", 1)], unique=True)
+        bets_collection.create_index([("locked", 1), ("locks", 1)])
+        parlays.ensure_indexes(parlays_collection)
+        ledger.ensure_indexes(ledger_collection, snapshots_collection)
+        job_queue.ensure_indexes()
+        scheduler_lease.ensure_indexes()
+        stats.ensure_indexes(daily_stats_collection)
+        proposals.ensure_indexes(proposals_collection)
+
+        # Pick up auto-priced lines that were still open when the bot stopped
+        for bet in bets_collection.find({"auto_price": True, "locked": False}):
+            betting_data = odds(bet.get("base_outcomes", bet["outcomes"]))
+            repricer.track(bet["_id"], betting_data, pricing.handle_list(bet, len(betting_data)), pricing.handle_list(bet, len(betting_data), "payouts"))
+
+        # Leader-only loops skip their iterations on followers, so after a deploy or failover
+        # the new leader runs them straight away instead of waiting out their interval
+        @scheduler_lease.on_elected
+        async def elected():
+            # Daily buckets start from the betting history users already have
+            if daily_stats_collection.estimated_document_count() == 0:
+                await asyncio.to_thread(stats.backfill, users_collection, daily_stats_collection)
+            # Users from before the ledger existed get an opening entry for their balance
+            opened = await asyncio.to_thread(ledger.backfill, users_collection, ledger_collection)
+            if opened:
+                print(f"Wrote opening ledger entries for {opened} users")
+            self.snapshot_balances.restart()
+            self.refresh_leaderboards.restart()
+
+        self.leader_heartbeat = asyncio.create_task(scheduler_lease.run())
         self.check_lock_times.start()
+        self.snapshot_balances.start()
+        self.refresh_leaderboards.start()
+        self.sync_board.start()
+
+        # Charts are drawn in separate processes so plotting never blocks the gateway.
+        # Spawned, not forked: a fork would copy the event loop, gateway sockets, Mongo
+        # connections and the threads holding their locks into every worker
+        self.chart_pool = ProcessPoolExecutor(max_workers=CHART_WORKERS, initializer=charts.warm_up, mp_context=multiprocessing.get_context("spawn"))
+
+        # Settlement jobs, including any left unfinished by a previous run
+        self.job_worker = asyncio.create_task(job_queue.run())
 
     async def on_ready(self):
-        print(f'Logged in as {self.user}')
+        print(f'Logged in as {self.user} on {self.shard_count} shard(s)')
+
+        for guild in self.guilds:
+            await self.sync_guild(guild)
+
+    async def sync_guild(self, guild):
+        """Sync commands to a guild, skipping guilds that already have the current command set"""
+        current = guilds.commands_hash(self.tree)
+        if guild_configs.get(guild.id).get("commands_hash") == current:
+            return
 
         try:
-            GUILD_ID = discord.Object(id=int(SERVER_ID))
-            synced = await self.tree.sync(guild=GUILD_ID)
-            print(f"Synced {len(synced)} commands to {GUILD_ID}")
+            self.tree.copy_global_to(guild=guild)
+            synced = await self.tree.sync(guild=guild)
+            guild_configs.update(guild.id, commands_hash=current)
+            print(f"Synced {len(synced)} commands to {guild.id}")
 
         except Exception as e:
-            print(f"Failed to sync commands: {e}")
+            print(f"Failed to sync commands to {guild.id}: {e}")
+
+    async def close(self):
+        # Hand over leadership right away instead of waiting for the lease to expire
+        await asyncio.to_thread(scheduler_lease.release)
+        self.chart_pool.shutdown(wait=False, cancel_futures=True)
+        if recorder:
+            recorder.close()
+        await super().close()
+
+    async def on_guild_join(self, guild):
+        await self.sync_guild(guild)
     
     async def on_member_join(self, member):
         """When a new member joins the server, initialize their balance"""
-        await ensure_user_exists(member.id)
+        await ensure_user_exists(member.guild.id, member.id)
+
+    async def on_interaction(self, interaction):
+        if recorder and interaction.type == discord.InteractionType.application_command:
+            config = guild_configs.get(interaction.guild_id)
+            channel = next((role for role in ("betting", "proposals") if interaction.channel_id == config.get(f"{role}_channel")), "other")
+            recorder.command(interaction, channel)
+
+    async def on_app_command_completion(self, interaction, command):
+        if recorder:
+            recorder.completed(interaction)
+
+    # Proposal votes are counted from raw gateway events, so messages never have to be cached or fetched
+    async def on_raw_reaction_add(self, payload):
+        self.tally_vote(payload, 1)
+
+    async def on_raw_reaction_remove(self, payload):
+        self.tally_vote(payload, -1)
+
+    def tally_vote(self, payload, delta):
+        if payload.guild_id is None or payload.user_id == self.user.id:
+            return
+        if payload.channel_id != guild_configs.get(payload.guild_id).get("proposals_channel"):
+            return
+        proposals.tally(proposals_collection, payload.message_id, str(payload.emoji), delta)
     
     @tasks.loop(seconds=60) # Check every minute if a betting line should be locked
     async def check_lock_times(self):
+        if not scheduler_lease.is_leader:
+            return
         now = datetime.now()
         for bet in bets_collection.find({"locks": {"$lte": now}, "locked": False}):
             channel = self.get_channel(bet["channel_id"])
@@ -59,47 +254,134 @@ class Client(commands.Bot):
             new_embed = locking(message)
             await message.edit(embed=new_embed, view=None)
             bets_collection.update_one({"message_id": message.id}, {"$set": {"locked": True}})
+            repricer.forget(bet["_id"])
+            odds_board.update(bet["guild_id"], message.id, locked=True)
     
     @check_lock_times.before_loop
     async def before_check_lock_times(self):
         await self.wait_until_ready()
 
-# Intent setup
-intents = discord.Intents.default()
-intents.message_content = True
-client = Client(command_prefix='!', intents=intents)
+    @tasks.loop(hours=6) # Snapshot balances so rebuilding them only replays recent ledger entries
+    async def snapshot_balances(self):
+        if not scheduler_lease.is_leader:
+            return
+        written = await asyncio.to_thread(ledger.take_snapshots, ledger_collection, snapshots_collection)
+        print(f"Took {written} balance snapshots")
+
+    @tasks.loop(minutes=10) # Rebuild the profit, ROI and win rate leaderboards from the daily buckets
+    async def refresh_leaderboards(self):
+        if not scheduler_lease.is_leader:
+            return
+        await asyncio.to_thread(stats.refresh_leaderboards, daily_stats_collection, leaderboards_collection)
+
+    @tasks.loop(seconds=BOARD_DEBOUNCE) # Only the leader edits the odds boards
+    async def sync_board(self):
+        if not scheduler_lease.is_leader:
+            self.board_versions = None
+            return
+        # Every board change bumps the guild's board_version, so the small guild documents
+        # tell which guilds other replicas touched
+        docs = await asyncio.to_thread(lambda: list(guilds_collection.find({}, {"board_version": 1, "betting_channel": 1, "board_messages": 1})))
+        versions = {doc["_id"]: doc.get("board_version", 0) for doc in docs}
+
+        if self.board_versions is None:
+            # Just became leader, rebuild everything once and republish every board
+            await asyncio.to_thread(guild_configs.load)
+            bets = await asyncio.to_thread(lambda: list(bets_collection.find({"settling": {"$exists": False}}, BOARD_FIELDS)))
+            odds_board.rendered.clear()
+            await odds_board.sync(bets)
+            self.board_versions = versions
+            return
+
+        for doc in docs:
+            guild_id = doc["_id"]
+            if versions[guild_id] == self.board_versions.get(guild_id):
+                continue
+            self.board_versions[guild_id] = versions[guild_id]
+            config = guild_configs.get(guild_id)
+            if (config.get("betting_channel"), config.get("board_messages")) != (doc.get("betting_channel"), doc.get("board_messages")):
+                guild_configs.forget(guild_id)
+            # /setup on another replica clears the board messages, so the board has to be posted again
+            # (checked on the document, the cached config may have expired and caught up already)
+            if not doc.get("board_messages"):
+                odds_board.rendered.pop(guild_id, None)
+            bets = await asyncio.to_thread(lambda: list(bets_collection.find({"guild_id": guild_id, "settling": {"$exists": False}}, BOARD_FIELDS)))
+            await odds_board.sync_guild(guild_id, bets)
+
+    @sync_board.before_loop
+    async def before_sync_board(self):
+        await self.wait_until_ready()
+
+# Intent and cache setup
+intents = members.intents(LEAN_MODE)
+client = Client(command_prefix='!', intents=intents, **members.cache_options(LEAN_MODE, MAX_MESSAGES))
+
+# Names of users outside the (possibly empty) member cache
+member_names = members.MemberNames(client)
+
+# Per-user token buckets for commands
+rate_limiter = ratelimit.RateLimiter(RATE_LIMITS)
+
+# Guild setup
+
+# Commands only work in the channels a guild's admins picked with /setup
+def in_channel(interaction: discord.Interaction, channel: str) -> bool:
+    return interaction.channel.id == guild_configs.get(interaction.guild_id).get(channel)
+
+@client.tree.command(name="setup", description="Pick the betting and proposals channels for this server")
+async def setup_guild(interaction: discord.Interaction, betting_channel: discord.TextChannel, proposals_channel: discord.TextChannel):
+    if not interaction.user.guild_permissions.administrator:
+        await interaction.response.send_message("You don't have permission to use this command!", ephemeral=True)
+        return
+
+    guild_configs.update(interaction.guild_id, betting_channel=betting_channel.id, proposals_channel=proposals_channel.id, board_messages=[])
+    odds_board.refresh(interaction.guild_id)
+    await interaction.response.send_message(
+        f"✅ Betting in {betting_channel.mention}, proposals in {proposals_channel.mention}",
+        ephemeral=True
+    )
 
 # User economy setup
 
+# Users are stored once per guild
+def user_key(guild_id: int, user_id: int) -> dict:
+    return {"guild_id": guild_id, "user_id": user_id}
+
 # Checking if user exists in database if not create one with initial balance
-async def ensure_user_exists(user_id: int) -> dict:
+async def ensure_user_exists(guild_id: int, user_id: int) -> dict:
     """Ensure user exists in database, create if not"""
-    user = users_collection.find_one({"_id": user_id})
+    user = users_collection.find_one(user_key(guild_id, user_id))
     if not user:
         user = {
-            "_id": user_id,
+            **user_key(guild_id, user_id),
             "balance": INITIAL_BALANCE,
             "last_daily": None
         }
-        users_collection.insert_one(user)
+        try:
+            users_collection.insert_one(user)
+            ledger.record_once(ledger_collection, [ledger.entry(guild_id, user_id, "initial", INITIAL_BALANCE, key=ledger.opening_key(guild_id, user_id))])
+        except DuplicateKeyError:
+            # Created by another command in the meantime
+            user = users_collection.find_one(user_key(guild_id, user_id))
     return user
 
-async def get_balance(user_id: int) -> int:
+async def get_balance(guild_id: int, user_id: int) -> int:
     """Get user's balance"""
-    user = await ensure_user_exists(user_id)
+    user = await ensure_user_exists(guild_id, user_id)
     return user["balance"]
 
 # Checking balance
-@client.tree.command(name="bal", description=f"Check your {CURRENCY_NAME} balance", guild=GUILD_ID)
+@client.tree.command(name="bal", description=f"Check your {CURRENCY_NAME} balance")
+@rate_limiter.limit()
 async def balance(interaction: discord.Interaction, user: discord.Member = None):
 
-    if interaction.channel.id != int(BETTING_CHANNEL):
+    if not in_channel(interaction, "betting_channel"):
         await interaction.response.send_message("You can only check your balance in the #betting channel!", ephemeral=True)
         return
 
     # If no user is specified, check own balance
     target_user = user if user else interaction.user
-    user_balance = await get_balance(target_user.id)
+    user_balance = await get_balance(interaction.guild_id, target_user.id)
 
     if target_user == interaction.user:
         title="💰 Balance Check"
@@ -116,40 +398,74 @@ async def balance(interaction: discord.Interaction, user: discord.Member = None)
     
     await interaction.response.send_message(embed=embed)
 
-# Viewing leaderboard
-@client.tree.command(name="leader", description=f"Shows the top 5 richest users", guild=GUILD_ID)
-async def leaderboard(interaction: discord.Interaction):
+# Leaderboards other than balance, as (title, how to show a row)
+STAT_BOARDS = {
+    "profit": ("💸 Top Earners", lambda row: f"₾ {row['value']:,.2f} {CURRENCY_NAME} profit"),
+    "roi": ("📈 Best ROI", lambda row: f"{row['value'] * 100:.1f}% ROI over {row['bets']} bets"),
+    "win_rate": ("🎯 Best Win Rate", lambda row: f"{row['value'] * 100:.1f}% ({row['wins']}/{row['bets']} bets won)"),
+}
+WINDOW_NAMES = {"7d": "last 7 days", "30d": "last 30 days", "all": "all time"}
 
-    if interaction.channel.id != int(BETTING_CHANNEL):
+# Viewing leaderboard
+@client.tree.command(name="leader", description=f"Shows the top 5 users by balance, profit, ROI or win rate")
+@app_commands.choices(
+    board=[
+        app_commands.Choice(name="Balance", value="balance"),
+        app_commands.Choice(name="Net Profit", value="profit"),
+        app_commands.Choice(name="ROI", value="roi"),
+        app_commands.Choice(name="Win Rate", value="win_rate"),
+    ],
+    window=[app_commands.Choice(name=name.capitalize(), value=window) for window, name in WINDOW_NAMES.items()]
+)
+@rate_limiter.limit(concurrency=2)
+async def leaderboard(interaction: discord.Interaction, board: app_commands.Choice[str] = None, window: app_commands.Choice[str] = None):
+
+    if not in_channel(interaction, "betting_channel"):
         await interaction.response.send_message("You can only check the leaderboard in the #betting channel!", ephemeral=True)
         return
 
-    # Get top 5 users sorted by balance
-    top_users = list(users_collection.find().sort("balance", -1).limit(5))
-    
-    embed = discord.Embed(
-        title="🏆 Richest Users",
-        description=f"Top 5 {CURRENCY_NAME}🤑 holders",
-        color=0xfa99e7
-    )
+    board = board.value if board else "balance"
+    window = window.value if window else "all"
+
+    if board == "balance":
+        # Get top 5 users sorted by balance
+        top_users = list(users_collection.find({"guild_id": interaction.guild_id}).sort("balance", -1).limit(5))
+        rows = [(user_data["user_id"], f"₾ {user_data['balance']:,} {CURRENCY_NAME}") for user_data in top_users]
+        embed = discord.Embed(
+            title="🏆 Richest Users",
+            description=f"Top 5 {CURRENCY_NAME}🤑 holders",
+            color=0xfa99e7
+        )
+    else:
+        # Read the precomputed board, refreshed in the background from daily buckets
+        title, show = STAT_BOARDS[board]
+        materialized = stats.leaderboard(leaderboards_collection, interaction.guild_id, window, board)
+        rows = [(row["user_id"], show(row)) for row in (materialized["rows"][:5] if materialized else [])]
+        embed = discord.Embed(
+            title=title,
+            description=f"Top 5 bettors, {WINDOW_NAMES[window]}",
+            color=0xfa99e7
+        )
+        if board != "profit":
+            embed.description += f" (at least {stats.MIN_BETS} bets)"
     
     # Medals for top 3
     medals = ["🥇", "🥈", "🥉", "4.", "5."]
     
-    for i, user_data in enumerate(top_users):
-        try:
-            # Get discord user object
-            user = await client.fetch_user(user_data["_id"])
-            # Format balance with commas
-            balance = f"{user_data['balance']:,}"
-            # Add field for this user
-            embed.add_field(
-                name=f"{medals[i]} {user.display_name}",
-                value=f"₾ {balance} {CURRENCY_NAME}",
-                inline=False
-            )
-        except discord.NotFound:
+    # Look up all names at once, most come straight from the cache
+    names = await asyncio.gather(*(member_names.get(interaction.guild, user_id) for user_id, _ in rows))
+    for i, ((user_id, value), name) in enumerate(zip(rows, names)):
+        if name is None:
             continue
+        # Add field for this user
+        embed.add_field(
+            name=f"{medals[i]} {name}",
+            value=value,
+            inline=False
+        )
+
+    if not rows:
+        embed.add_field(name="Nobody yet", value="No settled bets in this period", inline=False)
     
     embed.set_thumbnail(url="https://tikolu.net/i/tcicn.png")
     embed.set_footer(text=f"Use /balance to check your {CURRENCY_NAME}")
@@ -157,10 +473,10 @@ async def leaderboard(interaction: discord.Interaction):
     await interaction.response.send_message(embed=embed)
 
 # Check if user can claim daily
-async def can_claim_daily(user_id: int) -> bool:
+async def can_claim_daily(guild_id: int, user_id: int) -> bool:
 
     """Check if user can claim daily reward"""
-    user = users_collection.find_one({"_id": user_id})
+    user = users_collection.find_one(user_key(guild_id, user_id))
     if not user or "last_daily" not in user or user["last_daily"] is None:
         return True
     last_claim = user["last_daily"]
@@ -168,19 +484,20 @@ async def can_claim_daily(user_id: int) -> bool:
     return datetime.now() >= next_claim
 
 # Let user claim daily
-@client.tree.command(name="daily", description=f"Claim your daily {CURRENCY_NAME}", guild=GUILD_ID)
+@client.tree.command(name="daily", description=f"Claim your daily {CURRENCY_NAME}")
+@rate_limiter.limit()
 async def daily(interaction: discord.Interaction):
 
-    if interaction.channel.id != int(BETTING_CHANNEL):
+    if not in_channel(interaction, "betting_channel"):
         await interaction.response.send_message("You can only claim your daily reward in the #betting channel!", ephemeral=True)
         return
 
     # Ensure user exists
-    await ensure_user_exists(interaction.user.id)
+    await ensure_user_exists(interaction.guild_id, interaction.user.id)
     
     # Check if user can claim
-    if not await can_claim_daily(interaction.user.id):
-        user = users_collection.find_one({"_id": interaction.user.id})
+    if not await can_claim_daily(interaction.guild_id, interaction.user.id):
+        user = users_collection.find_one(user_key(interaction.guild_id, interaction.user.id))
         next_claim = user["last_daily"] + timedelta(days=1)
         time_left = next_claim - datetime.now()
         hours = time_left.seconds // 3600
@@ -199,15 +516,16 @@ async def daily(interaction: discord.Interaction):
     
     # Update user's balance and last claim time
     users_collection.update_one(
-        {"_id": interaction.user.id},
+        user_key(interaction.guild_id, interaction.user.id),
         {
             "$inc": {"balance": reward},
             "$set": {"last_daily": datetime.now()}
         }
     )
+    ledger.record(ledger_collection, interaction.guild_id, interaction.user.id, "daily", reward)
     
     # Get new balance
-    new_balance = await get_balance(interaction.user.id)
+    new_balance = await get_balance(interaction.guild_id, interaction.user.id)
     
     # Create embed response
     embed = discord.Embed(
@@ -225,10 +543,11 @@ async def daily(interaction: discord.Interaction):
     await interaction.response.send_message(embed=embed, ephemeral=True)
 
 # Give another user some fairy dust
-@client.tree.command(name="give", description=f"Give another user some {CURRENCY_NAME}", guild=GUILD_ID)
+@client.tree.command(name="give", description=f"Give another user some {CURRENCY_NAME}")
+@rate_limiter.limit()
 async def give(interaction: discord.Interaction, amount: int, user: discord.Member):
 
-    if interaction.channel.id != int(BETTING_CHANNEL):
+    if not in_channel(interaction, "betting_channel"):
         await interaction.response.send_message(f"You can only give {CURRENCY_NAME} in the #betting channel!", ephemeral=True)
         return
     elif amount < 1:
@@ -239,10 +558,10 @@ async def give(interaction: discord.Interaction, amount: int, user: discord.Memb
         return
 
     # Ensure both users exist and get balances
-    await ensure_user_exists(interaction.user.id)
-    await ensure_user_exists(user.id)
+    await ensure_user_exists(interaction.guild_id, interaction.user.id)
+    await ensure_user_exists(interaction.guild_id, user.id)
     
-    sender_balance = await get_balance(interaction.user.id)
+    sender_balance = await get_balance(interaction.guild_id, interaction.user.id)
     
     # Check if sender has enough balance
     if sender_balance < amount:
@@ -251,17 +570,21 @@ async def give(interaction: discord.Interaction, amount: int, user: discord.Memb
     
     # Update balances
     users_collection.update_one(
-        {"_id": interaction.user.id},
+        user_key(interaction.guild_id, interaction.user.id),
         {"$inc": {"balance": -amount}}
     )
     users_collection.update_one(
-        {"_id": user.id},
+        user_key(interaction.guild_id, user.id),
         {"$inc": {"balance": amount}}
     )
+    ledger.record_many(ledger_collection, [
+        ledger.entry(interaction.guild_id, interaction.user.id, "give", -amount, counterparty=user.id),
+        ledger.entry(interaction.guild_id, user.id, "give", amount, counterparty=interaction.user.id)
+    ])
     
     # Get new balances
-    new_sender_balance = await get_balance(interaction.user.id)
-    new_receiver_balance = await get_balance(user.id)
+    new_sender_balance = await get_balance(interaction.guild_id, interaction.user.id)
+    new_receiver_balance = await get_balance(interaction.guild_id, user.id)
     
     # Create embed response
     embed = discord.Embed(
@@ -339,23 +662,41 @@ class LockButton(View):
             message = interaction.message
             new_embed = locking(message)
             await message.edit(embed=new_embed, view=None)
+            odds_board.update(interaction.guild_id, message.id, locked=True)
             
             await interaction.response.send_message("✅ Betting line locked!", ephemeral=True)
     
         lock_button.callback = lock_callback
 
 # For admin to create a betting line
-@client.tree.command(name="cl", description="Creates a betting line, usage: /cl <title> <descrip> <ID> <outcomes|probabilities> <lock>", guild=GUILD_ID)    
-async def create_line(interaction: discord.Interaction, title: str, description: str, outcomes: str, locks: str = None, restricted1: discord.Member = None, restricted2: discord.Member = None, restricted3: discord.Member = None):
+@client.tree.command(name="cl", description="Creates a betting line, usage: /cl <title> <descrip> <ID> <outcomes|probabilities> <lock>")    
+async def create_line(interaction: discord.Interaction, title: str, description: str, outcomes: str, locks: str = None, restricted1: discord.Member = None, restricted2: discord.Member = None, restricted3: discord.Member = None, auto_price: bool = False):
 
     if not interaction.user.guild_permissions.administrator:
         await interaction.response.send_message("You don't have permission to use this command!", ephemeral=True)
         return
     
-    last_bet = bets_collection.find_one(sort=[("id", -1)])
-    bet_id = last_bet["id"] + 1
-
+    bet_id = next_bet_id(interaction.guild_id)
     betting_data = odds(outcomes)
+    embed = line_embed(bet_id, title, description, betting_data, locks)
+
+    view = LockButton()
+    await interaction.response.send_message(embed=embed, view=view)
+    message = await interaction.original_response()
+
+    banned_IDS = []
+    for crodie in [restricted1, restricted2, restricted3]:
+        if crodie is not None:
+            banned_IDS.append(crodie.id)
+
+    save_line(interaction.guild_id, bet_id, message, title, outcomes, betting_data, locks, banned_IDS, auto_price)
+
+def next_bet_id(guild_id: int) -> int:
+    last_bet = bets_collection.find_one({"guild_id": guild_id}, sort=[("id", -1)])
+    return last_bet["id"] + 1 if last_bet else 1
+
+# Embed for a new betting line
+def line_embed(bet_id: int, title: str, description: str, betting_data: dict, locks: str = None):
     embed = discord.Embed(title=f"{title} (Bet ID: #{str(bet_id)})", description=description, color=0x03c2fc)
     i = 1
     for outcome, info in betting_data.items():
@@ -367,44 +708,119 @@ async def create_line(interaction: discord.Interaction, title: str, description:
         embed.set_footer(text=f"This line locks on {locktime(locks)}")
     else:
         embed.set_footer(text="❗This line has no set lock time, but it may be locked at any time")
+    return embed
+
+# Store a betting line once its message is posted
+def save_line(guild_id: int, bet_id: int, message, title: str, outcomes: str, betting_data: dict, locks: str = None, restricted_users=None, auto_price: bool = False):
+    line = {
+        "guild_id": guild_id,
+        "id": bet_id,
+        "title": title,
+        "outcomes": outcomes,
+        "locks": datetime.strptime(locks, "%m/%d/%Y %H:%M") if locks is not None else None,
+        "locked": False,
+        "message_id": message.id,
+        "channel_id": message.channel.id,
+        "restricted_users": restricted_users or [],
+        "participants": [],
+        "auto_price": auto_price,
+        "base_outcomes": outcomes,
+        "handle": {}
+    }
+    bets_collection.insert_one(line)
+    odds_board.add(line)
+
+    if auto_price:
+        repricer.track(line["_id"], betting_data)
+    return line
+
+# Edit the pinned board messages in the betting channel, posting and pinning more if needed
+async def publish_board(guild_id: int, embeds):
+    await client.wait_until_ready()
+    config = guild_configs.get(guild_id)
+    channel = client.get_channel(config.get("betting_channel"))
+    if channel is None:
+        return
 
-    view = LockButton()
-    await interaction.response.send_message(embed=embed, view=view)
-    message = await interaction.original_response()
-    embed_id = message.id
+    message_ids = list(config.get("board_messages", []))
+    kept = []
+    for i, embed in enumerate(embeds):
+        message = None
+        if i < len(message_ids):
+            # Partial messages can be edited without fetching them first
+            message = channel.get_partial_message(message_ids[i])
+            try:
+                await message.edit(embed=embed)
+            except discord.NotFound:
+                message = None
+        if message is None:
+            message = await channel.send(embed=embed)
+            try:
+                await message.pin()
+            except discord.HTTPException:
+                pass  # Missing Manage Messages permission or too many pins
+        kept.append(message.id)
+
+    # Remove board messages that are no longer needed
+    for message_id in message_ids[len(embeds):]:
+        try:
+            await channel.get_partial_message(message_id).delete()
+        except discord.HTTPException:
+            pass
 
-    banned_IDS = []
-    for crodie in [restricted1, restricted2, restricted3]:
-        if crodie is not None:
-            banned_IDS.append(crodie.id)
+    if kept != message_ids:
+        guild_configs.update(guild_id, board_messages=kept)
 
-    bets_collection.insert_one(
-        {
-            "id": bet_id,
-            "title": title,
-            "outcomes": outcomes,
-            "locks": datetime.strptime(locks, "%m/%d/%Y %H:%M") if locks is not None else None,
-            "locked": False,
-            "message_id": embed_id,
-            "channel_id": interaction.channel.id,
-            "restricted_users": banned_IDS,
-            "participants": []
-        }
-    )
+# Tell the leader a guild's board changed, see Client.sync_board
+def board_changed(guild_id: int):
+    guilds_collection.update_one({"_id": guild_id}, {"$inc": {"board_version": 1}}, upsert=True)
+
+odds_board = board.OddsBoard(publish_board, delay=BOARD_DEBOUNCE, can_publish=lambda: scheduler_lease.is_leader, on_change=board_changed)
+BOARD_FIELDS = {"guild_id": 1, "id": 1, "title": 1, "outcomes": 1, "locks": 1, "locked": 1, "handle": 1, "message_id": 1, "version": 1}
+
+STAKE_RETRIES = 5  # Attempts when bets on the same auto-priced line race each other
+
+# Count a wager towards a line's handle and payouts. Auto-priced lines check the exposure cap
+# against the handle stored on the line, so bets taken by every replica count towards it
+def add_stake(bet, outcome_index: int, amount: float, payout: float, count: int) -> bool:
+    stake = {"$inc": {f"handle.{outcome_index}": amount, f"payouts.{outcome_index}": payout}}
+    if not bet.get("auto_price"):
+        bets_collection.update_one({"_id": bet["_id"]}, stake)
+        return True
+
+    for _ in range(STAKE_RETRIES):
+        line = bets_collection.find_one({"_id": bet["_id"]}, {"handle": 1, "payouts": 1})
+        if line is None:
+            return False
+        handle, payouts = pricing.handle_list(line, count), pricing.handle_list(line, count, "payouts")
+        if not pricing.accepts(handle, payouts, outcome_index, amount, payout, PRICING_MAX_EXPOSURE):
+            return False
+        # Only goes through if no other bet moved the handle since it was read
+        unchanged = {field: line[field] if field in line else {"$exists": False} for field in ("handle", "payouts")}
+        if bets_collection.update_one({"_id": bet["_id"], **unchanged}, stake).modified_count:
+            handle[outcome_index] += amount
+            payouts[outcome_index] += payout
+            if bet["_id"] not in repricer.lines:
+                # Opened on another replica, re-price it from here too
+                repricer.track(bet["_id"], odds(bet.get("base_outcomes", bet["outcomes"])))
+            repricer.update(bet["_id"], handle, payouts)
+            return True
+    return False
 
 # Betting on a line
-@client.tree.command(name="bet", description="Places bet, usage: /bet <amount> <outcome #> <bet ID>", guild=GUILD_ID)
+@client.tree.command(name="bet", description="Places bet, usage: /bet <amount> <outcome #> <bet ID>")
+@rate_limiter.limit()
 async def place_bet(interaction: discord.Interaction, bet_id: int, outcome: int, amount: float):
     
-    if interaction.channel.id != int(BETTING_CHANNEL):
+    if not in_channel(interaction, "betting_channel"):
         await interaction.response.send_message("You can only place bets in the #betting channel!", ephemeral=True)
         return
 
-    user = await ensure_user_exists(interaction.user.id)
-    user_id = user["_id"]
+    user = await ensure_user_exists(interaction.guild_id, interaction.user.id)
+    user_id = user["user_id"]
 
     try:
-        bet = bets_collection.find_one({"id": bet_id})
+        bet = bets_collection.find_one({"guild_id": interaction.guild_id, "id": bet_id})
         if not bet:
             await interaction.response.send_message(f"❌ Bet with ID #{bet_id} not found!", ephemeral=True)
             return
@@ -460,15 +876,16 @@ async def place_bet(interaction: discord.Interaction, bet_id: int, outcome: int,
     await conf_message.add_reaction("✅")
     await conf_message.add_reaction("❌")
 
-    def check(reaction, reaction_user):
-        return reaction_user.id == interaction.user.id and str(reaction.emoji) in ["✅", "❌"] and reaction.message == conf_message
+    # Raw events work without the message cache
+    def check(payload):
+        return payload.user_id == interaction.user.id and str(payload.emoji) in ["✅", "❌"] and payload.message_id == conf_message.id
     
     try:
-        reaction, _ = await client.wait_for("reaction_add", timeout=15.0, check=check)
+        reaction = await client.wait_for("raw_reaction_add", timeout=15.0, check=check)
 
         if str(reaction.emoji) == "✅":
             # Get fresh user data to check balance again
-            current_user = await ensure_user_exists(interaction.user.id)
+            current_user = await ensure_user_exists(interaction.guild_id, interaction.user.id)
             if current_user["balance"] < amount:
                 error_embed = discord.Embed(
                     title="❌ Insufficient Balance",
@@ -478,12 +895,23 @@ async def place_bet(interaction: discord.Interaction, bet_id: int, outcome: int,
                 await conf_message.edit(embed=error_embed)
                 return
 
+            # Auto-priced lines cap what the house can lose on them
+            if not add_stake(bet, outcome - 1, amount, payout, len(betting_data)):
+                error_embed = discord.Embed(
+                    title="❌ Bet Limit Reached",
+                    description="This line isn't taking more bets on that outcome right now, try a smaller amount or wait for the odds to move!",
+                    color=0xff0000
+                )
+                await conf_message.edit(embed=error_embed)
+                return
+
             # Update user balance
-            users_collection.update_one({"_id": user_id}, {"$inc": {"balance": -amount}})
+            users_collection.update_one(user_key(interaction.guild_id, user_id), {"$inc": {"balance": -amount}})
+            ledger.record(ledger_collection, interaction.guild_id, user_id, "wager", -amount, bet_id)
             
             # Add to user's open bets
             users_collection.update_one(
-                {"_id": user_id}, 
+                user_key(interaction.guild_id, user_id), 
                 {"$push": {"bets": {
                     "bet_id": bet_id, 
                     "outcome_num": outcome,
@@ -495,11 +923,9 @@ async def place_bet(interaction: discord.Interaction, bet_id: int, outcome: int,
                 }}}
             )
             
-            # Add user's ID to bet's participants
-            bets_collection.update_one(
-                {"id": bet_id}, 
-                {"$push": {"participants": user_id}}
-            )
+            # Add user's ID to bet's participants, the stake is already on the outcome's handle
+            bets_collection.update_one({"_id": bet["_id"]}, {"$push": {"participants": user_id}})
+            odds_board.add_handle(interaction.guild_id, bet["message_id"], outcome - 1, amount)
 
             # Success embed
             success_embed = discord.Embed(
@@ -538,23 +964,242 @@ async def place_bet(interaction: discord.Interaction, bet_id: int, outcome: int,
     except:
         pass
 
-# Update odds for a betting line
-@client.tree.command(name="uo", description="Update odds for a betting line, usage: !uo <bet ID> <outcomes|probabilities>", guild=GUILD_ID)
-async def update_odds(interaction: discord.Interaction, bet_id: int, outcomes: str):
-    if not interaction.user.guild_permissions.administrator:
-        await interaction.response.send_message("You don't have permission to use this command!", ephemeral=True)
+# Betting on several lines at once
+@client.tree.command(name="parlay", description="Places a parlay, usage: /parlay <bet ID:outcome #, ...> <amount>")
+@rate_limiter.limit()
+async def place_parlay(interaction: discord.Interaction, legs: str, amount: float):
+
+    if not in_channel(interaction, "betting_channel"):
+        await interaction.response.send_message("You can only place bets in the #betting channel!", ephemeral=True)
         return
-    
-    bet = bets_collection.find_one({"id": bet_id})
-    if not bet:
-        await interaction.response.send_message(f"Bet with ID {bet_id} not found!", ephemeral=True)
+    elif amount <= 0:
+        await interaction.response.send_message("❌ You must bet a positive amount!", ephemeral=True)
         return
-    
+
+    try:
+        picks = parlays.parse_legs(legs)
+    except ValueError as e:
+        await interaction.response.send_message(f"❌ {e}", ephemeral=True)
+        return
+
+    user = await ensure_user_exists(interaction.guild_id, interaction.user.id)
+    user_id = user["user_id"]
+
+    bets = {bet["id"]: bet for bet in bets_collection.find({"guild_id": interaction.guild_id, "id": {"$in": [bet_id for bet_id, _ in picks]}})}
+    parlay_legs = []
+    for bet_id, outcome in picks:
+        bet = bets.get(bet_id)
+        if not bet:
+            await interaction.response.send_message(f"❌ Bet with ID #{bet_id} not found!", ephemeral=True)
+            return
+        elif user_id in bet["restricted_users"]:
+            await interaction.response.send_message(f"❌ You are not allowed to bet on #{bet_id} due to a conflict of interest!", ephemeral=True)
+            return
+        elif bet["locked"]:
+            await interaction.response.send_message(f"❌ Betting line #{bet_id} is no longer accepting bets!", ephemeral=True)
+            return
+        elif bet.get("auto_price"):
+            # A parlay's payout doesn't belong to any one leg, so it can't count towards an
+            # auto-priced line's handle or exposure cap
+            await interaction.response.send_message(f"❌ Betting line #{bet_id} is auto-priced and can only be bet on with /bet!", ephemeral=True)
+            return
+
+        betting_data = odds(bet["outcomes"])
+        if outcome < 1 or outcome > len(betting_data):
+            await interaction.response.send_message(f"❌ Invalid outcome number for #{bet_id}!", ephemeral=True)
+            return
+        outcome_name = list(betting_data.keys())[outcome - 1]
+        parlay_legs.append({
+            "bet_id": bet_id,
+            "title": bet["title"],
+            "outcome_num": outcome,
+            "outcome": outcome_name,
+            "decimal_odds": betting_data[outcome_name]["decimal_odds"],
+            "result": None
+        })
+
+    # Take the stake only if the balance still covers it, and mark the parlay as open on the user
+    parlay_id = ObjectId()
+    taken = users_collection.update_one(
+        {**user_key(interaction.guild_id, user_id), "balance": {"$gte": amount}},
+        {"$inc": {"balance": -amount}, "$push": {"parlays": parlay_id}}
+    )
+    if taken.modified_count == 0:
+        await interaction.response.send_message(f"❌ You don't have enough {CURRENCY_NAME}🤑 to place this bet!", ephemeral=True)
+        return
+
+    payout = amount * parlays.combined_odds(parlay_legs)
+    parlays_collection.insert_one({
+        "_id": parlay_id,
+        "guild_id": interaction.guild_id,
+        "user_id": user_id,
+        "amount": amount,
+        "payout": payout,
+        "status": "open",
+        "legs": parlay_legs,
+        "open_legs": [leg["bet_id"] for leg in parlay_legs],
+        "placed_at": datetime.now()
+    })
+    ledger.record(ledger_collection, interaction.guild_id, user_id, "parlay_wager", -amount, parlay_id=parlay_id)
+
+    embed = discord.Embed(
+        title="✅ Parlay Placed Successfully!",
+        description=f"Your {len(parlay_legs)}-leg parlay has been confirmed.",
+        color=0x00ff00
+    )
+    embed.add_field(
+        name="Legs",
+        value="\n".join(f"#{leg['bet_id']} {leg['title']}: **{leg['outcome']}** (x{leg['decimal_odds']})" for leg in parlay_legs),
+        inline=False
+    )
+    embed.add_field(
+        name="Bet Details",
+        value=f"Amount: ₾**{amount:,}** {CURRENCY_NAME}🤑\n"
+              f"Potential Payout: ₾**{payout:,.2f}** {CURRENCY_NAME}🤑",
+        inline=False
+    )
+    await interaction.response.send_message(embed=embed)
+
+# Fair outcome probabilities per line version, shared by every cash out quote
+fair_values = cashout.FairValues()
+
+# What a cash out needs from a line, in one read
+CASHOUT_FIELDS = {"id": 1, "title": 1, "outcomes": 1, "locked": 1, "settling": 1, "version": 1, "message_id": 1}
+
+def version_filter(version: int) -> dict:
+    # Lines from before versions were stored have no version field, which counts as 0
+    return {"version": version} if version else {"version": {"$in": [0, None]}}
+
+# Settle a cash out if the wager is still open and the odds haven't moved since the quote
+def settle_cashout(guild_id: int, user_id: int, bet_id: int, version: int, wager: dict, value: float) -> bool:
+    # Taking the stake off the line only matches at the quoted version, so this write is the version check
+    outcome_index = wager["outcome_num"] - 1
+    line = bets_collection.find_one_and_update(
+        {"guild_id": guild_id, "id": bet_id, "locked": False, "settling": {"$exists": False}, **version_filter(version)},
+        {"$inc": {f"handle.{outcome_index}": -wager["amount"], f"payouts.{outcome_index}": -wager["payout"]}},
+        projection={**CASHOUT_FIELDS, "handle": 1, "payouts": 1},
+        return_document=ReturnDocument.AFTER
+    )
+    if line is None:
+        # Another replica moved the odds, so the next quote here uses them
+        line = bets_collection.find_one({"guild_id": guild_id, "id": bet_id}, CASHOUT_FIELDS)
+        if line is not None:
+            odds_board.update(guild_id, line["message_id"], outcomes=line["outcomes"], version=line.get("version", 0))
+        return False
+    message_id = line["message_id"]
+
+    receipt = {
+        "bet_id": line["id"],
+        "bet": line["title"],
+        "prediction": wager["outcome"],
+        "wagered": wager["amount"],
+        "result": "cashout",
+        "amount_won": value - wager["amount"],
+        "resolved_at": datetime.now()
+    }
+    # Same condition as settlement, so only one of them can take the wager
+    result = users_collection.update_one(
+        {**user_key(guild_id, user_id), "bets.bet_id": line["id"]},
+        {
+            "$inc": {"balance": value},
+            "$pull": {"bets": {"bet_id": line["id"]}},
+            "$push": {"history": receipt}
+        }
+    )
+    if not result.modified_count:
+        # The wager was already settled or cashed out, so its stake goes back on the line
+        bets_collection.update_one({"_id": line["_id"]}, {"$inc": {f"handle.{outcome_index}": wager["amount"], f"payouts.{outcome_index}": wager["payout"]}})
+        return False
+
+    ledger.record(ledger_collection, guild_id, user_id, "cashout", value, line["id"])
+    stats.record_results(daily_stats_collection, guild_id, [stats.result(user_id, wager["amount"], value - wager["amount"], False)])
+
+    # The stake no longer rides on the line
+    count = len(odds(line["outcomes"]))
+    repricer.update(line["_id"], pricing.handle_list(line, count), pricing.handle_list(line, count, "payouts"))
+    odds_board.add_handle(guild_id, message_id, outcome_index, -wager["amount"])
+    return True
+
+# Button to accept a cash out quote
+class CashoutView(View):
+    def __init__(self, user_id: int, bet_id: int, version: int, wager: dict, value: float):
+        super().__init__(timeout=cashout.QUOTE_SECONDS)
+
+        accept_button = Button(style=discord.ButtonStyle.success, label=f"Cash out ₾{value:,.2f}", emoji="💵")
+        self.add_item(accept_button)
+
+        async def accept_callback(interaction: discord.Interaction):
+            if interaction.user.id != user_id:
+                await interaction.response.send_message("This isn't your quote!", ephemeral=True)
+                return
+            self.stop()
+
+            if settle_cashout(interaction.guild_id, user_id, bet_id, version, wager, value):
+                await interaction.response.edit_message(
+                    content=f"✅ Cashed out ₾**{value:,.2f}** {CURRENCY_NAME}🤑 from Bet ID #{bet_id}",
+                    embed=None, view=None
+                )
+            else:
+                await interaction.response.edit_message(
+                    content="❌ The odds moved or the line was locked, run /cashout again for a new quote",
+                    embed=None, view=None
+                )
+
+        accept_button.callback = accept_callback
+
+# Quote a price for an open wager, from the in-memory odds board or else the line itself
+@client.tree.command(name="cashout", description="Sell your bet back before the line resolves, usage: /cashout <bet ID>")
+@rate_limiter.limit()
+async def cash_out(interaction: discord.Interaction, bet_id: int):
+
+    if not in_channel(interaction, "betting_channel"):
+        await interaction.response.send_message("You can only cash out in the #betting channel!", ephemeral=True)
+        return
+
+    user = await ensure_user_exists(interaction.guild_id, interaction.user.id)
+    wager = next((wager for wager in user.get("bets", []) if wager["bet_id"] == bet_id), None)
+    if wager is None:
+        await interaction.response.send_message(f"❌ You don't have an open bet on #{bet_id}!", ephemeral=True)
+        return
+
+    message_id, line = odds_board.find(interaction.guild_id, bet_id)
+    if line is None:
+        # Lines opened on another replica aren't on this board yet
+        line = await asyncio.to_thread(bets_collection.find_one, {"guild_id": interaction.guild_id, "id": bet_id}, CASHOUT_FIELDS)
+        if line is not None:
+            message_id = line["message_id"]
+            line = {**line, "locked": line["locked"] or "settling" in line, "version": line.get("version", 0)}
+    if line is None or line["locked"]:
+        await interaction.response.send_message("❌ This line is locked, bets can't be cashed out any more!", ephemeral=True)
+        return
+
+    # Accepting checks the line is still at this version
+    version = line["version"]
+    fair = fair_values.get(message_id, version, line["outcomes"])
+    value = cashout.quote(wager, fair, CASHOUT_MARGIN)
+
+    embed = discord.Embed(
+        title="💵 Cash Out Quote",
+        description=f"**{line['title']}** (Bet ID: #{bet_id})",
+        color=0x03c2fc
+    )
+    embed.add_field(
+        name="Your Bet",
+        value=f"Outcome: **{wager['outcome']}**\n"
+              f"Wagered: ₾**{wager['amount']:,.2f}** | Potential Payout: ₾**{wager['payout']:,.2f}**",
+        inline=False
+    )
+    embed.add_field(name="Cash Out Now", value=f"₾**{value:,.2f}** {CURRENCY_NAME}🤑", inline=False)
+    embed.set_footer(text=f"Quote valid for {cashout.QUOTE_SECONDS}s, or until the odds change")
+
+    view = CashoutView(interaction.user.id, bet_id, version, wager, value)
+    await interaction.response.send_message(embed=embed, view=view, ephemeral=True)
+
+# Edit a betting line's embed with new odds and save them
+async def push_odds(bet, outcomes: str):
     betting_data = odds(outcomes)
-    message_id = bet["message_id"]
-    channel_id = bet["channel_id"]
-    channel = client.get_channel(channel_id)
-    message = await channel.fetch_message(message_id)
+    channel = client.get_channel(bet["channel_id"])
+    message = await channel.fetch_message(bet["message_id"])
 
     old_embed = message.embeds[0]
     new_embed = discord.Embed(
@@ -573,151 +1218,166 @@ async def update_odds(interaction: discord.Interaction, bet_id: int, outcomes: s
     new_embed.set_footer(text=old_embed.footer.text)
 
     await message.edit(embed=new_embed)
-    bets_collection.update_one({"id": bet_id}, {"$set": {"outcomes": outcomes}})
-
-    await interaction.response.send_message(f"Updated odds for bet ID {bet_id}", ephemeral=True)
+    # A new version invalidates every cash out quote on the line
+    bets_collection.update_one({"_id": bet["_id"]}, {"$set": {"outcomes": outcomes}, "$inc": {"version": 1}})
+    odds_board.update(bet["guild_id"], bet["message_id"], outcomes=outcomes)
+
+# Called by the repricer once a line's debounce window has passed, the quote it passes only has this replica's view
+async def auto_update_odds(line_id: ObjectId, outcomes: str):
+    bet = bets_collection.find_one({"_id": line_id})
+    if not bet or bet["locked"]:
+        repricer.forget(line_id)
+        return
+    # Price from what is stored on the line, which has every replica's bets and the latest /uo
+    betting_data = odds(bet.get("base_outcomes", bet["outcomes"]))
+    repricer.track(line_id, betting_data, pricing.handle_list(bet, len(betting_data)), pricing.handle_list(bet, len(betting_data), "payouts"))
+    outcomes = repricer.quote(line_id)
+    if outcomes == bet["outcomes"]:
+        return  # Another replica already posted this price
+    await push_odds(bet, outcomes)
+
+repricer = pricing.Repricer(
+    auto_update_odds,
+    model=functools.partial(pricing.MODELS[PRICING_MODEL], margin=PRICING_MARGIN),
+    delay=PRICING_DEBOUNCE,
+    max_exposure=PRICING_MAX_EXPOSURE
+)
 
-# Close/anull a betting line
-@client.tree.command(name="close", description="Close a betting line, usage: !close <bet ID> <reason>", guild=GUILD_ID)
-async def close_bet(interaction: discord.Interaction, bet_id: int, reason: str):
+# Update odds for a betting line
+@client.tree.command(name="uo", description="Update odds for a betting line, usage: !uo <bet ID> <outcomes|probabilities>")
+async def update_odds(interaction: discord.Interaction, bet_id: int, outcomes: str):
     if not interaction.user.guild_permissions.administrator:
         await interaction.response.send_message("You don't have permission to use this command!", ephemeral=True)
         return
     
-    bet = bets_collection.find_one({"id": bet_id})
+    bet = bets_collection.find_one({"guild_id": interaction.guild_id, "id": bet_id})
     if not bet:
         await interaction.response.send_message(f"Bet with ID {bet_id} not found!", ephemeral=True)
         return
     
-    title = bet["title"]
-    participants = bet["participants"]
-    
-    # Process refunds for each participant
-    for user_id in participants:
-        user_doc = users_collection.find_one({"_id": user_id})
-        if user_doc and "bets" in user_doc:
-            # Find the specific bet for this user
-            for user_bet in user_doc["bets"]:
-                if user_bet.get("bet_id") == bet_id:
-                    # Refund the wagered amount
-                    amount_wagered = user_bet.get("amount", 0)
-                    users_collection.update_one(
-                        {"_id": user_id},
-                        {
-                            "$inc": {"balance": amount_wagered},  # Refund the amount
-                            "$pull": {"bets": {"bet_id": bet_id}}  # Remove the bet
-                        }
-                    )
-    
-    # Delete the bet
-    bets_collection.delete_one({"id": bet_id})
-    
-    # Delete the original message
+    await push_odds(bet, outcomes)
+
+    # A manual update becomes the new opening line for auto-pricing
+    bets_collection.update_one({"_id": bet["_id"]}, {"$set": {"base_outcomes": outcomes}})
+    repricer.rebase(bet["_id"], odds(outcomes))
+
+    await interaction.response.send_message(f"Updated odds for bet ID {bet_id}", ephemeral=True)
+
+# Background jobs for settling betting lines
+SETTLE_BATCH_SIZE = 50
+job_queue = jobs.JobQueue(jobs_collection, concurrency=JOB_CONCURRENCY, can_claim=lambda: scheduler_lease.is_leader)
+
+# Settle participants batch by batch, saving progress after each one
+async def settle_participants(queue, job, settle_batch):
+    progress = job["progress"]
+    progress.setdefault("done", 0)
+    while True:
+        # Re-read the line so wagers confirmed after the job was queued are settled too
+        bet = bets_collection.find_one({"_id": job["params"]["line"]})
+        participants = bet["participants"] if bet else []
+        if progress["done"] >= len(participants):
+            return
+        batch = participants[progress["done"]:progress["done"] + SETTLE_BATCH_SIZE]
+        await settle_batch(batch)
+        progress["done"] += len(batch)
+        await asyncio.to_thread(queue.checkpoint, job, progress)
+
+# Remove a settled line's message and document
+async def remove_line(job):
+    params = job["params"]
+    await client.wait_until_ready()
+    channel = client.get_channel(params["line_channel_id"])
     try:
-        message = await interaction.channel.fetch_message(bet["message_id"])
+        message = await channel.fetch_message(params["message_id"])
         await message.delete()
     except:
         pass  # Message might already be deleted
 
+    bets_collection.delete_one({"_id": params["line"]})
+    repricer.forget(params["line"])
+
+# Post a job's result embed once, even if the job is resumed afterwards
+async def announce(queue, job, embed):
+    progress = job["progress"]
+    if progress.get("announced"):
+        return
+    await client.wait_until_ready()
+    channel = client.get_channel(job["params"]["channel_id"])
+    await channel.send(embed=embed)
+    progress["announced"] = True
+    await asyncio.to_thread(queue.checkpoint, job, progress)
+
+# Keep only what the results embed needs from a parlay summary
+def parlay_summary(parlay_results):
+    return {
+        "won": [{"user_id": p["user_id"], "payout": p["payout"], "amount": p["amount"]} for p in parlay_results["won"]],
+        "lost": [{"user_id": p["user_id"], "amount": p["amount"]} for p in parlay_results["lost"]],
+        "alive": len(parlay_results["alive"])
+    }
+
+@job_queue.handler("close")
+async def run_close_job(queue, job):
+    params = job["params"]
+    bet_id = params["bet_id"]
+
+    # Process refunds for each participant
+    async def refund(batch):
+        await asyncio.to_thread(settlement.refund_batch, users_collection, ledger_collection, job["_id"], params["guild_id"], bet_id, batch)
+    await settle_participants(queue, job, refund)
+
+    # Void this line's leg in every open parlay
+    await asyncio.to_thread(parlays.settle_leg, parlays_collection, users_collection, ledger_collection, daily_stats_collection, params["guild_id"], bet_id)
+
     # Create ping string for all participants
-    toPing = " ".join(f"<@{user_id}>" for user_id in participants)
+    toPing = " ".join(f"<@{user_id}>" for user_id in params["participants"])
 
     embed = discord.Embed(
         title="Betting Line Closed",
-        description=f"""Please be alerted that Bet ID #{bet_id} "**{title}**" has been annulled.\nAll wagered amounts have been refunded.""",
+        description=f"""Please be alerted that Bet ID #{bet_id} "**{params['title']}**" has been annulled.\nAll wagered amounts have been refunded.""",
         color=0xff0000  # Red color for closure
     )
-    embed.add_field(name="Reason", value=reason, inline=False)
+    embed.add_field(name="Reason", value=params["reason"], inline=False)
     if toPing:
         embed.add_field(name="Relevant Participants", value=toPing, inline=False)
 
-    await interaction.response.send_message(embed=embed)
+    await announce(queue, job, embed)
+    await remove_line(job)
+
+@job_queue.handler("resolve")
+async def run_resolve_job(queue, job):
+    params = job["params"]
+    bet_id = params["bet_id"]
+    progress = job["progress"]
+    progress.setdefault("winners", [])
+    progress.setdefault("losers", [])
 
-# Resolve a betting line
-@client.tree.command(name="resolve", description="Resolve a betting line", guild=GUILD_ID)
-async def resolve_bet(interaction: discord.Interaction, bet_id: int, winning_outcome: int, outcome: str):
-    if not interaction.user.guild_permissions.administrator:
-        await interaction.response.send_message("You don't have permission to use this command!", ephemeral=True)
-        return
-    
-    # Find the bet
-    bet = bets_collection.find_one({"id": bet_id})
-    if not bet:
-        await interaction.response.send_message(f"Bet with ID {bet_id} not found!", ephemeral=True)
-        return
-    
-    title = bet["title"]
-    participants = bet["participants"]
-    winners = []
-    losers = []
-    
     # Process payouts for each participant
-    for user_id in participants:
-        user_info = users_collection.find_one({"_id": user_id})
-        if not user_info or "bets" not in user_info:
-            continue
-        
-        # Find the relevant bet
-        relevant_bet = next(
-            (bet for bet in user_info["bets"] if bet["bet_id"] == bet_id),
-            None
+    async def pay(batch):
+        winners, losers = await asyncio.to_thread(
+            settlement.resolve_batch, users_collection, ledger_collection, daily_stats_collection, job["_id"],
+            params["guild_id"], bet_id, params["winning_outcome"], params["title"], batch
         )
-        
-        if relevant_bet:
-            amount_wagered = relevant_bet["amount"]
-            predicted = relevant_bet["outcome"]
-            outcome_num = relevant_bet["outcome_num"]
-            potential_payout = relevant_bet["payout"]
-            
-            if outcome_num == winning_outcome:
-                # User won
-                receipt = {
-                    "bet": title,
-                    "result": "win",
-                    "prediction": predicted,
-                    "wagered": amount_wagered,
-                    "amount_won": potential_payout - amount_wagered,
-                    "resolved_at": datetime.now()
-                }
-                users_collection.update_one(
-                    {"_id": user_id},
-                    {
-                        "$inc": {"balance": potential_payout},
-                        "$pull": {"bets": {"bet_id": bet_id}},
-                        "$push": {"history": receipt}
-                    }
-                )
-                winners.append({
-                    "user_id": user_id,
-                    "payout": potential_payout,
-                    "wagered": amount_wagered
-                })
-            else:
-                # User lost
-                receipt = {
-                    "bet": title,
-                    "result": "loss",
-                    "prediction": predicted,
-                    "wagered": amount_wagered,
-                    "resolved_at": datetime.now()
-                }
-                # Fixed update operation for losers
-                users_collection.update_one(
-                    {"_id": user_id},
-                    {
-                        "$pull": {"bets": {"bet_id": bet_id}},
-                        "$push": {"history": receipt}
-                    }
-                )
-                losers.append({
-                    "user_id": user_id,
-                    "wagered": amount_wagered
-                })
-    
+        progress["winners"] += winners
+        progress["losers"] += losers
+    await settle_participants(queue, job, pay)
+
+    # Settle this line's leg in every open parlay
+    if "parlays" not in progress:
+        parlay_results = await asyncio.to_thread(
+            parlays.settle_leg, parlays_collection, users_collection, ledger_collection, daily_stats_collection,
+            params["guild_id"], bet_id, params["winning_outcome"]
+        )
+        progress["parlays"] = parlay_summary(parlay_results)
+        await asyncio.to_thread(queue.checkpoint, job, progress)
+
+    winners = progress["winners"]
+    losers = progress["losers"]
+    parlay_results = progress["parlays"]
+
     # Create result embed
     embed = discord.Embed(
         title="🎲 Betting Results",
-        description=f"Results for **{title}**\nWinning Outcome: **{outcome}**",
+        description=f"Results for **{params['title']}**\nWinning Outcome: **{params['outcome']}**",
         color=0x00ff00
     )
     
@@ -736,32 +1396,187 @@ async def resolve_bet(interaction: discord.Interaction, bet_id: int, winning_out
             for l in losers
         )
         embed.add_field(name="❌ Losers", value=losers_text, inline=False)
+
+    # Add parlays section
+    if parlay_results["won"] or parlay_results["lost"] or parlay_results["alive"]:
+        parlay_lines = [
+            f"<@{p['user_id']}> - Parlay won ₾**{p['payout']:,.2f}** (Bet: ₾{p['amount']:,.2f})"
+            for p in parlay_results["won"]
+        ]
+        parlay_lines += [
+            f"<@{p['user_id']}> - Parlay lost ₾**{p['amount']:,.2f}**"
+            for p in parlay_results["lost"]
+        ]
+        if parlay_results["alive"]:
+            parlay_lines.append(f"{parlay_results['alive']} parlay(s) still alive")
+        embed.add_field(name="🔗 Parlays", value="\n".join(parlay_lines), inline=False)
+
+    await announce(queue, job, embed)
+    await remove_line(job)
+
+# Queue a settlement job for a betting line and acknowledge the admin straight away
+async def queue_settlement(interaction: discord.Interaction, type: str, bet, **params):
+    await interaction.response.defer(ephemeral=True, thinking=True)
+
+    # Claim the line for this job, so a /close and a /resolve on the same line can't both settle it.
+    # No new wagers while the line is being settled
+    job_id = job_queue.job_id(type, bet["message_id"])
+    claimed = bets_collection.find_one_and_update(
+        {"_id": bet["_id"], "$or": [{"settling": {"$exists": False}}, {"settling": job_id}]},
+        {"$set": {"locked": True, "settling": job_id}}
+    )
+    if claimed is None:
+        bet = bets_collection.find_one({"_id": bet["_id"]})
+        if bet is None:
+            await interaction.followup.send("This betting line has already been settled!", ephemeral=True)
+            return
+        job = job_queue.get(bet["settling"])
+        status = job["status"] if job else "queued"
+        await interaction.followup.send(f"Bet ID #{bet['id']} is already being settled by job `{bet['settling']}` ({status})", ephemeral=True)
+        return
+
+    repricer.forget(bet["_id"])
+    odds_board.remove(bet["guild_id"], bet["message_id"])
+    fair_values.forget(bet["message_id"])
+
+    # Same job ID as the claim, so retrying after a crash between the two picks the job back up
+    job, created = job_queue.enqueue(type, bet["message_id"], {
+        "line": bet["_id"],
+        "guild_id": bet["guild_id"],
+        "bet_id": bet["id"],
+        "title": bet["title"],
+        "participants": bet["participants"],
+        "message_id": bet["message_id"],
+        "line_channel_id": bet["channel_id"],
+        "channel_id": interaction.channel.id,
+        **params
+    })
+    if created:
+        await interaction.followup.send(f"⏳ Bet ID #{bet['id']} is being settled, job `{job['_id']}`", ephemeral=True)
+    else:
+        await interaction.followup.send(f"Bet ID #{bet['id']} already has job `{job['_id']}` ({job['status']})", ephemeral=True)
+
+# Close/anull a betting line
+@client.tree.command(name="close", description="Close a betting line, usage: !close <bet ID> <reason>")
+async def close_bet(interaction: discord.Interaction, bet_id: int, reason: str):
+    if not interaction.user.guild_permissions.administrator:
+        await interaction.response.send_message("You don't have permission to use this command!", ephemeral=True)
+        return
     
-    # Delete the original bet message
-    try:
-        message = await interaction.channel.fetch_message(bet["message_id"])
-        await message.delete()
-    except:
-        pass
-    
-    # Delete the bet from database
-    bets_collection.delete_one({"id": bet_id})
+    bet = bets_collection.find_one({"guild_id": interaction.guild_id, "id": bet_id})
+    if not bet:
+        await interaction.response.send_message(f"Bet with ID {bet_id} not found!", ephemeral=True)
+        return
+
+    await queue_settlement(interaction, "close", bet, reason=reason)
+
+# Resolve a betting line
+@client.tree.command(name="resolve", description="Resolve a betting line")
+async def resolve_bet(interaction: discord.Interaction, bet_id: int, winning_outcome: int, outcome: str):
+    if not interaction.user.guild_permissions.administrator:
+        await interaction.response.send_message("You don't have permission to use this command!", ephemeral=True)
+        return
     
-    await interaction.response.send_message(embed=embed)
+    # Find the bet
+    bet = bets_collection.find_one({"guild_id": interaction.guild_id, "id": bet_id})
+    if not bet:
+        await interaction.response.send_message(f"Bet with ID {bet_id} not found!", ephemeral=True)
+        return
+
+    await queue_settlement(interaction, "resolve", bet, winning_outcome=winning_outcome, outcome=outcome)
+
+# Check the progress of a settlement job
+@client.tree.command(name="job", description="Check a settlement job, or retry a failed one, usage: /job <job ID> <retry (optional)>")
+async def job_status(interaction: discord.Interaction, job_id: str, retry: bool = False):
+    if not interaction.user.guild_permissions.administrator:
+        await interaction.response.send_message("You don't have permission to use this command!", ephemeral=True)
+        return
+
+    job = job_queue.get(job_id)
+    if not job or job["params"]["guild_id"] != interaction.guild_id:
+        await interaction.response.send_message(f"Job `{job_id}` not found!", ephemeral=True)
+        return
+
+    # Failed jobs resume from their last checkpoint, so nobody is paid twice
+    if retry:
+        if not job_queue.retry(job_id):
+            await interaction.response.send_message(f"Job `{job_id}` hasn't failed ({job['status']}), nothing to retry", ephemeral=True)
+            return
+        job = job_queue.get(job_id)
+
+    params = job["params"]
+    embed = discord.Embed(
+        title=f"⚙️ Job {job['_id']}",
+        description=f"{job['type'].capitalize()} Bet ID #{params['bet_id']} - **{params['title']}**",
+        color=0x03c2fc
+    )
+    embed.add_field(name="Status", value=job["status"], inline=True)
+    embed.add_field(name="Settled", value=f"{job['progress'].get('done', 0)}/{len(params['participants'])}", inline=True)
+    embed.add_field(name="Attempts", value=str(job["attempts"]), inline=True)
+    if job.get("error"):
+        embed.add_field(name="Last Error", value=job["error"][:1024], inline=False)
+    embed.set_footer(text=f"Queued {job['created_at'].strftime('%m/%d/%Y %I:%M %p')}")
+
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
+# Check balances against the ledger
+@client.tree.command(name="audit", description="Check balances against the ledger, usage: /audit <user (optional)> <MM/DD/YYYY HH:MM (optional)>")
+async def audit(interaction: discord.Interaction, user: discord.Member = None, at: str = None):
+    if not interaction.user.guild_permissions.administrator:
+        await interaction.response.send_message("You don't have permission to use this command!", ephemeral=True)
+        return
+
+    await interaction.response.defer(ephemeral=True, thinking=True)
+
+    # Rebuild a single user's balance at a point in time
+    if user is not None:
+        try:
+            when = datetime.strptime(at, "%m/%d/%Y %H:%M") if at is not None else None
+        except ValueError:
+            await interaction.followup.send("❌ Invalid date format. Please use MM/DD/YYYY HH:MM (24-hour format)", ephemeral=True)
+            return
+        rebuilt = await asyncio.to_thread(ledger.balance_at, ledger_collection, snapshots_collection, interaction.guild_id, user.id, when)
+        current = await get_balance(interaction.guild_id, user.id)
+        embed = discord.Embed(title=f"📒 Ledger - {user.display_name}", color=0x03c2fc)
+        embed.add_field(name=f"Balance {'at ' + locktime(at) if at else 'from ledger'}", value=f"₾{rebuilt:,.2f} {CURRENCY_NAME}🤑", inline=False)
+        embed.add_field(name="Current Balance", value=f"₾{current:,.2f} {CURRENCY_NAME}🤑", inline=False)
+        await interaction.followup.send(embed=embed, ephemeral=True)
+        return
+
+    mismatches = await asyncio.to_thread(ledger.verify, users_collection, ledger_collection, interaction.guild_id)
+    if not mismatches:
+        await interaction.followup.send("✅ Every balance matches the ledger", ephemeral=True)
+        return
+
+    lines = [
+        f"<@{user_id}> - Balance: {balance if balance is not None else 'missing'}, Ledger: {total if total is not None else 'missing'}"
+        for (_, user_id), balance, total in mismatches[:20]
+    ]
+    if len(mismatches) > 20:
+        lines.append(f"...and {len(mismatches) - 20} more")
+    embed = discord.Embed(
+        title=f"❌ {len(mismatches)} balance(s) don't match the ledger",
+        description="\n".join(lines),
+        color=0xff0000
+    )
+    await interaction.followup.send(embed=embed, ephemeral=True)
 
 # See open bets
-@client.tree.command(name="open", description="View your open bets", guild=GUILD_ID)
+@client.tree.command(name="open", description="View your open bets")
+@rate_limiter.limit()
 async def open_bets(interaction: discord.Interaction, user: discord.Member = None):
 
-    if interaction.channel.id != int(BETTING_CHANNEL):
+    if not in_channel(interaction, "betting_channel"):
         await interaction.response.send_message("You can only view open bets in the #betting channel!", ephemeral=True)
         return
 
     # Get target user and ensure they exist in database
     target_user = user if user else interaction.user
-    user_data = await ensure_user_exists(target_user.id)
+    user_data = await ensure_user_exists(interaction.guild_id, target_user.id)
+    user_data.setdefault("bets", [])
+    open_parlays = list(parlays_collection.find({"guild_id": interaction.guild_id, "user_id": target_user.id, "status": "open"}))
 
-    if "bets" not in user_data or not user_data["bets"]:
+    if not user_data["bets"] and not open_parlays:
         await interaction.response.send_message(
             f"No open bets found for {target_user.display_name}!", 
             ephemeral=True
@@ -779,7 +1594,7 @@ async def open_bets(interaction: discord.Interaction, user: discord.Member = Non
     
     for placed in user_data["bets"]:
         try:
-            bet = bets_collection.find_one({"id": placed["bet_id"]})
+            bet = bets_collection.find_one({"guild_id": interaction.guild_id, "id": placed["bet_id"]})
             if not bet:
                 continue  # Skip if bet doesn't exist anymore
                 
@@ -804,10 +1619,27 @@ async def open_bets(interaction: discord.Interaction, user: discord.Member = Non
             print(f"Error processing bet {placed.get('bet_id')}: {str(e)}")
             continue
 
+    for parlay in open_parlays:
+        total_potential += parlay["payout"]
+        total_wagered += parlay["amount"]
+
+        legs_text = "\n".join(
+            f"{'✅' if leg['result'] == 'win' else '➖' if leg['result'] == 'void' else '⏳'} #{leg['bet_id']} {leg['title']}: **{leg['outcome']}**"
+            for leg in parlay["legs"]
+        )
+        embed.add_field(
+            name=f"🔗 Parlay - {len(parlay['legs'])} legs",
+            value=(f"{legs_text}\n"
+                  f"Wagered Amount: ₾**{parlay['amount']:,.2f}** {CURRENCY_NAME}🤑\n"
+                  f"Potential Payout: ₾**{parlay['payout']:,.2f}** {CURRENCY_NAME}🤑\n"
+                  f"Placed: {parlay['placed_at'].strftime('%m/%d/%Y %I:%M %p')}"),
+            inline=False
+        )
+
     # Add summary field
-    if user_data["bets"]:
+    if user_data["bets"] or open_parlays:
         summary = (
-            f"Total Bets: **{len(user_data['bets'])}**\n"
+            f"Total Bets: **{len(user_data['bets']) + len(open_parlays)}**\n"
             f"Total Wagered: ₾**{total_wagered:,.2f}** {CURRENCY_NAME}🤑\n"
             f"Total Potential Payout: ₾**{total_potential:,.2f}** {CURRENCY_NAME}🤑"
         )
@@ -822,17 +1654,68 @@ async def open_bets(interaction: discord.Interaction, user: discord.Member = Non
     
     await interaction.response.send_message(embed=embed)
 
+# Recently rendered balance charts
+chart_cache = charts.ChartCache()
+
+# Chart of a user's balance and betting profit over time
+@client.tree.command(name="graph", description="Chart your balance and betting profit over time")
+@app_commands.choices(period=[app_commands.Choice(name=period, value=period) for period in charts.RANGES])
+@rate_limiter.limit(concurrency=2)
+async def graph(interaction: discord.Interaction, user: discord.Member = None, period: app_commands.Choice[str] = None):
+
+    if not in_channel(interaction, "betting_channel"):
+        await interaction.response.send_message("You can only view charts in the #betting channel!", ephemeral=True)
+        return
+
+    target_user = user if user else interaction.user
+    period = period.value if period else "30d"
+    user_data = await ensure_user_exists(interaction.guild_id, target_user.id)
+    balances, profits = await asyncio.to_thread(
+        charts.series, snapshots_collection, daily_stats_collection,
+        interaction.guild_id, target_user.id, user_data["balance"], period
+    )
+
+    key = (interaction.guild_id, target_user.id, period, charts.version(balances, profits))
+    chart = chart_cache.get(key)
+    if chart is None:
+        await interaction.response.defer(thinking=True)
+        try:
+            chart = await asyncio.get_running_loop().run_in_executor(
+                client.chart_pool, charts.render,
+                f"{target_user.display_name} - {period}", balances, profits, CURRENCY_NAME
+            )
+        except Exception as e:
+            print(f"Failed to render chart for {target_user.id}: {e}")
+            await interaction.followup.send("❌ Couldn't draw the chart right now, try again later", ephemeral=True)
+            return
+        chart_cache.put(key, chart)
+
+    embed = discord.Embed(
+        title=f"📈 {target_user.display_name}'s {CURRENCY_NAME}",
+        description=f"Balance and betting profit, {period}",
+        color=0x03c2fc
+    )
+    embed.set_image(url="attachment://graph.png")
+    embed.set_footer(text=f"Current balance: ₾{user_data['balance']:,.2f}")
+    file = discord.File(io.BytesIO(chart), filename="graph.png")
+
+    if interaction.response.is_done():
+        await interaction.followup.send(embed=embed, file=file)
+    else:
+        await interaction.response.send_message(embed=embed, file=file)
+
 # See betting history
-@client.tree.command(name="history", description="View your betting history", guild=GUILD_ID)
+@client.tree.command(name="history", description="View your betting history")
+@rate_limiter.limit(concurrency=4)
 async def betting_history(interaction: discord.Interaction, user: discord.Member = None):
 
-    if interaction.channel.id != int(BETTING_CHANNEL):
+    if not in_channel(interaction, "betting_channel"):
         await interaction.response.send_message("You can only view your betting history in the #betting channel!", ephemeral=True)
         return
 
     # Get target user and ensure they exist in database
     target_user = user if user else interaction.user
-    user_data = await ensure_user_exists(target_user.id)
+    user_data = await ensure_user_exists(interaction.guild_id, target_user.id)
 
     if "history" not in user_data or not user_data["history"]:
         await interaction.response.send_message(
@@ -857,11 +1740,13 @@ async def betting_history(interaction: discord.Interaction, user: discord.Member
         resolved_at = receipt["resolved_at"]
         
         # Emoji based on result
-        result_emoji = "✅" if result == "win" else "❌"
+        result_emoji = {"win": "✅", "cashout": "💵"}.get(result, "❌")
         
         if result == "win":
             amount_won = receipt["amount_won"]
             value = f"**Won ₾{amount_won:,.2f}** (Bet: ₾{wagered:,.2f})"
+        elif result == "cashout":
+            value = f"**Cashed out ₾{wagered + receipt['amount_won']:,.2f}** (Bet: ₾{wagered:,.2f})"
         else:
             value = f"**Lost ₾{wagered:,.2f}**"
         
@@ -880,8 +1765,8 @@ async def betting_history(interaction: discord.Interaction, user: discord.Member
     win_rate = (wins / total_bets) * 100 if total_bets > 0 else 0
     
     total_wagered = sum(bet["wagered"] for bet in user_data["history"])
-    total_won = sum(bet.get("amount_won", 0) for bet in user_data["history"] if bet["result"] == "win")
-    profit = total_won - total_wagered
+    # Wins and cash outs carry their profit in amount_won, the same way stats.py counts it
+    profit = sum(-bet["wagered"] if bet["result"] == "loss" else bet.get("amount_won", 0) for bet in user_data["history"])
     
     stats = (
         f"Total Bets: **{total_bets}**\n"
@@ -902,10 +1787,11 @@ async def betting_history(interaction: discord.Interaction, user: discord.Member
     await interaction.response.send_message(embed=embed)
 
 # User bet proposition
-@client.tree.command(name="proposal", description="Propose a bet, usage: <title> <description> <possible outcomes (comma separated)>", guild=GUILD_ID)
+@client.tree.command(name="proposal", description="Propose a bet, usage: <title> <description> <possible outcomes (comma separated)>")
+@rate_limiter.limit()
 async def bet_proposal(interaction: discord.Interaction, title: str, description: str, outcomes: str):
 
-    if interaction.channel.id != int(PROP_CHANNEL):
+    if not in_channel(interaction, "proposals_channel"):
         await interaction.response.send_message("You can only propose bets in the #proposals channel!", ephemeral=True)
         return
     
@@ -928,20 +1814,123 @@ async def bet_proposal(interaction: discord.Interaction, title: str, description
     embed.set_thumbnail(url="https://tikolu.net/i/tcicn.png")
     embed.set_footer(text="👍 Support | 👎 Oppose | ❓ Need Clarification")
 
-    # Send the proposal
+    # Send the proposal and store it, so its votes can be tallied
     await interaction.response.send_message(embed=embed)
     message = await interaction.original_response()
-    
-    # Add reactions
-    reactions = ["👍", "👎", "❓"]
-    for reaction in reactions:
-        await message.add_reaction(reaction)
+    proposals.create(
+        proposals_collection, interaction.guild_id, interaction.user.id, message.id,
+        interaction.channel.id, title, description, outcomes
+    )
+
+    # Add reactions all at once instead of one round trip after another
+    await asyncio.gather(*(message.add_reaction(reaction) for reaction in proposals.VOTES))
+
+# Admins: sample what the event loop is doing and upload the profile
+@client.tree.command(name="profile", description="Profile the bot for a few seconds, usage: /profile <seconds>")
+async def profile(interaction: discord.Interaction, seconds: int = 30):
+    if not interaction.user.guild_permissions.administrator:
+        await interaction.response.send_message("You don't have permission to use this command!", ephemeral=True)
+        return
+
+    seconds = max(1, min(seconds, profiler.MAX_SECONDS))
+    path = client.profiler.start(seconds)
+    if path is None:
+        await interaction.response.send_message("⏳ A profile is already running, try again when it's done", ephemeral=True)
+        return
+    await interaction.response.send_message(f"🔬 Profiling for {seconds}s...", ephemeral=True)
+
+    while client.profiler.running:
+        await asyncio.sleep(1)
+    await interaction.followup.send(
+        "✅ Collapsed stacks, open with speedscope.app or flamegraph.pl",
+        file=discord.File(path),
+        ephemeral=True
+    )
+
+# Admins: ranked queue of open proposals
+@client.tree.command(name="queue", description="View the top open bet proposals by votes")
+async def proposal_queue(interaction: discord.Interaction):
+    if not interaction.user.guild_permissions.administrator:
+        await interaction.response.send_message("You don't have permission to use this command!", ephemeral=True)
+        return
+
+    queued = proposals.queue(proposals_collection, interaction.guild_id)
+    embed = discord.Embed(
+        title="🗳️ Proposal Queue",
+        description="Open proposals, most supported first. Use /promote <proposal #> <probabilities> to turn one into a betting line",
+        color=0x03c2fc
+    )
+    config = guild_configs.get(interaction.guild_id)
+    for proposal in queued:
+        votes = proposal["votes"]
+        link = f"https://discord.com/channels/{interaction.guild_id}/{proposal['channel_id']}/{proposal['message_id']}"
+        embed.add_field(
+            name=f"#{proposal['id']} - {proposal['title']} (score {proposal['score']:+})",
+            value=(f"👍 {votes['up']} | 👎 {votes['down']} | ❓ {votes['unclear']}\n"
+                   f"Outcomes: {', '.join(proposal['outcomes'])}\n"
+                   f"By <@{proposal['user_id']}> - [view]({link})"),
+            inline=False
+        )
+    if not queued:
+        embed.add_field(name="Nothing queued", value=f"No open proposals in <#{config.get('proposals_channel')}>", inline=False)
+
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
+# Admins: post a proposal as a betting line
+@client.tree.command(name="promote", description="Turn a proposal into a betting line, usage: /promote <proposal #> <probabilities (comma separated)> <lock>")
+async def promote_proposal(interaction: discord.Interaction, proposal_id: int, probabilities: str, locks: str = None, auto_price: bool = False):
+    if not interaction.user.guild_permissions.administrator:
+        await interaction.response.send_message("You don't have permission to use this command!", ephemeral=True)
+        return
+
+    channel = client.get_channel(guild_configs.get(interaction.guild_id).get("betting_channel"))
+    if channel is None:
+        await interaction.response.send_message("Set up a betting channel with /setup first!", ephemeral=True)
+        return
+
+    proposal = proposals_collection.find_one({"guild_id": interaction.guild_id, "id": proposal_id, "status": "open"})
+    if proposal is None:
+        await interaction.response.send_message(f"❌ No open proposal #{proposal_id}", ephemeral=True)
+        return
+
+    # Check the odds before taking the proposal off the queue. Lines go live as soon as they
+    # are posted, so the admin has to price them, there is no even-odds default
+    try:
+        probabilities = [float(probability) for probability in probabilities.split(",")]
+        outcomes = proposals.outcomes_string(proposal["outcomes"], probabilities)
+        betting_data = odds(outcomes)
+        if locks is not None:
+            locktime(locks)
+    except ValueError as e:
+        await interaction.response.send_message(f"❌ {e}", ephemeral=True)
+        return
+
+    proposal = proposals.promote(proposals_collection, interaction.guild_id, proposal_id)
+    if proposal is None:
+        await interaction.response.send_message(f"❌ Proposal #{proposal_id} was already promoted", ephemeral=True)
+        return
+
+    bet_id = next_bet_id(interaction.guild_id)
+    try:
+        message = await channel.send(embed=line_embed(bet_id, proposal["title"], proposal["description"], betting_data, locks), view=LockButton())
+    except discord.HTTPException as e:
+        proposals.reopen(proposals_collection, proposal)
+        await interaction.response.send_message(f"❌ Couldn't post the line: {e}", ephemeral=True)
+        return
+
+    save_line(interaction.guild_id, bet_id, message, proposal["title"], outcomes, betting_data, locks, auto_price=auto_price)
+    proposals.link(proposals_collection, proposal, bet_id)
+    await interaction.response.send_message(
+        f"✅ Proposal #{proposal_id} is now Bet ID #{bet_id} in {channel.mention}. Adjust the odds with /uo if needed",
+        ephemeral=True
+    )
 
 # Help command to show all available commands
-@client.tree.command(name="help", description="Show available commands", guild=GUILD_ID)
+@client.tree.command(name="help", description="Show available commands")
+@rate_limiter.limit()
 async def help_command(interaction: discord.Interaction):
 
-    if interaction.channel.id != int(BETTING_CHANNEL):
+    if not in_channel(interaction, "betting_channel"):
         await interaction.response.send_message("You can only use /help in the #betting channel!", ephemeral=True)
         return
 
@@ -953,13 +1942,16 @@ async def help_command(interaction: discord.Interaction):
     
     commands = [
         "**/bal** <user (optional)> - Check your balance or another user's balance 💰",
-        "**/leader** - View top 5 richest users 🤑",
+        "**/leader** <board (optional)> <window (optional)> - View top 5 users by balance, profit, ROI or win rate 🤑",
         "**/daily** - Claim your daily reward 🏆",
         f"**/give** <amount> <user> - Give another user some {CURRENCY_NAME}",
         "**/bet** <bet id> <outcome #> <amount> - Place a bet 🎲",
+        "**/parlay** <bet id:outcome #, ...> <amount> - Combine bets on several lines 🔗",
         "**/open** <user (optional)> - View your own or another user's open bets 📖",
+        "**/cashout** <bet id> - Sell your bet back before the line resolves 💵",
         "**/history** <user (optional)> - View your own or another user's betting history",
-        "**/proposal** <title> <descr> <outcomes> - Propose a bet (In the #proposals channel)",
+        "**/graph** <user (optional)> <period (optional)> - Chart balance and profit over time 📈",
+        "**/proposal** <title> <descr> <outcomes> - Propose a bet (In the #proposals channel), vote with 👍 👎 ❓",
     ]
     
     embed.add_field(
@@ -973,7 +1965,8 @@ async def help_command(interaction: discord.Interaction):
 
     await interaction.response.send_message(embed=embed)
 
-# Start the bot
-TOKEN = os.getenv('DISCORD_TOKEN')
-webserver.keep_alive()
-client.run(TOKEN)
+# Start the bot (guarded so chart worker processes can import this module)
+if __name__ == "__main__":
+    TOKEN = os.getenv('DISCORD_TOKEN')
+    webserver.keep_alive()
+    client.run(TOKEN)
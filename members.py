@@ -0,0 +1,65 @@
+import time
+from collections import OrderedDict
+import discord
+
+CACHE_SIZE = 512    # Names kept in memory
+TTL_SECONDS = 3600  # Nicknames change, so names are looked up again after this long
+
+def intents(lean):
+    """
+    Gateway intents. Every command is a slash command, so lean mode only asks for
+    guilds (channels and app commands) and reactions (bet confirmations, proposal votes).
+    """
+    if not lean:
+        intents = discord.Intents.default()
+        intents.message_content = True
+        return intents
+    return discord.Intents(guilds=True, guild_reactions=True)
+
+def cache_options(lean, max_messages):
+    """Client cache settings. Lean mode keeps no members and no messages unless asked to."""
+    if not lean:
+        return {}
+    return {
+        "member_cache_flags": discord.MemberCacheFlags.none(),
+        "max_messages": max_messages or None,
+        "chunk_guilds_at_startup": False
+    }
+
+class MemberNames:
+    """
+    Display names for users that aren't in the member cache, fetched on demand.
+    Small LRU keyed by (guild, user), so a busy leaderboard doesn't hit the API every time.
+    """
+    def __init__(self, client, size=CACHE_SIZE, ttl=TTL_SECONDS):
+        self.client = client
+        self.size = size
+        self.ttl = ttl
+        self.names = OrderedDict()   # (guild_id, user_id) -> (display name, fetched at)
+
+    async def get(self, guild, user_id):
+        """Returns: display name, or None if the user doesn't exist any more"""
+        member = guild.get_member(user_id)
+        if member is not None:
+            return member.display_name
+
+        key = (guild.id, user_id)
+        cached = self.names.get(key)
+        if cached is not None and time.monotonic() - cached[1] < self.ttl:
+            self.names.move_to_end(key)
+            return cached[0]
+
+        try:
+            name = (await guild.fetch_member(user_id)).display_name
+        except discord.NotFound:
+            # Left the guild, fall back to their global name
+            try:
+                name = (await self.client.fetch_user(user_id)).display_name
+            except discord.NotFound:
+                return None
+
+        self.names[key] = (name, time.monotonic())
+        self.names.move_to_end(key)
+        while len(self.names) > self.size:
+            self.names.popitem(last=False)
+        return name
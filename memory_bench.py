@@ -0,0 +1,162 @@
+"""
+Memory benchmark of the lean gateway mode against discord.py's default intents and caches.
+
+Usage: python memory_bench.py [--guilds 200] [--channels 20] [--members 1000] [--messages 50000]
+                              [--max-messages 0] [--json report.json]
+
+Each mode runs in its own process: a client is built with members.intents and
+members.cache_options exactly like main.py, then fed synthetic GUILD_CREATE and MESSAGE_CREATE
+payloads through its connection state, as the gateway would deliver them. The gateway only
+sends what the intents ask for, so members beyond the bot itself are only sent with the
+members intent and messages only with the guild messages intent. The report gives RSS,
+Python heap (tracemalloc) and cache sizes per mode.
+"""
+import argparse
+import gc
+import json
+import subprocess
+import sys
+import tracemalloc
+
+BOT_ID = 1
+
+def rss_mb():
+    """Resident set size of this process, from /proc on Linux and getrusage elsewhere (peak)"""
+    try:
+        with open("/proc/self/status") as file:
+            for line in file:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def user(id):
+    return {"id": str(id), "username": f"user{id}", "global_name": f"User {id}", "discriminator": "0", "avatar": None}
+
+def member(id):
+    return {"user": user(id), "roles": [], "joined_at": "2024-01-01T00:00:00+00:00", "deaf": False, "mute": False, "flags": 0}
+
+def guild_payload(guild_id, channels, members):
+    return {
+        "id": str(guild_id),
+        "name": f"Guild {guild_id}",
+        "owner_id": str(guild_id * 10000 + 1),
+        "member_count": members,
+        "large": members > 250,
+        "features": [],
+        "emojis": [],
+        "stickers": [],
+        "roles": [{"id": str(guild_id), "name": "@everyone", "permissions": "0", "position": 0, "color": 0,
+                   "hoist": False, "managed": False, "mentionable": False, "flags": 0}],
+        "channels": [{"id": str(guild_id * 1000 + i), "type": 0, "name": f"channel-{i}", "position": i,
+                      "permission_overwrites": [], "nsfw": False, "parent_id": None} for i in range(channels)],
+        "members": [member(BOT_ID)] + [member(guild_id * 10000 + i) for i in range(1, members)],
+        "voice_states": [],
+        "presences": [],
+        "threads": [],
+        "stage_instances": [],
+        "guild_scheduled_events": []
+    }
+
+def message_payload(id, guild_id, channel_id, author_id):
+    return {
+        "id": str(id),
+        "channel_id": str(channel_id),
+        "guild_id": str(guild_id),
+        "author": user(author_id),
+        "member": {"roles": [], "joined_at": "2024-01-01T00:00:00+00:00", "deaf": False, "mute": False, "flags": 0},
+        "content": f"message {id} with some typical chatter in it",
+        "timestamp": "2024-01-01T00:00:00+00:00",
+        "edited_timestamp": None,
+        "tts": False,
+        "mention_everyone": False,
+        "mentions": [],
+        "mention_roles": [],
+        "attachments": [],
+        "embeds": [],
+        "pinned": False,
+        "type": 0,
+        "flags": 0
+    }
+
+def measure(lean, guilds, channels, members_per_guild, messages, max_messages):
+    import discord
+    import members
+
+    gc.collect()
+    tracemalloc.start()
+    rss_before = rss_mb()
+
+    intents = members.intents(lean)
+    client = discord.Client(intents=intents, **members.cache_options(lean, max_messages))
+    state = client._connection
+    state.user = discord.ClientUser(state=state, data=user(BOT_ID))
+
+    guild_ids = [10 + i for i in range(guilds)]
+    for guild_id in guild_ids:
+        # Without the members intent Discord only sends the bot's own member
+        state._add_guild_from_data(guild_payload(guild_id, channels, members_per_guild if intents.members else 1))
+
+    sent = 0
+    if intents.guild_messages:
+        for i in range(messages):
+            guild_id = guild_ids[i % guilds]
+            state.parse_message_create(message_payload(10 ** 12 + i, guild_id, guild_id * 1000 + i % channels, guild_id * 10000 + 1 + i % members_per_guild))
+            sent += 1
+
+    gc.collect()
+    heap, peak = tracemalloc.get_traced_memory()
+    return {
+        "mode": "lean" if lean else "default",
+        "rss_mb": round(rss_mb() - rss_before, 2),
+        "heap_mb": round(heap / 2 ** 20, 2),
+        "heap_peak_mb": round(peak / 2 ** 20, 2),
+        "messages_delivered": sent,
+        "cached": {
+            "guilds": len(client.guilds),
+            "members": sum(len(guild.members) for guild in client.guilds),
+            "users": len(client.users),
+            "messages": len(client.cached_messages)
+        }
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare memory of the lean gateway mode with the default one")
+    parser.add_argument("--guilds", type=int, default=200)
+    parser.add_argument("--channels", type=int, default=20, help="Channels per guild")
+    parser.add_argument("--members", type=int, default=1000, help="Members per guild")
+    parser.add_argument("--messages", type=int, default=50000, help="MESSAGE_CREATE events across all guilds")
+    parser.add_argument("--max-messages", type=int, default=0, help="MAX_MESSAGES for lean mode")
+    parser.add_argument("--json", help="Also write the report to this file")
+    parser.add_argument("--child", choices=["lean", "default"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    sizes = [args.guilds, args.channels, args.members, args.messages, args.max_messages]
+    if args.child:
+        print(json.dumps(measure(args.child == "lean", *sizes)))
+        return
+
+    # Separate processes, so one mode's allocations don't leak into the other's RSS
+    report = {}
+    for mode in ["default", "lean"]:
+        output = subprocess.run(
+            [sys.executable, __file__, "--child", mode, "--guilds", str(args.guilds), "--channels", str(args.channels),
+             "--members", str(args.members), "--messages", str(args.messages), "--max-messages", str(args.max_messages)],
+            capture_output=True, text=True, check=True
+        ).stdout
+        report[mode] = json.loads(output.strip().splitlines()[-1])
+    report["saved_mb"] = {
+        "rss": round(report["default"]["rss_mb"] - report["lean"]["rss_mb"], 2),
+        "heap": round(report["default"]["heap_mb"] - report["lean"]["heap_mb"], 2)
+    }
+
+    print(json.dumps(report, indent=2))
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(report, file, indent=2)
+
+if __name__ == "__main__":
+    main()
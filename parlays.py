@@ -0,0 +1,144 @@
+from datetime import datetime
+from pymongo import UpdateOne
+import ledger
+import stats
+
+MIN_LEGS = 2
+MAX_LEGS = 10
+
+def parse_legs(legs_string):
+    """
+    Parse a string of parlay legs into (bet ID, outcome #) pairs.
+
+    Input format: "betID:outcome#, betID:outcome#, ..."
+    Example: "12:1, 15:2, 16:1"
+    """
+    try:
+        legs = []
+        for pair in legs_string.split(','):
+            bet_id, outcome = pair.split(':')
+            legs.append((int(bet_id), int(outcome)))
+    except ValueError:
+        raise ValueError("Legs must look like <bet ID>:<outcome #>, separated by commas")
+
+    if not MIN_LEGS <= len(legs) <= MAX_LEGS:
+        raise ValueError(f"A parlay needs between {MIN_LEGS} and {MAX_LEGS} legs")
+    if len({bet_id for bet_id, _ in legs}) != len(legs):
+        raise ValueError("Each betting line can only appear once in a parlay")
+    return legs
+
+def combined_odds(legs):
+    """Product of the legs' decimal odds, voided legs count as 1"""
+    total = 1
+    for leg in legs:
+        if leg.get("result") != "void":
+            total *= leg["decimal_odds"]
+    return total
+
+def ensure_indexes(parlays_collection):
+    # Leg index: line ID -> parlays that still have that line open
+    parlays_collection.create_index([("guild_id", 1), ("open_legs", 1)])
+    parlays_collection.create_index([("guild_id", 1), ("user_id", 1), ("status", 1)])
+
+def settle_leg(parlays_collection, users_collection, ledger_collection, daily_stats_collection, guild_id, bet_id, winning_outcome=None):
+    """
+    Settle every open parlay with a leg on `bet_id`.
+
+    winning_outcome: the winning outcome # of the line, or None if the line was annulled
+    (the leg is voided and the parlay pays out as if it never had that leg).
+
+    Reads the affected parlays with one query on the leg index and writes all changes
+    with one bulk write per collection. Users are written before parlays and only while
+    the parlay is still in their open "parlays" list, so if we die halfway the next run
+    finds the same parlays again and finishes without paying anyone twice.
+
+    Another job may be settling a different leg of the same parlay at the same time, so a
+    parlay that stays alive is only updated if its open legs are still exactly what we read.
+    Parlays that changed underneath are read again until none is left with this leg open.
+
+    Returns: dictionary with lists of won, lost and still-alive parlays
+    """
+    settled = {}    # parlay ID -> (summary list, parlay)
+    while True:
+        parlays = list(parlays_collection.find({"guild_id": guild_id, "open_legs": bet_id, "status": "open"}))
+        if not parlays:
+            break
+        _settle_parlays(parlays_collection, users_collection, ledger_collection, daily_stats_collection, guild_id, bet_id, winning_outcome, parlays, settled)
+
+    summary = {"won": [], "lost": [], "alive": [], "void": []}
+    for kind, parlay in settled.values():
+        summary[kind].append(parlay)
+    return summary
+
+def _settle_parlays(parlays_collection, users_collection, ledger_collection, daily_stats_collection, guild_id, bet_id, winning_outcome, parlays, settled):
+    now = datetime.now()
+    parlay_ops = []
+    user_ops = []
+    entries = []
+    results = []
+
+    for parlay in parlays:
+        legs = parlay["legs"]
+        leg = next(leg for leg in legs if leg["bet_id"] == bet_id)
+        if winning_outcome is None:
+            leg["result"] = "void"
+        elif leg["outcome_num"] == winning_outcome:
+            leg["result"] = "win"
+        else:
+            leg["result"] = "loss"
+
+        remaining = [open_id for open_id in parlay["open_legs"] if open_id != bet_id]
+        payout = parlay["amount"] * combined_odds(legs)
+        receipt = {
+            "bet": f"Parlay ({len(legs)} legs)",
+            "prediction": " / ".join(leg["outcome"] for leg in legs),
+            "wagered": parlay["amount"],
+            "resolved_at": now
+        }
+
+        update = {
+            "$set": {"legs.$[leg].result": leg["result"], "payout": payout},
+            "$pull": {"open_legs": bet_id}
+        }
+        # A lost leg or the last open leg decides the parlay whatever other legs do
+        match = {"_id": parlay["_id"], "open_legs": bet_id}
+        if leg["result"] == "loss":
+            update["$set"]["status"] = "lost"
+            update["$set"]["resolved_at"] = now
+            user_ops.append(UpdateOne(
+                {"guild_id": guild_id, "user_id": parlay["user_id"], "parlays": parlay["_id"]},
+                {
+                    "$pull": {"parlays": parlay["_id"]},
+                    "$push": {"history": {**receipt, "result": "loss"}}
+                }
+            ))
+            settled[parlay["_id"]] = ("lost", parlay)
+            results.append(stats.result(parlay["user_id"], parlay["amount"], -parlay["amount"], False))
+        elif not remaining:
+            all_void = all(leg["result"] == "void" for leg in legs)
+            update["$set"]["status"] = "void" if all_void else "won"
+            update["$set"]["resolved_at"] = now
+            user_update = {"$inc": {"balance": payout}, "$pull": {"parlays": parlay["_id"]}}
+            if not all_void:
+                user_update["$push"] = {"history": {**receipt, "result": "win", "amount_won": payout - parlay["amount"]}}
+            user_ops.append(UpdateOne({"guild_id": guild_id, "user_id": parlay["user_id"], "parlays": parlay["_id"]}, user_update))
+            entries.append(ledger.entry(
+                guild_id, parlay["user_id"], "parlay_refund" if all_void else "parlay_payout", payout, bet_id,
+                parlay_id=parlay["_id"], key=f"parlay:{parlay['_id']}"
+            ))
+            settled[parlay["_id"]] = ("void" if all_void else "won", {**parlay, "payout": payout})
+            if not all_void:
+                results.append(stats.result(parlay["user_id"], parlay["amount"], payout - parlay["amount"], True))
+        else:
+            # Still alive only if no other leg was settled since we read it
+            match = {"_id": parlay["_id"], "open_legs": parlay["open_legs"], "status": "open"}
+            settled[parlay["_id"]] = ("alive", parlay)
+
+        parlay_ops.append(UpdateOne(match, update, array_filters=[{"leg.bet_id": bet_id}]))
+
+    ledger.record_once(ledger_collection, entries)
+    if user_ops:
+        users_collection.bulk_write(user_ops, ordered=False)
+    if parlay_ops:
+        parlays_collection.bulk_write(parlay_ops, ordered=False)
+    stats.record_results(daily_stats_collection, guild_id, results)
@@ -0,0 +1,184 @@
+import asyncio
+
+# Auto-pricing defaults
+DEFAULT_MARGIN = 0.05       # House overround added on top of the fair line
+DEFAULT_LIQUIDITY = 500     # How much stake the opening line is "worth"
+DEFAULT_DEBOUNCE = 30       # Seconds to collect bets before re-pricing a line
+DEFAULT_MAX_EXPOSURE = 5000 # Most the house can lose on one line, bets past it are turned down
+REPRICE_AT = 0.5            # Share of the exposure cap past which a line re-prices without waiting
+MIN_PROB = 0.01
+MAX_PROB = 0.99
+
+def clamp(shares, low=MIN_PROB, high=MAX_PROB):
+    """
+    Clamp probabilities that add up to 1 into [low, high], keeping the total at 1.
+    What is cut from the clamped outcomes goes to the others in proportion to their share.
+    """
+    fixed = {}
+    while True:
+        free = [i for i in range(len(shares)) if i not in fixed]
+        remaining = 1 - sum(fixed.values())
+        total = sum(shares[i] for i in free)
+        scaled = {i: shares[i] / total * remaining if total else remaining / len(free) for i in free}
+        # Cap the favourites first, their excess may lift the longshots back into range
+        outside = {i: high for i, prob in scaled.items() if prob > high} or {i: low for i, prob in scaled.items() if prob < low}
+        if not outside or len(free) == 1:
+            fixed.update(scaled)
+            return [fixed[i] for i in range(len(shares))]
+        fixed.update(outside)
+
+def proportional(base, handle, margin=DEFAULT_MARGIN, liquidity=DEFAULT_LIQUIDITY):
+    """
+    Price each outcome in proportion to the money staked on it.
+
+    base: opening probabilities, one per outcome
+    handle: total amount wagered, one per outcome
+
+    The opening line counts as `liquidity` worth of stake spread over the outcomes,
+    so the first few bets only nudge the price while lopsided action moves it a lot.
+
+    Fair shares are clamped before the margin goes on, so the posted probabilities
+    always add up to 1 + margin and the favourite never goes past MAX_PROB.
+    Returns: list of probabilities with the margin applied
+    """
+    total_base = sum(base)
+    total_handle = sum(handle)
+    shares = [(liquidity * prob / total_base + staked) / (liquidity + total_handle) for prob, staked in zip(base, handle)]
+    return [share * (1 + margin) for share in clamp(shares, MIN_PROB, MAX_PROB / (1 + margin))]
+
+# Pricing models selectable with PRICING_MODEL
+MODELS = {
+    "proportional": proportional,
+}
+
+def odds_string(outcomes, prices):
+    """
+    Build an "outcome1|prob1, outcome2|prob2" string that gambling.odds can parse
+    """
+    return ", ".join(f"{outcome}|{prob:.3f}" for outcome, prob in zip(outcomes, prices))
+
+def handle_list(bet, count, field="handle"):
+    """Get the per-outcome handle (or payouts) of a bet document as a list"""
+    handle = bet.get(field, {})
+    return [handle.get(str(i), 0) for i in range(count)]
+
+def exposure(handle, payouts, outcome_index=None, amount=0, payout=0):
+    """What the house loses on a line if the outcome worst for it wins, optionally counting one more wager"""
+    payouts = list(payouts)
+    if outcome_index is not None:
+        payouts[outcome_index] += payout
+    return max(payouts) - sum(handle) - amount
+
+def accepts(handle, payouts, outcome_index, amount, payout, max_exposure=DEFAULT_MAX_EXPOSURE):
+    """Whether a wager keeps a line within the exposure cap (bets that reduce exposure always go through)"""
+    after = exposure(handle, payouts, outcome_index, amount, payout)
+    return after <= max(max_exposure, exposure(handle, payouts))
+
+class Repricer:
+    """
+    Keeps the handle of auto-priced lines in memory and re-prices each line
+    at most once per debounce window instead of on every bet.
+
+    Bets within a window are taken at the old price, so the house's worst-case loss on
+    each line is capped: `accepts` turns down bets past `max_exposure`, and a line that
+    gets past REPRICE_AT of the cap is re-priced straight away.
+
+    With several replicas the database holds the line's real handle, so `update` replaces
+    the in-memory copy with it instead of counting one replica's bets with `record`.
+    """
+    def __init__(self, apply, model=proportional, delay=DEFAULT_DEBOUNCE, max_exposure=DEFAULT_MAX_EXPOSURE):
+        self.apply = apply  # async callback(bet_id, odds string)
+        self.model = model
+        self.delay = delay
+        self.max_exposure = max_exposure
+        self.lines = {}     # bet_id -> {"outcomes", "base", "handle", "payouts"}
+        self.pending = {}   # bet_id -> scheduled re-price task
+        self.urgent = set() # bet_ids whose pending re-price doesn't wait for the debounce
+
+    def track(self, bet_id, betting_data, handle=None, payouts=None):
+        """Start auto-pricing a line from its opening odds (output of gambling.odds)"""
+        self.lines[bet_id] = {
+            "outcomes": list(betting_data.keys()),
+            "base": [info["probability"] for info in betting_data.values()],
+            "handle": handle if handle is not None else [0] * len(betting_data),
+            "payouts": payouts if payouts is not None else [0] * len(betting_data)
+        }
+
+    def rebase(self, bet_id, betting_data):
+        """Admin moved the line by hand, use it as the new opening price but keep the handle"""
+        line = self.lines.get(bet_id)
+        if line is None or len(line["handle"]) != len(betting_data):
+            return
+        line["outcomes"] = list(betting_data.keys())
+        line["base"] = [info["probability"] for info in betting_data.values()]
+
+    def forget(self, bet_id):
+        """Stop auto-pricing a line (locked, resolved or closed)"""
+        self.lines.pop(bet_id, None)
+        self.urgent.discard(bet_id)
+        task = self.pending.pop(bet_id, None)
+        if task is not None:
+            task.cancel()
+
+    def exposure(self, bet_id, outcome_index=None, amount=0, payout=0):
+        """exposure() of a tracked line, from the handle this replica knows about"""
+        line = self.lines.get(bet_id)
+        if line is None:
+            return 0
+        return exposure(line["handle"], line["payouts"], outcome_index, amount, payout)
+
+    def accepts(self, bet_id, outcome_index, amount, payout):
+        """accepts() for a tracked line at this repricer's cap"""
+        line = self.lines.get(bet_id)
+        if line is None:
+            return True
+        return accepts(line["handle"], line["payouts"], outcome_index, amount, payout, self.max_exposure)
+
+    def record(self, bet_id, outcome_index, amount, payout=0):
+        """Add a confirmed wager to the line's handle and payouts and schedule a re-price"""
+        line = self.lines.get(bet_id)
+        if line is None:
+            return
+        line["handle"][outcome_index] += amount
+        line["payouts"][outcome_index] += payout
+        self._schedule(bet_id)
+
+    def update(self, bet_id, handle, payouts):
+        """Take the line's handle and payouts as stored in the database and schedule a re-price"""
+        line = self.lines.get(bet_id)
+        if line is None:
+            return
+        line["handle"] = list(handle)
+        line["payouts"] = list(payouts)
+        self._schedule(bet_id)
+
+    def _schedule(self, bet_id):
+        # Lopsided action re-prices now instead of taking more bets at the old price
+        if self.exposure(bet_id) >= self.max_exposure * REPRICE_AT and bet_id not in self.urgent:
+            task = self.pending.pop(bet_id, None)
+            if task is not None:
+                task.cancel()
+            self.urgent.add(bet_id)
+            self.pending[bet_id] = asyncio.create_task(self._reprice_later(bet_id, 0))
+        elif bet_id not in self.pending:
+            self.pending[bet_id] = asyncio.create_task(self._reprice_later(bet_id, self.delay))
+
+    def quote(self, bet_id):
+        """Current model price for a tracked line as an odds string"""
+        line = self.lines[bet_id]
+        return odds_string(line["outcomes"], self.model(line["base"], line["handle"]))
+
+    async def _reprice_later(self, bet_id, delay):
+        try:
+            await asyncio.sleep(delay)
+        finally:
+            if self.pending.get(bet_id) is asyncio.current_task():
+                del self.pending[bet_id]
+                self.urgent.discard(bet_id)
+
+        if bet_id not in self.lines:
+            return
+        try:
+            await self.apply(bet_id, self.quote(bet_id))
+        except Exception as e:
+            print(f"Failed to re-price bet {bet_id}: {e}")
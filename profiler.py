@@ -0,0 +1,129 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+SAMPLE_INTERVAL = 0.01  # Seconds between samples (100 Hz)
+MAX_SECONDS = 300       # Longest profile that can be requested
+LAG_THRESHOLD = 0.1     # Seconds the event loop may be blocked before it gets logged
+HEARTBEAT = 0.05        # How often the loop checks in with the watchdog
+
+def _label(code):
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+def collapse(frame):
+    """One stack in collapsed (flamegraph.pl / speedscope) format, outermost frame first"""
+    labels = []
+    while frame is not None:
+        labels.append(_label(frame.f_code))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+class SamplingProfiler:
+    """
+    Samples the event loop thread's stack from a background thread for a few seconds
+    and writes the counts as collapsed stacks. Sampling only reads frames, so the loop
+    itself runs at full speed; the cost is one stack walk every SAMPLE_INTERVAL.
+    """
+    def __init__(self, thread_id, directory="profiles", interval=SAMPLE_INTERVAL):
+        self.thread_id = thread_id
+        self.directory = directory
+        self.interval = interval
+        self.thread = None
+
+    @property
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self, seconds):
+        """
+        Profile for `seconds` in the background.
+        Returns: path the profile will be written to, or None if one is already running
+        """
+        if self.running:
+            return None
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"profile-{datetime.now().strftime('%Y%m%d-%H%M%S')}.folded")
+        self.thread = threading.Thread(target=self._sample, args=(min(seconds, MAX_SECONDS), path), daemon=True)
+        self.thread.start()
+        return path
+
+    def _sample(self, seconds, path):
+        stacks = Counter()
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                stacks[collapse(frame)] += 1
+            del frame
+            time.sleep(self.interval)
+
+        with open(path, "w") as file:
+            for stack, count in stacks.most_common():
+                file.write(f"{stack} {count}\n")
+        print(f"Wrote {sum(stacks.values())} samples to {path}")
+
+class LoopMonitor:
+    """
+    Logs whenever a callback blocks the event loop for longer than `threshold`.
+
+    A coroutine on the loop records a heartbeat, and a watchdog thread checks it.
+    When the heartbeat is late, the watchdog grabs the loop thread's stack right then,
+    so the log shows the code that is blocking, labelled with the command or job it belongs to.
+    """
+    def __init__(self, threshold=LAG_THRESHOLD, heartbeat=HEARTBEAT):
+        self.threshold = threshold
+        self.heartbeat = heartbeat
+        self.names = {}     # code object -> command or job name
+        self.beat = time.monotonic()
+        self.thread_id = None
+
+    def register(self, func, name):
+        """Label stacks that run through `func` (unwrapping decorators) with `name`"""
+        while hasattr(func, "__wrapped__"):
+            func = func.__wrapped__
+        self.names[func.__code__] = name
+
+    def _owner(self, frame):
+        while frame is not None:
+            name = self.names.get(frame.f_code)
+            if name is not None:
+                return name
+            frame = frame.f_back
+        return None
+
+    async def run(self):
+        """Heartbeat loop, starts the watchdog thread the first time it runs"""
+        self.thread_id = threading.get_ident()
+        threading.Thread(target=self._watch, daemon=True).start()
+        while True:
+            self.beat = time.monotonic()
+            await asyncio.sleep(self.heartbeat)
+
+    def _watch(self):
+        reported = None
+        while True:
+            time.sleep(self.heartbeat)
+            beat = self.beat
+            lag = time.monotonic() - beat - self.heartbeat
+            # Report each stall once, while it is still happening
+            if lag < self.threshold or reported == beat:
+                continue
+            reported = beat
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            owner = self._owner(frame)
+            where = " <- ".join(_label(f.f_code) + f":{f.f_lineno}" for f in _innermost(frame, 4))
+            print(f"Event loop blocked for {lag * 1000:.0f} ms{f' in {owner}' if owner else ''}: {where}")
+            del frame
+
+def _innermost(frame, count):
+    frames = []
+    while frame is not None and len(frames) < count:
+        frames.append(frame)
+        frame = frame.f_back
+    return frames
@@ -0,0 +1,83 @@
+from datetime import datetime
+from pymongo import ReturnDocument
+
+# Reactions on a proposal and the vote each one counts as
+VOTES = {"👍": "up", "👎": "down", "❓": "unclear"}
+SCORE = {"up": 1, "down": -1, "unclear": 0}
+QUEUE_SIZE = 10
+
+def ensure_indexes(proposals_collection):
+    proposals_collection.create_index("message_id", unique=True)
+    proposals_collection.create_index([("guild_id", 1), ("id", 1)], unique=True)
+    # The ranked queue of open proposals
+    proposals_collection.create_index([("guild_id", 1), ("status", 1), ("score", -1), ("created_at", 1)])
+
+def create(proposals_collection, guild_id, user_id, message_id, channel_id, title, description, outcomes):
+    """Store a new proposal with a per-guild ID, like betting lines have"""
+    last = proposals_collection.find_one({"guild_id": guild_id}, {"id": 1}, sort=[("id", -1)])
+    proposal = {
+        "guild_id": guild_id,
+        "id": last["id"] + 1 if last else 1,
+        "user_id": user_id,
+        "message_id": message_id,
+        "channel_id": channel_id,
+        "title": title,
+        "description": description,
+        "outcomes": outcomes,
+        "votes": {vote: 0 for vote in VOTES.values()},
+        "score": 0,
+        "status": "open",
+        "created_at": datetime.now()
+    }
+    proposals_collection.insert_one(proposal)
+    return proposal
+
+def tally(proposals_collection, message_id, emoji, delta):
+    """
+    Count one reaction being added (delta 1) or removed (delta -1).
+    Only the counters are touched, the message itself is never fetched.
+    Returns: True if the reaction was a vote on an open proposal
+    """
+    vote = VOTES.get(emoji)
+    if vote is None:
+        return False
+    result = proposals_collection.update_one(
+        {"message_id": message_id, "status": "open"},
+        {"$inc": {f"votes.{vote}": delta, "score": SCORE[vote] * delta}}
+    )
+    return result.modified_count > 0
+
+def queue(proposals_collection, guild_id, limit=QUEUE_SIZE):
+    """Open proposals, best score first and oldest first among equal scores"""
+    return list(proposals_collection.find({"guild_id": guild_id, "status": "open"}).sort([("score", -1), ("created_at", 1)]).limit(limit))
+
+def promote(proposals_collection, guild_id, proposal_id):
+    """
+    Take an open proposal off the queue. Only one admin can promote it.
+    Returns: the proposal, or None if it doesn't exist or was already promoted
+    """
+    return proposals_collection.find_one_and_update(
+        {"guild_id": guild_id, "id": proposal_id, "status": "open"},
+        {"$set": {"status": "promoted", "promoted_at": datetime.now()}},
+        return_document=ReturnDocument.AFTER
+    )
+
+def outcomes_string(outcomes, probabilities):
+    """
+    Turn a proposal's outcomes and the admin's probabilities into a create_line outcomes string.
+    The probabilities are posted as they are, so they must include the house margin (add up to at least 1).
+    """
+    if len(probabilities) != len(outcomes):
+        raise ValueError(f"Expected {len(outcomes)} probabilities, got {len(probabilities)}")
+    if sum(probabilities) < 1:
+        raise ValueError(f"Probabilities add up to {sum(probabilities):.3f}, they need to add up to at least 1 to include the house margin")
+    # | separates outcome and probability, so it can't appear in a name
+    return ", ".join(f"{outcome.replace('|', '/')}|{probability}" for outcome, probability in zip(outcomes, probabilities))
+
+def link(proposals_collection, proposal, bet_id):
+    """Remember which betting line a promoted proposal became"""
+    proposals_collection.update_one({"_id": proposal["_id"]}, {"$set": {"bet_id": bet_id}})
+
+def reopen(proposals_collection, proposal):
+    """Put a proposal back on the queue if posting its line failed"""
+    proposals_collection.update_one({"_id": proposal["_id"]}, {"$set": {"status": "open"}, "$unset": {"promoted_at": ""}})
@@ -0,0 +1,95 @@
+import asyncio
+import functools
+import math
+import time
+
+DEFAULT_LIMIT = (5, 30)     # 5 uses per 30 seconds per user
+EVICT_AT = 10000            # Sweep idle buckets once the table gets this big
+
+def parse_limits(limits_string):
+    """
+    Parse per-command limits.
+
+    Input format: "command:uses/seconds, command:uses/seconds"
+    Example: "leader:2/30, history:3/30"
+    """
+    limits = {}
+    for pair in filter(None, (pair.strip() for pair in limits_string.split(','))):
+        command, limit = pair.split(':')
+        uses, seconds = limit.split('/')
+        limits[command.strip()] = (int(uses), float(seconds))
+    return limits
+
+class RateLimiter:
+    """
+    Token buckets per (user, command).
+
+    Buckets are stored as [tokens, last update] lists in one dict and refilled lazily
+    when used. Buckets that have refilled completely hold no information, so they are
+    dropped whenever the dict grows past EVICT_AT.
+    """
+    def __init__(self, limits=None, default=DEFAULT_LIMIT):
+        self.limits = limits or {}
+        self.default = default
+        self.buckets = {}
+
+    def _refilled(self, bucket, command, now):
+        uses, seconds = self.limits.get(command, self.default)
+        return min(uses, bucket[0] + (now - bucket[1]) * uses / seconds)
+
+    def allow(self, user_id, command, now=None):
+        """Take a token. Returns 0 if allowed, otherwise seconds until the next token."""
+        now = now if now is not None else time.monotonic()
+        uses, seconds = self.limits.get(command, self.default)
+        key = (user_id, command)
+        bucket = self.buckets.get(key)
+        tokens = uses if bucket is None else self._refilled(bucket, command, now)
+
+        if tokens < 1:
+            self.buckets[key] = [tokens, now]
+            return (1 - tokens) * seconds / uses
+
+        self.buckets[key] = [tokens - 1, now]
+        if len(self.buckets) > EVICT_AT:
+            self.evict(now)
+        return 0
+
+    def evict(self, now=None):
+        now = now if now is not None else time.monotonic()
+        full = [
+            key for key, bucket in self.buckets.items()
+            if self._refilled(bucket, key[1], now) >= self.limits.get(key[1], self.default)[0]
+        ]
+        for key in full:
+            del self.buckets[key]
+
+    def limit(self, concurrency=None):
+        """
+        Decorator for slash command handlers, goes below @client.tree.command.
+
+        concurrency: optional cap on how many calls of this command run at once across all users
+        Throttled users get an ephemeral reply before the handler (and its database queries) runs.
+        """
+        def decorator(func):
+            running = asyncio.Semaphore(concurrency) if concurrency else None
+
+            @functools.wraps(func)
+            async def wrapper(interaction, *args, **kwargs):
+                command = interaction.command.name if interaction.command else func.__name__
+                retry_after = self.allow(interaction.user.id, command)
+                if retry_after:
+                    await interaction.response.send_message(
+                        f"⏳ Slow down! You can use /{command} again in {math.ceil(retry_after)}s",
+                        ephemeral=True
+                    )
+                    return
+
+                if running is None:
+                    return await func(interaction, *args, **kwargs)
+                if running.locked():
+                    await interaction.response.send_message(f"⏳ /{command} is busy right now, try again in a moment", ephemeral=True)
+                    return
+                async with running:
+                    return await func(interaction, *args, **kwargs)
+            return wrapper
+        return decorator
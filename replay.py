@@ -0,0 +1,341 @@
+"""
+Replay a trace recorded with TRACE_DIR through the bot's command handlers.
+
+Usage: python replay.py <trace.jsonl.gz> [--speed 1|max] [--mongo mongodb://localhost:27017]
+                        [--db replay] [--out report.json] [--compare baseline.json]
+
+Runs main.py's handlers against a local mongod (the replay database is dropped first) and
+fake Discord objects, then reports latency and database operations per command. Saving the
+report of one release and passing it as --compare to the next diffs them.
+"""
+import argparse
+import asyncio
+import contextvars
+import itertools
+import json
+import os
+import statistics
+import time
+from collections import Counter, defaultdict
+import discord
+from discord import app_commands
+from pymongo import monitoring
+from pymongo.mongo_client import MongoClient
+import traces
+
+SKIPPED = {"setup", "profile"}  # Would reconfigure the replay or only measure itself
+DRAIN_TIMEOUT = 120             # Seconds to wait for settlement jobs after the last command
+
+current_command = contextvars.ContextVar("current_command", default="background")
+ids = itertools.count(1000)
+
+class OpCounter(monitoring.CommandListener):
+    """Counts database commands per slash command, including ones run through asyncio.to_thread"""
+    def __init__(self):
+        self.counts = Counter()
+
+    def started(self, event):
+        self.counts[current_command.get()] += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+# Stand-ins for the Discord objects the handlers touch
+
+class FakePermissions:
+    def __init__(self, administrator):
+        self.administrator = administrator
+
+class FakeMember:
+    def __init__(self, id, admin=False):
+        self.id = id
+        self.name = self.display_name = f"user-{id}"
+        self.mention = f"<@{id}>"
+        self.guild_permissions = FakePermissions(admin)
+
+class FakeMessage:
+    def __init__(self, channel, embed=None, id=None):
+        self.id = id or next(ids)
+        self.channel = channel
+        self.embeds = [embed] if embed else []
+        channel.messages[self.id] = self
+
+    async def edit(self, embed=None, **kwargs):
+        if embed:
+            self.embeds = [embed]
+
+    async def add_reaction(self, emoji):
+        pass
+
+    async def pin(self):
+        pass
+
+    async def delete(self):
+        self.channel.messages.pop(self.id, None)
+
+class FakeChannel:
+    def __init__(self, id=None):
+        self.id = id or next(ids)
+        self.mention = f"<#{self.id}>"
+        self.messages = {}
+
+    async def send(self, content=None, embed=None, **kwargs):
+        return FakeMessage(self, embed)
+
+    def get_partial_message(self, id):
+        return self.messages.get(id) or FakeMessage(self, id=id)
+
+    async def fetch_message(self, id):
+        return self.messages.get(id) or FakeMessage(self, discord.Embed(), id=id)
+
+class FakeGuild:
+    def __init__(self, id):
+        self.id = id
+
+    def get_member(self, user_id):
+        return None
+
+    async def fetch_member(self, user_id):
+        return FakeMember(user_id)
+
+class FakeResponse:
+    def __init__(self, interaction):
+        self.interaction = interaction
+        self.message = None
+        self.done = False
+
+    async def send_message(self, content=None, embed=None, **kwargs):
+        self.message = FakeMessage(self.interaction.channel, embed)
+        self.done = True
+
+    async def defer(self, **kwargs):
+        self.done = True
+
+    def is_done(self):
+        return self.done
+
+class FakeFollowup:
+    def __init__(self, interaction):
+        self.interaction = interaction
+
+    async def send(self, content=None, embed=None, **kwargs):
+        return FakeMessage(self.interaction.channel, embed)
+
+class FakeInteraction:
+    def __init__(self, record, command, guild, channel):
+        self.id = next(ids)
+        self.user = FakeMember(record["user"], record["admin"])
+        self.guild = guild
+        self.guild_id = guild.id
+        self.channel = channel
+        self.channel_id = channel.id
+        self.command = command
+        self.message = None
+        self.data = {"name": record["command"], "options": record["options"]}
+        self.response = FakeResponse(self)
+        self.followup = FakeFollowup(self)
+
+    async def original_response(self):
+        return self.response.message
+
+class FakePayload:
+    """Bet confirmations are always accepted"""
+    def __init__(self, emoji):
+        self.emoji = emoji
+
+class Replay:
+    def __init__(self, main, commands):
+        self.main = main
+        self.commands = commands
+        self.guilds = {}
+        self.channels = {}
+        self.latencies = defaultdict(list)
+        self.guild_latencies = defaultdict(list)
+        self.production = defaultdict(list)
+        self.errors = Counter()
+        self.skipped = Counter()
+
+    def patch(self, max_speed):
+        """Point the bot at the fakes instead of the gateway"""
+        client = self.main.client
+
+        async def ready():
+            pass
+
+        async def fetch_user(user_id):
+            return FakeMember(user_id)
+
+        async def wait_for(event, timeout=None, check=None):
+            return FakePayload("✅")
+
+        async def publish(guild_id, embeds):
+            pass
+
+        client.wait_until_ready = ready
+        client.fetch_user = fetch_user
+        client.wait_for = wait_for
+        client.get_channel = self.channels.get
+        self.main.odds_board.publish = publish
+        self.main.job_queue.can_claim = lambda: True
+        if max_speed:
+            # Back to back commands from one user would just be throttled
+            self.main.rate_limiter.limits = {}
+            self.main.rate_limiter.default = (10 ** 9, 1)
+
+    def guild(self, guild_id):
+        """Fake guild with its betting and proposals channels configured"""
+        if guild_id not in self.guilds:
+            channels = {role: FakeChannel() for role in ("betting", "proposals", "other")}
+            for channel in channels.values():
+                self.channels[channel.id] = channel
+            self.main.guild_configs.update(guild_id, betting_channel=channels["betting"].id, proposals_channel=channels["proposals"].id)
+            self.guilds[guild_id] = (FakeGuild(guild_id), channels)
+        return self.guilds[guild_id]
+
+    def arguments(self, command, record):
+        params = {param.name: param for param in command.parameters}
+        arguments = {}
+        for option in record["options"]:
+            param = params.get(option["name"])
+            if param is None:
+                continue
+            value = option["value"]
+            if option["type"] == 6:
+                value = FakeMember(value)
+            elif option["type"] == 7:
+                value = self.channels.setdefault(value, FakeChannel(value))
+            elif param.choices:
+                value = app_commands.Choice(name=str(value), value=value)
+            arguments[option["name"]] = value
+        return arguments
+
+    async def run_command(self, record):
+        command = self.main.client.tree.get_command(record["command"])
+        if command is None or record["command"] in SKIPPED:
+            self.skipped[record["command"]] += 1
+            return
+        guild, channels = self.guild(record["guild"])
+        interaction = FakeInteraction(record, command, guild, channels[record["channel"]])
+
+        current_command.set(command.name)
+        started = time.perf_counter()
+        try:
+            await command.callback(interaction, **self.arguments(command, record))
+        except Exception as e:
+            self.errors[command.name] += 1
+            print(f"/{command.name} failed: {type(e).__name__}: {e}")
+        elapsed = (time.perf_counter() - started) * 1000
+        self.latencies[command.name].append(elapsed)
+        self.guild_latencies[record["guild"]].append(elapsed)
+        if "ms" in record:
+            self.production[command.name].append(record["ms"])
+
+    async def run(self, max_speed):
+        self.patch(max_speed)
+        await self.main.client.setup_hook()
+
+        started = time.monotonic()
+        if max_speed:
+            for record in self.commands:
+                await self.run_command(record)
+        else:
+            tasks = []
+            for record in self.commands:
+                await asyncio.sleep(max(0, record["at"] - (time.monotonic() - started)))
+                # Tasks copy the context, so database operations are counted per command
+                tasks.append(asyncio.create_task(self.run_command(record)))
+            await asyncio.gather(*tasks)
+        elapsed = time.monotonic() - started
+
+        await self.drain()
+        self.main.client.chart_pool.shutdown(cancel_futures=True)
+        return elapsed
+
+    async def drain(self):
+        """Wait for the settlement jobs the commands queued"""
+        deadline = time.monotonic() + DRAIN_TIMEOUT
+        while time.monotonic() < deadline:
+            if not self.main.jobs_collection.count_documents({"status": {"$in": ["queued", "running"]}}):
+                return
+            await asyncio.sleep(0.5)
+        print("Gave up waiting for settlement jobs")
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+def report(replay, counter, elapsed):
+    commands = {}
+    for name, latencies in sorted(replay.latencies.items()):
+        commands[name] = {
+            "count": len(latencies),
+            "errors": replay.errors[name],
+            "p50_ms": round(statistics.median(latencies), 2),
+            "p95_ms": round(percentile(latencies, 0.95), 2),
+            "max_ms": round(max(latencies), 2),
+            "db_ops": round(counter.counts[name] / len(latencies), 2),
+            "production_p50_ms": round(statistics.median(replay.production[name]), 2) if replay.production[name] else None
+        }
+    return {
+        "elapsed_s": round(elapsed, 2),
+        "background_db_ops": counter.counts["background"],
+        "skipped": dict(replay.skipped),
+        "commands": commands
+    }
+
+def compare(current, baseline):
+    print(f"{'command':<12} {'p50 ms':>20} {'p95 ms':>20} {'db ops':>16}")
+    for name, now in current["commands"].items():
+        before = baseline["commands"].get(name)
+        if before is None:
+            print(f"{name:<12} (new)")
+            continue
+        columns = []
+        for field, width in (("p50_ms", 20), ("p95_ms", 20), ("db_ops", 16)):
+            change = (now[field] - before[field]) / before[field] * 100 if before[field] else 0
+            columns.append(f"{before[field]:>7} -> {now[field]:<7} {change:+.0f}%".rjust(width))
+        print(f"{name:<12} {' '.join(columns)}")
+
+def load_bot(mongo, db):
+    """
+    Import main.py against a freshly dropped database, counting database operations per command.
+    Returns: (main module, OpCounter)
+    """
+    # main.py reads these at import, and load_dotenv doesn't override them
+    os.environ.update({"uri": mongo, "MONGO_DB": db, "TRACE_DIR": "", "COVID_ID": ""})
+    MongoClient(mongo).drop_database(db)
+    counter = OpCounter()
+    monitoring.register(counter)
+    import main as bot
+    return bot, counter
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a recorded command trace and measure it")
+    parser.add_argument("trace")
+    parser.add_argument("--speed", choices=["1", "max"], default="max", help="1: keep the recorded timing, max: back to back")
+    parser.add_argument("--mongo", default="mongodb://localhost:27017")
+    parser.add_argument("--db", default="replay", help="Database to replay into, dropped first")
+    parser.add_argument("--out", help="Write the report as JSON")
+    parser.add_argument("--compare", help="Report from an earlier release to diff against")
+    args = parser.parse_args()
+    if args.db == "usereconomy":
+        parser.error("refusing to replay into the production database name")
+
+    bot, counter = load_bot(args.mongo, args.db)
+    replay = Replay(bot, traces.read(args.trace))
+    elapsed = asyncio.run(replay.run(args.speed == "max"))
+    result = report(replay, counter, elapsed)
+
+    print(json.dumps(result, indent=2))
+    if args.out:
+        with open(args.out, "w") as file:
+            json.dump(result, file, indent=2)
+    if args.compare:
+        with open(args.compare) as file:
+            compare(result, json.load(file))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+from datetime import datetime
+from pymongo import UpdateOne
+import ledger
+import stats
+
+def _open_wager(user, bet_id):
+    return next((wager for wager in user.get("bets", []) if wager["bet_id"] == bet_id), None)
+
+def resolve_batch(users_collection, ledger_collection, daily_stats_collection, job_id, guild_id, bet_id, winning_outcome, title, user_ids):
+    """
+    Pay out or close the wagers of a batch of participants on a resolved line.
+
+    Safe to run again on the same batch: each user update only matches while the wager
+    is still open, and ledger entries are keyed by the job and user. Users that were
+    already settled by an earlier run are reported from their history receipt.
+
+    Returns: (winners, losers) lists for the results embed
+    """
+    now = datetime.now()
+    winners = []
+    losers = []
+    entries = []
+    user_ops = []
+    results = []
+
+    for user in users_collection.find(
+        {"guild_id": guild_id, "user_id": {"$in": user_ids}},
+        {"user_id": 1, "bets": 1, "history": {"$elemMatch": {"bet_id": bet_id, "bet": title, "result": {"$ne": "cashout"}}}}
+    ):
+        user_id = user["user_id"]
+        wager = _open_wager(user, bet_id)
+        if wager is None:
+            # Settled before a restart, just report it again
+            receipt = (user.get("history") or [None])[0]
+            if receipt is None:
+                continue
+            if receipt["result"] == "win":
+                winners.append({"user_id": user_id, "payout": receipt["wagered"] + receipt["amount_won"], "wagered": receipt["wagered"]})
+            else:
+                losers.append({"user_id": user_id, "wagered": receipt["wagered"]})
+            continue
+
+        receipt = {
+            "bet_id": bet_id,
+            "bet": title,
+            "prediction": wager["outcome"],
+            "wagered": wager["amount"],
+            "resolved_at": now
+        }
+        update = {"$pull": {"bets": {"bet_id": bet_id}}}
+        if wager["outcome_num"] == winning_outcome:
+            receipt["result"] = "win"
+            receipt["amount_won"] = wager["payout"] - wager["amount"]
+            update["$inc"] = {"balance": wager["payout"]}
+            entries.append(ledger.entry(guild_id, user_id, "payout", wager["payout"], bet_id, key=f"{job_id}:{user_id}"))
+            winners.append({"user_id": user_id, "payout": wager["payout"], "wagered": wager["amount"]})
+            results.append(stats.result(user_id, wager["amount"], receipt["amount_won"], True))
+        else:
+            receipt["result"] = "loss"
+            losers.append({"user_id": user_id, "wagered": wager["amount"]})
+            results.append(stats.result(user_id, wager["amount"], -wager["amount"], False))
+        update["$push"] = {"history": receipt}
+        user_ops.append(UpdateOne({"guild_id": guild_id, "user_id": user_id, "bets.bet_id": bet_id}, update))
+
+    # Ledger first: if we die before the balance update, the rerun skips the duplicate entry
+    ledger.record_once(ledger_collection, entries)
+    if user_ops:
+        users_collection.bulk_write(user_ops, ordered=False)
+    # Only wagers settled by this run count towards the leaderboards
+    stats.record_results(daily_stats_collection, guild_id, results)
+    return winners, losers
+
+def refund_batch(users_collection, ledger_collection, job_id, guild_id, bet_id, user_ids):
+    """
+    Refund the wagers of a batch of participants on an annulled line.
+    Safe to run again on the same batch, like resolve_batch.
+    """
+    entries = []
+    user_ops = []
+    for user in users_collection.find({"guild_id": guild_id, "user_id": {"$in": user_ids}}, {"user_id": 1, "bets": 1}):
+        wager = _open_wager(user, bet_id)
+        if wager is None:
+            continue
+        user_id = user["user_id"]
+        entries.append(ledger.entry(guild_id, user_id, "refund", wager["amount"], bet_id, key=f"{job_id}:{user_id}"))
+        user_ops.append(UpdateOne(
+            {"guild_id": guild_id, "user_id": user_id, "bets.bet_id": bet_id},
+            {
+                "$inc": {"balance": wager["amount"]},  # Refund the amount
+                "$pull": {"bets": {"bet_id": bet_id}}  # Remove the bet
+            }
+        ))
+
+    ledger.record_once(ledger_collection, entries)
+    if user_ops:
+        users_collection.bulk_write(user_ops, ordered=False)
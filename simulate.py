@@ -0,0 +1,165 @@
+"""
+Monte Carlo simulation of the economy, for tuning rewards and odds before changing them.
+
+Usage: python simulate.py [--users 100000] [--days 365] [--initial 1000] [--daily-min 1] [--daily-max 100]
+                          [--margin 0.05] [--lines 3] [--herding 20] [--seed 1] [--json report.json]
+
+Every day users claim their daily reward, bet part of their balance on one of the day's lines
+and the lines settle. Lines are priced with gambling.odds (true probabilities plus the house
+margin) exactly like lines posted with /cl, and each user's state is one slot in a NumPy array,
+so 100k users over a year run in seconds. Defaults match main.py and pricing.py.
+"""
+import argparse
+import json
+import time
+import numpy as np
+from gambling import odds
+import pricing
+
+def gini(balances):
+    """0 when everyone holds the same, close to 1 when one user holds everything"""
+    values = np.sort(np.clip(balances, 0, None))
+    total = values.sum()
+    if total == 0:
+        return 0.0
+    ranks = np.arange(1, len(values) + 1)
+    return float((2 * (ranks * values).sum()) / (len(values) * total) - (len(values) + 1) / len(values))
+
+def price_lines(rng, lines, outcomes, margin, concentration):
+    """
+    Draw the true probabilities of each line and post it through gambling.odds.
+    Returns: (true probabilities, posted probabilities, decimal odds), each lines x outcomes
+    """
+    true = rng.dirichlet(np.full(outcomes, concentration), size=lines)
+    # Clamped the same way pricing.proportional clamps auto-priced lines
+    posted = np.array([pricing.clamp(row, pricing.MIN_PROB, pricing.MAX_PROB / (1 + margin)) for row in true]) * (1 + margin)
+    decimal = np.empty_like(true)
+    posted_rounded = np.empty_like(true)
+    for i in range(lines):
+        # Same string format as auto-priced lines, so rounding matches what users would be paid
+        betting_data = odds(pricing.odds_string([f"outcome {j}" for j in range(outcomes)], posted[i]))
+        for j, info in enumerate(betting_data.values()):
+            decimal[i, j] = info["decimal_odds"]
+            posted_rounded[i, j] = info["probability"]
+    return true, posted_rounded, decimal
+
+def pick(rng, cumulative, rows):
+    """Vectorized categorical draw: one index per row of `rows` from cumulative probabilities"""
+    draws = rng.random(len(rows))[:, None]
+    return np.minimum((draws > cumulative[rows]).sum(axis=1), cumulative.shape[1] - 1)
+
+def simulate(users=100000, days=365, initial=1000, daily_min=1, daily_max=100, claim_rate=0.6,
+             bet_rate=0.4, stake_min=0.02, stake_max=0.2, lines=3, outcomes=2, concentration=2.0,
+             margin=pricing.DEFAULT_MARGIN, herding=20.0, gini_every=7, seed=1):
+    rng = np.random.default_rng(seed)
+    balance = np.full(users, float(initial))
+
+    supply = np.empty(days)
+    minted = np.empty(days)
+    house_daily = np.empty(days)
+    house_lines = []
+    gini_days = []
+    gini_values = []
+
+    for day in range(days):
+        # Daily rewards, random.randint(daily_min, daily_max) for everyone who claims
+        claims = rng.random(users) < claim_rate
+        rewards = rng.integers(daily_min, daily_max + 1, claims.sum())
+        balance[claims] += rewards
+        minted[day] = rewards.sum()
+
+        true, posted, decimal = price_lines(rng, lines, outcomes, margin, concentration)
+        winners = pick(rng, np.cumsum(true, axis=1), np.arange(lines))
+
+        # Bettors pick a line, then an outcome. The crowd follows the posted odds on average,
+        # but piles onto one side of each line (lower herding piles on harder)
+        crowd = np.array([rng.dirichlet(row / row.sum() * herding) for row in posted])
+        bettors = np.flatnonzero((rng.random(users) < bet_rate) & (balance >= 1))
+        line = rng.integers(0, lines, len(bettors))
+        outcome = pick(rng, np.cumsum(crowd, axis=1), line)
+        stake = np.floor(balance[bettors] * rng.uniform(stake_min, stake_max, len(bettors)))
+        stake = np.maximum(stake, 1)
+
+        payout = np.where(outcome == winners[line], stake * decimal[line, outcome], 0.0)
+        balance[bettors] += payout - stake
+
+        per_line = np.bincount(line, weights=stake - payout, minlength=lines)
+        house_lines.append(per_line)
+        house_daily[day] = per_line.sum()
+        supply[day] = balance.sum()
+
+        if day % gini_every == 0 or day == days - 1:
+            gini_days.append(day)
+            gini_values.append(gini(balance))
+
+    return {
+        "balance": balance,
+        "supply": supply,
+        "minted": minted,
+        "house_daily": house_daily,
+        "house_lines": np.concatenate(house_lines),
+        "gini_days": gini_days,
+        "gini": gini_values
+    }
+
+def percentiles(values):
+    points = np.percentile(values, [5, 25, 50, 75, 95])
+    return {f"p{p}": round(float(v), 2) for p, v in zip([5, 25, 50, 75, 95], points)}
+
+def summarize(result, users, initial, days):
+    supply = result["supply"]
+    start = users * initial
+    daily_growth = (supply[-1] / start) ** (1 / days) - 1 if start else 0
+    return {
+        "money_supply": {"start": start, "end": round(float(supply[-1]), 2)},
+        "inflation": {
+            "total_pct": round((supply[-1] / start - 1) * 100, 2) if start else None,
+            "daily_pct": round(daily_growth * 100, 4),
+            "minted_by_dailies": round(float(result["minted"].sum()), 2),
+            "taken_by_house": round(float(result["house_daily"].sum()), 2)
+        },
+        "gini": {"start": round(result["gini"][0], 4), "end": round(result["gini"][-1], 4), "max": round(max(result["gini"]), 4)},
+        "house_pnl": {
+            "total": round(float(result["house_daily"].sum()), 2),
+            "per_day": percentiles(result["house_daily"]),
+            "per_line": percentiles(result["house_lines"]),
+            "losing_days_pct": round(float((result["house_daily"] < 0).mean() * 100), 2)
+        },
+        "balances": {**percentiles(result["balance"]), "broke_pct": round(float((result["balance"] < 1).mean() * 100), 2)}
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate the economy for N users over M days")
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--initial", type=float, default=1000, help="INITIAL_BALANCE in main.py")
+    parser.add_argument("--daily-min", type=int, default=1)
+    parser.add_argument("--daily-max", type=int, default=100)
+    parser.add_argument("--claim-rate", type=float, default=0.6, help="Share of users claiming their daily each day")
+    parser.add_argument("--bet-rate", type=float, default=0.4, help="Share of users betting each day")
+    parser.add_argument("--stake-min", type=float, default=0.02, help="Smallest share of balance staked")
+    parser.add_argument("--stake-max", type=float, default=0.2, help="Largest share of balance staked")
+    parser.add_argument("--lines", type=int, default=3, help="Lines open per day")
+    parser.add_argument("--outcomes", type=int, default=2, help="Outcomes per line")
+    parser.add_argument("--margin", type=float, default=pricing.DEFAULT_MARGIN, help="House overround on posted probabilities")
+    parser.add_argument("--herding", type=float, default=20.0, help="How closely the crowd follows the posted odds (lower is more lopsided)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="Also write the report to this file")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    result = simulate(
+        users=args.users, days=args.days, initial=args.initial, daily_min=args.daily_min, daily_max=args.daily_max,
+        claim_rate=args.claim_rate, bet_rate=args.bet_rate, stake_min=args.stake_min, stake_max=args.stake_max,
+        lines=args.lines, outcomes=args.outcomes, margin=args.margin, herding=args.herding, seed=args.seed
+    )
+    report = summarize(result, args.users, args.initial, args.days)
+    report["seconds"] = round(time.perf_counter() - started, 2)
+
+    print(json.dumps(report, indent=2))
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(report, file, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+import heapq
+from datetime import datetime, timedelta
+from pymongo import UpdateOne
+
+# Leaderboard windows in days (None is all time)
+WINDOWS = {"7d": 7, "30d": 30, "all": None}
+METRICS = ["profit", "roi", "win_rate"]
+TOP = 10
+MIN_BETS = 5    # Bets needed to rank on ROI and win rate
+
+def ensure_indexes(daily_stats_collection):
+    daily_stats_collection.create_index([("guild_id", 1), ("user_id", 1), ("day", 1)], unique=True)
+    daily_stats_collection.create_index("day")
+
+def day_of(moment):
+    return datetime(moment.year, moment.month, moment.day)
+
+def result(user_id, wagered, profit, won):
+    """One settled wager (single bet or parlay) for record_results"""
+    return {"user_id": user_id, "wagered": wagered, "profit": profit, "won": won}
+
+def record_results(daily_stats_collection, guild_id, results, at=None):
+    """
+    Add settled wagers to each user's bucket for the day.
+    Buckets hold running totals, so leaderboards never have to read betting history.
+    """
+    if not results:
+        return
+    day = day_of(at or datetime.now())
+
+    # One update per user, even if they settled several wagers at once
+    totals = {}
+    for r in results:
+        total = totals.setdefault(r["user_id"], {"bets": 0, "wins": 0, "wagered": 0, "profit": 0})
+        total["bets"] += 1
+        total["wins"] += 1 if r["won"] else 0
+        total["wagered"] += r["wagered"]
+        total["profit"] += r["profit"]
+
+    daily_stats_collection.bulk_write([
+        UpdateOne({"guild_id": guild_id, "user_id": user_id, "day": day}, {"$inc": total}, upsert=True)
+        for user_id, total in totals.items()
+    ], ordered=False)
+
+def backfill(users_collection, daily_stats_collection):
+    """
+    Build buckets from existing betting history, used once when the collection is empty.
+    Each bucket is set to the totals of the user's whole history for that day, so running
+    it twice (or after it was interrupted) writes the same buckets instead of doubling them.
+    """
+    for user in users_collection.find({"history.0": {"$exists": True}}, {"guild_id": 1, "user_id": 1, "history": 1}):
+        by_day = {}
+        for receipt in user["history"]:
+            won = receipt["result"] == "win"
+            # Cash outs carry their (possibly negative) profit in amount_won
+            profit = -receipt["wagered"] if receipt["result"] == "loss" else receipt.get("amount_won", 0)
+            total = by_day.setdefault(day_of(receipt["resolved_at"]), {"bets": 0, "wins": 0, "wagered": 0, "profit": 0})
+            total["bets"] += 1
+            total["wins"] += 1 if won else 0
+            total["wagered"] += receipt["wagered"]
+            total["profit"] += profit
+        daily_stats_collection.bulk_write([
+            UpdateOne({"guild_id": user["guild_id"], "user_id": user["user_id"], "day": day}, {"$set": total}, upsert=True)
+            for day, total in by_day.items()
+        ], ordered=False)
+
+def _value(metric, row):
+    if metric == "profit":
+        return row["profit"]
+    if row["bets"] < MIN_BETS:
+        return None
+    if metric == "roi":
+        return row["profit"] / row["wagered"] if row["wagered"] else None
+    return row["wins"] / row["bets"]
+
+def refresh_leaderboards(daily_stats_collection, leaderboards_collection, now=None):
+    """
+    Materialize the top users for every guild, window and metric.
+    /leader then reads one small document instead of aggregating anything.
+    """
+    now = now or datetime.now()
+    for window, days in WINDOWS.items():
+        pipeline = []
+        if days is not None:
+            pipeline.append({"$match": {"day": {"$gte": day_of(now) - timedelta(days=days - 1)}}})
+        pipeline.append({"$group": {
+            "_id": {"guild_id": "$guild_id", "user_id": "$user_id"},
+            "bets": {"$sum": "$bets"},
+            "wins": {"$sum": "$wins"},
+            "wagered": {"$sum": "$wagered"},
+            "profit": {"$sum": "$profit"}
+        }})
+
+        # Keep only the top rows per guild and metric while streaming the groups
+        tops = {}
+        for row in daily_stats_collection.aggregate(pipeline, allowDiskUse=True):
+            guild_id = row["_id"]["guild_id"]
+            for metric in METRICS:
+                value = _value(metric, row)
+                if value is None:
+                    continue
+                entry = (value, row["_id"]["user_id"], row["bets"], row["wins"])
+                top = tops.setdefault((guild_id, metric), [])
+                if len(top) < TOP:
+                    heapq.heappush(top, entry)
+                else:
+                    heapq.heappushpop(top, entry)
+
+        for (guild_id, metric), top in tops.items():
+            leaderboards_collection.replace_one(
+                {"_id": f"{guild_id}:{window}:{metric}"},
+                {
+                    "guild_id": guild_id,
+                    "window": window,
+                    "metric": metric,
+                    "rows": [
+                        {"user_id": user_id, "value": value, "bets": bets, "wins": wins}
+                        for value, user_id, bets, wins in sorted(top, reverse=True)
+                    ],
+                    "refreshed_at": now
+                },
+                upsert=True
+            )
+
+        # Guilds with no bets in this window any more
+        leaderboards_collection.delete_many({"window": window, "refreshed_at": {"$lt": now}})
+
+def leaderboard(leaderboards_collection, guild_id, window, metric):
+    return leaderboards_collection.find_one({"_id": f"{guild_id}:{window}:{metric}"})
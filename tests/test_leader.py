@@ -0,0 +1,185 @@
+import asyncio
+import multiprocessing
+import threading
+import time
+from multiprocessing.managers import BaseManager
+from pymongo.errors import DuplicateKeyError, PyMongoError
+import leader
+
+LEASE = 1.0
+HEARTBEAT = 0.25
+TICK = 0.01
+
+class LeaseStore:
+    """
+    The lease collection, living in a manager process shared by the replicas.
+    Updates run there under a local lock, so killing a replica mid-call can't leave it held.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.docs = {}
+        self.partitioned = None     # holder whose calls fail as if the database was unreachable
+        self.samples = []           # (holder, time) for every tick a replica believed it led
+        self.stopped = False
+
+    def find_one_and_update(self, filter, update, upsert):
+        with self.lock:
+            if self.partitioned == update["$set"]["holder"]:
+                return "partitioned", None
+            doc = self.docs.get(filter["_id"])
+            if doc is not None and not any(
+                doc["holder"] == value if key == "holder" else doc[key] < value["$lt"]
+                for clause in filter["$or"] for key, value in clause.items()
+            ):
+                return ("duplicate" if upsert else "ok"), None
+            self.docs[filter["_id"]] = {**(doc or {}), **update["$set"]}
+            return "ok", self.docs[filter["_id"]]
+
+    def delete_one(self, filter):
+        with self.lock:
+            doc = self.docs.get(filter["_id"])
+            if doc is not None and doc["holder"] == filter["holder"]:
+                del self.docs[filter["_id"]]
+
+    def holder(self, name):
+        doc = self.docs.get(name)
+        return doc["holder"] if doc else None
+
+    def partition(self, holder):
+        self.partitioned = holder
+
+    def sample(self, holder, at):
+        self.samples.append((holder, at))
+
+    def get_samples(self):
+        return list(self.samples)
+
+    def stop(self):
+        self.stopped = True
+
+    def is_stopped(self):
+        return self.stopped
+
+class StoreManager(BaseManager):
+    pass
+
+StoreManager.register("LeaseStore", LeaseStore)
+
+class FakeLeases:
+    """The bits of a pymongo collection LeaderLease uses, raising what pymongo would"""
+    def __init__(self, store):
+        self.store = store
+
+    def find_one_and_update(self, filter, update, upsert=False, return_document=None):
+        status, doc = self.store.find_one_and_update(filter, update, upsert)
+        if status == "partitioned":
+            raise PyMongoError("partitioned")
+        if status == "duplicate":
+            raise DuplicateKeyError("E11000 duplicate key error")
+        return doc
+
+    def delete_one(self, filter):
+        self.store.delete_one(filter)
+
+def replica(store):
+    """Runs LeaderLease.run like a bot replica, noting every tick it believes it is the leader"""
+    async def main():
+        lease = leader.LeaderLease(FakeLeases(store), lease=LEASE, heartbeat=HEARTBEAT)
+        heartbeat = asyncio.create_task(lease.run())
+        while not store.is_stopped():
+            if lease.is_leader:
+                store.sample(lease.holder, time.time())
+            await asyncio.sleep(TICK)
+        heartbeat.cancel()
+    asyncio.run(main())
+
+def terms(samples):
+    """Contiguous stretches of leadership: [(holder, start, end)]"""
+    stretches = []
+    last = {}
+    for holder, at in sorted(samples, key=lambda sample: sample[1]):
+        if holder in last and at - last[holder][2] < 5 * TICK:
+            last[holder][2] = at
+        else:
+            last[holder] = [holder, at, at]
+            stretches.append(last[holder])
+    return stretches
+
+def assert_one_leader(stretches):
+    for i, (holder, start, end) in enumerate(stretches):
+        for other, other_start, other_end in stretches[i + 1:]:
+            if other != holder:
+                assert other_start > end or other_end < start, f"{holder} and {other} led at the same time"
+
+def failover(cut):
+    """
+    Start three replicas, let one lead for a while, then `cut(store, leader, processes)` it off.
+    Returns: (leader, time it was cut off, leadership stretches)
+    """
+    context = multiprocessing.get_context("spawn")
+    manager = StoreManager(ctx=context)
+    manager.start()
+    store = manager.LeaseStore()
+    processes = [context.Process(target=replica, args=(store,)) for _ in range(3)]
+    try:
+        for process in processes:
+            process.start()
+        deadline = time.monotonic() + 30
+        while store.holder("scheduler") is None:
+            assert time.monotonic() < deadline, "no replica took the lease"
+            time.sleep(TICK)
+        first = store.holder("scheduler")
+        time.sleep(2 * LEASE)
+
+        cut_at = time.time()
+        cut(store, first, processes)
+        time.sleep(LEASE + 4 * HEARTBEAT)
+        store.stop()
+        for process in processes:
+            process.join(10)
+        return first, cut_at, terms(store.get_samples())
+    finally:
+        for process in processes:
+            process.kill()
+        manager.shutdown()
+
+def assert_takeover(first, cut_at, stretches):
+    assert_one_leader(stretches)
+    successors = [start for holder, start, end in stretches if holder != first and start > cut_at]
+    assert successors, "nobody took over"
+    assert successors[0] - cut_at <= LEASE + HEARTBEAT + 5 * TICK
+
+def test_follower_takes_over_when_leader_dies():
+    def kill(store, holder, processes):
+        pid = int(holder.split(":")[1])
+        next(process for process in processes if process.pid == pid).kill()
+    assert_takeover(*failover(kill))
+
+def test_partitioned_leader_steps_down_before_takeover():
+    # The leader keeps running but can't reach the database any more
+    def partition(store, holder, processes):
+        store.partition(holder)
+    assert_takeover(*failover(partition))
+
+def test_elected_callbacks_run_once_per_election():
+    class Leases:
+        def __init__(self):
+            self.store = LeaseStore()
+
+        def find_one_and_update(self, filter, update, upsert=False, return_document=None):
+            return FakeLeases(self.store).find_one_and_update(filter, update, upsert)
+
+    async def main():
+        lease = leader.LeaderLease(Leases(), lease=LEASE, heartbeat=0.01)
+        elections = []
+
+        @lease.on_elected
+        async def elected():
+            elections.append(time.monotonic())
+
+        heartbeat = asyncio.create_task(lease.run())
+        await asyncio.sleep(0.2)
+        heartbeat.cancel()
+        return elections
+
+    assert len(asyncio.run(main())) == 1
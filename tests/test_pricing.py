@@ -0,0 +1,62 @@
+import asyncio
+import random
+from gambling import odds
+import pricing
+
+def test_clamp_keeps_total_and_bounds():
+    for shares in ([0.999, 0.001], [0.98, 0.015, 0.005], [0.5, 0.5], [1.0, 0.0, 0.0]):
+        clamped = pricing.clamp(shares, 0.01, 0.9)
+        assert abs(sum(clamped) - 1) < 1e-9
+        assert all(0.01 - 1e-12 <= prob <= 0.9 + 1e-12 for prob in clamped)
+
+def test_one_sided_handle_keeps_margin():
+    margin = pricing.DEFAULT_MARGIN
+    for staked in (0, 1000, 10 ** 6, 10 ** 9):
+        prices = pricing.proportional([0.5, 0.5], [staked, 0], margin=margin)
+        assert abs(sum(prices) - (1 + margin)) < 1e-9
+        assert max(prices) <= pricing.MAX_PROB
+        assert min(prices) >= pricing.MIN_PROB
+
+def simulate_line(rng, true, herd, bets, max_exposure, delay):
+    """
+    One auto-priced line: a crowd piling onto outcome `herd` bets at whatever price is posted,
+    while the repricer catches up after `delay`. Returns (worst exposure seen, house profit).
+    """
+    posted = {"odds": odds(pricing.odds_string(["yes", "no"], [0.5 * (1 + pricing.DEFAULT_MARGIN)] * 2))}
+
+    async def apply(bet_id, outcomes):
+        posted["odds"] = odds(outcomes)
+
+    async def run():
+        repricer = pricing.Repricer(apply, delay=delay, max_exposure=max_exposure)
+        repricer.track("line", posted["odds"])
+        worst = 0
+        for _ in range(bets):
+            outcome = herd if rng.random() < 0.9 else 1 - herd
+            amount = rng.randint(10, 500)
+            # Price is read before the confirmation, like /bet, so it can be stale
+            payout = amount * list(posted["odds"].values())[outcome]["decimal_odds"]
+            await asyncio.sleep(0)
+            if repricer.accepts("line", outcome, amount, payout):
+                repricer.record("line", outcome, amount, payout)
+            worst = max(worst, repricer.exposure("line"))
+            await asyncio.sleep(delay / 20)
+        line = repricer.lines["line"]
+        winner = 0 if rng.random() < true else 1
+        repricer.forget("line")
+        return worst, sum(line["handle"]) - line["payouts"][winner]
+
+    return asyncio.run(run())
+
+def test_lopsided_action_stays_within_exposure_cap():
+    rng = random.Random(1)
+    max_exposure = 2000
+    profit = 0
+    for _ in range(40):
+        true = rng.uniform(0.2, 0.8)
+        worst, line_profit = simulate_line(rng, true, rng.randint(0, 1), 200, max_exposure, delay=0.01)
+        assert worst <= max_exposure
+        assert -line_profit <= max_exposure
+        profit += line_profit
+    # The herd bets without regard to the true odds, so the margin should win over many lines
+    assert profit > 0
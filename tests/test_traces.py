@@ -0,0 +1,53 @@
+from types import SimpleNamespace
+import traces
+
+def interaction(id, options, choices=()):
+    parameters = [SimpleNamespace(name=name, choices=["anything"]) for name in choices]
+    return SimpleNamespace(
+        id=id,
+        user=SimpleNamespace(id=1234567890123, guild_permissions=SimpleNamespace(administrator=False)),
+        guild_id=987654321098,
+        command=SimpleNamespace(parameters=parameters),
+        data={"name": "cl", "options": options}
+    )
+
+def test_scrub_hides_words_mentions_and_ids():
+    text = "Will <@123456789012345678> beat <@!42> in <#555>? Call 5551234567"
+    scrubbed = traces.scrub("salt", text)
+    for secret in ("Will", "beat", "Call", "123456789012345678", "5551234567", "<@!42>", "<#555>"):
+        assert secret not in scrubbed
+    assert len(traces.scrub("salt", "yes")) == traces.TOKEN_LENGTH
+    # Mentions get the same pseudonym as the user would as an ID option
+    assert f"<@{traces.pseudonym('salt', 123456789012345678)}>" in scrubbed
+
+def test_scrub_keeps_what_replay_parses():
+    yes, no = traces.token("salt", "yes"), traces.token("salt", "no")
+    assert traces.scrub("salt", "yes|0.55, no|0.5") == f"{yes}|0.55, {no}|0.5"
+    # Outcomes stay distinct, and the same word gets the same token everywhere
+    lakers, celtics = traces.scrub("salt", "Lakers|0.6, Celtics|0.45").split(", ")
+    assert lakers.split("|")[0] != celtics.split("|")[0]
+    assert traces.scrub("salt", "Lakers") == traces.scrub("salt", "Lakers")
+    assert traces.scrub("other", "Lakers") != traces.scrub("salt", "Lakers")
+    assert traces.scrub("salt", "1:2, 3:1") == "1:2, 3:1"
+    assert traces.scrub("salt", "10/20/2026 14:00") == "10/20/2026 14:00"
+
+def test_recorder_writes_no_free_text(tmp_path):
+    path = tmp_path / "trace.jsonl.gz"
+    recorder = traces.Recorder(str(path), salt="salt")
+    recorder.command(interaction(1, [
+        {"name": "title", "type": 3, "value": "Does Alice quit her job?"},
+        {"name": "outcomes", "type": 3, "value": "yes|0.55, no|0.5"},
+        {"name": "period", "type": 3, "value": "30d"},
+        {"name": "user", "type": 6, "value": 42}
+    ], choices=["period"]), "betting")
+    recorder.completed(SimpleNamespace(id=1))
+    recorder.close()
+
+    [record] = traces.read(str(path))
+    values = {option["name"]: option["value"] for option in record["options"]}
+    assert values["title"] == " ".join(traces.token("salt", word) for word in ["Does", "Alice", "quit", "her", "job"]) + "?"
+    assert values["outcomes"] == traces.scrub("salt", "yes|0.55, no|0.5")
+    assert values["period"] == "30d"
+    assert values["user"] == traces.pseudonym("salt", 42)
+    assert record["user"] == traces.pseudonym("salt", 1234567890123)
+    assert "ms" in record
@@ -0,0 +1,133 @@
+import gzip
+import hashlib
+import json
+import os
+import re
+import time
+
+# Option types that hold Discord IDs (user, channel, role, mentionable), hashed like the user
+ID_OPTIONS = {6, 7, 8, 9}
+FLUSH_EVERY = 50    # Lines buffered before the trace is flushed to disk
+MAX_PENDING = 1000  # Commands that failed never complete, forget the oldest past this
+# In free text: mentions, long numbers (raw IDs, phone numbers...) and words
+SENSITIVE = re.compile(r"<(@[!&]?|#)(\d+)>|(\d{7,})|([^\W\d_]+)")
+TOKEN_LENGTH = 8    # Letters per word token, the same for every word so lengths don't leak
+
+def pseudonym(salt, discord_id):
+    """Stable stand-in for a Discord ID, still an int so handlers can use it as one"""
+    digest = hashlib.blake2b(f"{salt}:{discord_id}".encode(), digest_size=7).digest()
+    return int.from_bytes(digest, "big")
+
+def token(salt, word):
+    """Stable stand-in for a word, letters only so it stays a word when the trace is replayed"""
+    value = int.from_bytes(hashlib.blake2b(f"{salt}:{word}".encode(), digest_size=5).digest(), "big")
+    letters = []
+    for _ in range(TOKEN_LENGTH):
+        value, letter = divmod(value, 26)
+        letters.append(chr(ord("a") + letter))
+    return "".join(letters)
+
+def scrub(salt, text):
+    """
+    Free text with mentions and long numbers pseudonymized and every word replaced by its
+    token, so the same word always gets the same token and different words (outcome names)
+    stay different. Digits and punctuation are kept, so odds, bet IDs, parlay legs and dates
+    still parse when the trace is replayed.
+    """
+    def replace(match):
+        prefix, mentioned, number, word = match.groups()
+        if mentioned is not None:
+            return f"<{prefix}{pseudonym(salt, int(mentioned))}>"
+        if number is not None:
+            return str(pseudonym(salt, int(number)))
+        return token(salt, word)
+    return SENSITIVE.sub(replace, text)
+
+def flatten_options(options):
+    """Command options from interaction data, as a list of {name, type, value}"""
+    flat = []
+    for option in options or []:
+        if "options" in option:
+            flat += flatten_options(option["options"])
+        else:
+            flat.append({"name": option["name"], "type": option["type"], "value": option.get("value")})
+    return flat
+
+class Recorder:
+    """
+    Writes incoming slash commands to a gzipped JSON Lines trace for replay.py.
+
+    Each command is written when it arrives ("at": seconds since recording started) and its
+    handler time is written when it completes, matched by sequence number. User, guild and
+    ID options are replaced by salted hashes, free text goes through `scrub`, and channels are
+    recorded by their role in the guild config ("betting", "proposals" or "other") instead of their ID.
+    """
+    def __init__(self, path, salt=None):
+        self.salt = salt or os.urandom(8).hex()
+        self.file = gzip.open(path, "wt", encoding="utf-8")
+        self.started = time.monotonic()
+        self.pending = {}   # interaction ID -> (sequence number, start time)
+        self.sequence = 0
+        self.unflushed = 0
+
+    def _write(self, record):
+        self.file.write(json.dumps(record, separators=(",", ":")) + "\n")
+        self.unflushed += 1
+        if self.unflushed >= FLUSH_EVERY:
+            self.flush()
+
+    def flush(self):
+        self.file.flush()
+        self.unflushed = 0
+
+    def command(self, interaction, channel):
+        now = time.monotonic()
+        self.sequence += 1
+        self.pending[interaction.id] = (self.sequence, now)
+        if len(self.pending) > MAX_PENDING:
+            del self.pending[next(iter(self.pending))]
+
+        options = flatten_options(interaction.data.get("options"))
+        # Values picked from a command's choices aren't free text, replay needs them as they are
+        command = interaction.command
+        choices = {param.name for param in command.parameters if param.choices} if command is not None and hasattr(command, "parameters") else set()
+        for option in options:
+            if option["type"] in ID_OPTIONS:
+                option["value"] = pseudonym(self.salt, option["value"])
+            elif isinstance(option["value"], str) and option["name"] not in choices:
+                option["value"] = scrub(self.salt, option["value"])
+        self._write({
+            "seq": self.sequence,
+            "at": round(now - self.started, 3),
+            "command": interaction.data.get("name"),
+            "options": options,
+            "user": pseudonym(self.salt, interaction.user.id),
+            "guild": pseudonym(self.salt, interaction.guild_id),
+            "channel": channel,
+            "admin": bool(getattr(interaction.user, "guild_permissions", None) and interaction.user.guild_permissions.administrator)
+        })
+
+    def completed(self, interaction):
+        pending = self.pending.pop(interaction.id, None)
+        if pending is None:
+            return
+        sequence, started = pending
+        self._write({"seq": sequence, "ms": round((time.monotonic() - started) * 1000, 2)})
+
+    def close(self):
+        self.file.close()
+
+def read(path):
+    """
+    Load a trace as a list of commands in arrival order.
+    Commands whose handler finished in production carry its time as "ms".
+    """
+    commands = {}
+    with gzip.open(path, "rt", encoding="utf-8") as file:
+        for line in file:
+            record = json.loads(line)
+            if "command" in record:
+                commands[record["seq"]] = record
+            elif record["seq"] in commands:
+                commands[record["seq"]]["ms"] = record["ms"]
+    return sorted(commands.values(), key=lambda command: command["at"])
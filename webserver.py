@@ -1,15 +1,32 @@
-from flask import Flask
+import os
+from flask import Flask, abort, request
 from threading import Thread
 
 app = Flask('')
+
+# Set by the bot once it starts, used by /profile
+profiler = None
+
 @app.route('/')
 def home():
     return "Discord bot ok"
 
+@app.route('/profile')
+def profile():
+    # Only enabled when PROFILE_TOKEN is set, since this port is public
+    token = os.getenv('PROFILE_TOKEN')
+    if not token or request.args.get('token') != token or profiler is None:
+        abort(404)
+    seconds = max(1, min(request.args.get('seconds', 30, type=int), 300))
+    path = profiler.start(seconds)
+    if path is None:
+        return "A profile is already running", 409
+    return f"Profiling for {seconds}s, writing {path}"
+
 
 def run():
     app.run(host="0.0.0.0", port=8080)
 
 def keep_alive():
     t = Thread(target=run)
-    t.start()
\ No newline at end of file
+    t.start()